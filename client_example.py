@@ -39,24 +39,33 @@ def main():
     doc_id = resp.json()["id"]
     print(f"Demande créée, id={doc_id}, status={resp.json()['status']}")
 
-    # Polling simple jusqu'à READY
-    for _ in range(30):
-        r = session.get(f"{args.host}/api/documents/{doc_id}/download/")
-        if r.status_code == 200:
-            payload = r.json()
-            if payload.get("path"):
-                # suppose stockage local accessible via chemin ou URL
-                pdf_resp = session.get(payload["path"])
-                if pdf_resp.status_code == 200 and pdf_resp.headers.get("content-type") == "application/pdf":
-                    with open(args.output, "wb") as f:
-                        f.write(pdf_resp.content)
-                    print(f"PDF téléchargé dans {args.output}")
-                    return
-                else:
-                    # path peut être un chemin local : à adapter selon storage
-                    print(f"URL PDF : {payload['path']} (à récupérer manuellement)")
-                    return
-        time.sleep(2)
+    # Long-polling sur l'endpoint de statuts groupés : la requête est tenue jusqu'au changement de statut (max 25 s)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        r = session.get(f"{args.host}/api/documents/status/", params={"ids": doc_id, "wait": 25}, timeout=35)
+        r.raise_for_status()
+        documents = r.json()["documents"]
+        if not documents:
+            print("Document introuvable.")
+            return
+        state = documents[0]["status"]
+        if state == "FAILED":
+            print("La génération a échoué.")
+            return
+        if state != "READY":
+            continue
+        payload = session.get(documents[0]["download_url"]).json()
+        if payload.get("path"):
+            # suppose stockage local accessible via chemin ou URL
+            pdf_resp = session.get(payload.get("url") or payload["path"])
+            if pdf_resp.status_code == 200 and pdf_resp.headers.get("content-type") == "application/pdf":
+                with open(args.output, "wb") as f:
+                    f.write(pdf_resp.content)
+                print(f"PDF téléchargé dans {args.output}")
+                return
+            # path peut être un chemin local : à adapter selon storage
+            print(f"URL PDF : {payload['path']} (à récupérer manuellement)")
+            return
     print("Timeout avant que le document soit prêt.")
 
 
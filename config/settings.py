@@ -57,6 +57,12 @@ CHANNEL_LAYERS = {
         "BACKEND": "channels.layers.InMemoryChannelLayer",
     }
 }
+# Couche partagée (Redis) nécessaire pour que la progression des lots envoyée par les workers atteigne les WebSockets
+if os.environ.get("CHANNEL_LAYER_REDIS_URL"):
+    CHANNEL_LAYERS["default"] = {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {"hosts": [os.environ["CHANNEL_LAYER_REDIS_URL"]]},
+    }
 
 
 DATABASES = {
@@ -108,13 +114,56 @@ CELERY_TASK_SOFT_TIME_LIMIT = int(os.environ.get("CELERY_TASK_SOFT_TIME_LIMIT",
 CELERY_TASK_TIME_LIMIT = int(os.environ.get("CELERY_TASK_TIME_LIMIT", "75"))
 CELERY_WORKER_MAX_TASKS_PER_CHILD = int(os.environ.get("CELERY_WORKER_MAX_TASKS_PER_CHILD", "100"))
 CELERY_WORKER_CONCURRENCY = int(os.environ.get("CELERY_WORKER_CONCURRENCY", "7"))
+MULTI_COMPILE_TIME_LIMIT = int(os.environ.get("MULTI_COMPILE_TIME_LIMIT", "600"))  # tâche generate_documents_bulk
 PURGE_EXPIRED_EVERY_SECONDS = int(os.environ.get("PURGE_EXPIRED_EVERY_SECONDS", "3700"))  # 0 = désactivé
 PURGE_EXPIRED_HOURS = int(os.environ.get("PURGE_EXPIRED_HOURS", "1"))  # seuil d'âge pour purge auto
+# Régénération nocturne des documents périmés (crontab à 5 champs : minute heure jour mois jour-semaine ; vide = désactivé)
+REGENERATE_STALE_CRON = os.environ.get("REGENERATE_STALE_CRON", "0 2 * * *").strip()
 
 XELATEX_BIN = os.environ.get("XELATEX_BIN", "xelatex")
 LATEX_LOG_DIR = Path(os.environ.get("LATEX_LOG_DIR", "")) if os.environ.get("LATEX_LOG_DIR") else None
+# Archivage des logs : échecs toujours gardés, succès échantillonnés ; segments gzip roulants
+LATEX_LOG_SAMPLE_RATE = float(os.environ.get("LATEX_LOG_SAMPLE_RATE", "0.05"))
+LATEX_LOG_SEGMENT_BYTES = int(os.environ.get("LATEX_LOG_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+LATEX_LOG_SEGMENT_SECONDS = int(os.environ.get("LATEX_LOG_SEGMENT_SECONDS", "3600"))
 LATEX_TMP_DIR = os.environ.get("LATEX_TMP_DIR") or None
-LATEX_DEFAULT_PASSES = int(os.environ.get("LATEX_DEFAULT_PASSES", "2"))
+# Pool de répertoires de travail LaTeX réutilisés (tmpfs : LATEX_WORKDIR_DIR, sinon LATEX_TMP_DIR / /dev/shm si en mémoire)
+LATEX_WORKDIR_POOL = os.environ.get("LATEX_WORKDIR_POOL", "1") == "1"
+LATEX_WORKDIR_DIR = os.environ.get("LATEX_WORKDIR_DIR") or None
+LATEX_WORKDIR_POOL_SIZE = int(os.environ.get("LATEX_WORKDIR_POOL_SIZE", "4"))
+LATEX_WORKDIR_MAX_BYTES = int(os.environ.get("LATEX_WORKDIR_MAX_BYTES", str(256 * 1024 * 1024)))
+LATEX_DEFAULT_PASSES = int(os.environ.get("LATEX_DEFAULT_PASSES", "2"))  # passes fixes si LATEX_CONVERGENCE=0
+# Passes pilotées par convergence (.aux / demande de rerun dans le .log), bornées par LATEX_MAX_PASSES
+LATEX_CONVERGENCE = os.environ.get("LATEX_CONVERGENCE", "1") == "1"
+LATEX_MAX_PASSES = int(os.environ.get("LATEX_MAX_PASSES", "3"))
+# Caches LaTeX partagés par les workers d'un même nœud (formats précompilés, etc.)
+LATEX_CACHE_DIR = Path(os.environ.get("LATEX_CACHE_DIR", BASE_DIR / "var" / "latex_cache"))
+LATEX_FORMAT_CACHE = os.environ.get("LATEX_FORMAT_CACHE", "1") == "1"
+# Durée (s) pendant laquelle un format en échec est ignoré avant d'être retenté
+LATEX_FORMAT_FAILED_TTL = int(os.environ.get("LATEX_FORMAT_FAILED_TTL", "3600"))
+# Pipeline d'assets : logos réduits à la largeur max utilisée par les templates, à cette résolution
+LATEX_ASSET_DPI = int(os.environ.get("LATEX_ASSET_DPI", "300"))
+LATEX_LOGO_WIDTH_CM = float(os.environ.get("LATEX_LOGO_WIDTH_CM", "3.5"))
+# Cache des PDF compilés, adressé par le .tex final + empreintes des assets (LRU borné en octets)
+LATEX_PDF_CACHE = os.environ.get("LATEX_PDF_CACHE", "1") == "1"
+LATEX_PDF_CACHE_MAX_BYTES = int(os.environ.get("LATEX_PDF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Tableaux d'honneur groupés : fond statique compilé une fois (cache PDF) + overlay du texte propre à l'élève
+LATEX_HONOR_OVERLAY = os.environ.get("LATEX_HONOR_OVERLAY", "1") == "1"
+# Nombre de requêtes SQL au-delà duquel build_context est signalé (warning) ; 0 pour désactiver
+LATEX_QUERY_BUDGET = int(os.environ.get("LATEX_QUERY_BUDGET", "10"))
+# Compilations simultanées dans les processus web du nœud (stream, mode eager) ; 0 pour ne pas limiter.
+# Au-delà, LATEX_COMPILE_QUEUE_MAX requêtes attendent au plus LATEX_COMPILE_QUEUE_TIMEOUT s (sinon 503),
+# les suivantes sont refusées aussitôt (429) ; les deux réponses portent Retry-After
+LATEX_COMPILE_SLOTS = int(os.environ.get("LATEX_COMPILE_SLOTS", str(os.cpu_count() or 2)))
+LATEX_COMPILE_QUEUE_MAX = int(os.environ.get("LATEX_COMPILE_QUEUE_MAX", "16"))
+LATEX_COMPILE_QUEUE_TIMEOUT = float(os.environ.get("LATEX_COMPILE_QUEUE_TIMEOUT", "10"))
+LATEX_COMPILE_RETRY_AFTER = int(os.environ.get("LATEX_COMPILE_RETRY_AFTER", "5"))
+LATEX_COMPILE_SLOT_DIR = Path(os.environ.get("LATEX_COMPILE_SLOT_DIR", LATEX_CACHE_DIR / "compile_slots"))
+# Requêtes stream identiques simultanées (même élève / trimestre / type) servies par une seule compilation ;
+# avec LATEX_SINGLE_FLIGHT_REDIS, aussi entre processus (lock Redis + remise du PDF)
+LATEX_SINGLE_FLIGHT = os.environ.get("LATEX_SINGLE_FLIGHT", "1") == "1"
+LATEX_SINGLE_FLIGHT_REDIS = os.environ.get("LATEX_SINGLE_FLIGHT_REDIS", "0") == "1"
+LATEX_SINGLE_FLIGHT_TIMEOUT = float(os.environ.get("LATEX_SINGLE_FLIGHT_TIMEOUT", "60"))
 
 LATEX_TEMPLATES = {
     "BULLETIN": BASE_DIR / "templates_latex" / "bulletin.tex",
@@ -125,11 +174,26 @@ LATEX_THEME_FILES = {
     "BULLETIN": Path(os.environ.get("BULLETIN_THEME_FILE", BASE_DIR / "config/themes/bulletin_theme.json")),
     "HONOR": Path(os.environ.get("HONOR_THEME_FILE", BASE_DIR / "config/themes/honor_theme.json")),
 }
+# Thèmes propres à une école : <dossier>/<id école>.json (clés communes et/ou sections "BULLETIN"/"HONOR")
+LATEX_SCHOOL_THEME_DIR = Path(os.environ.get("LATEX_SCHOOL_THEME_DIR", BASE_DIR / "config/themes/schools"))
+# Rechargement des thèmes diffusé à tous les workers via Redis pub/sub (commande reload_themes)
+LATEX_THEME_PUBSUB = os.environ.get("LATEX_THEME_PUBSUB", "0") == "1"
+# Seuils du tableau d'honneur appliqués par recompute_results --honor (rang max vide = sans limite)
+HONOR_BOARD_MIN_AVERAGE = float(os.environ.get("HONOR_BOARD_MIN_AVERAGE", "14"))
+HONOR_BOARD_MAX_RANK = int(os.environ["HONOR_BOARD_MAX_RANK"]) if os.environ.get("HONOR_BOARD_MAX_RANK") else None
 
 DOCUMENT_STORAGE = os.environ.get("DOCUMENT_STORAGE", "local")  # local or s3
 DOCUMENT_BASE_URL = os.environ.get("DOCUMENT_BASE_URL", "http://localhost:8000/media/documents/")
 DOCUMENT_STORAGE_PATH = Path(os.environ.get("DOCUMENT_STORAGE_PATH", MEDIA_ROOT / "documents"))
 DOCUMENT_TTL_SECONDS = int(os.environ.get("DOCUMENT_TTL_SECONDS", "900"))  # défaut 30 min
+# Création de lot : tâches envoyées au broker par groupes de N après le commit
+DOCUMENT_ENQUEUE_CHUNK = int(os.environ.get("DOCUMENT_ENQUEUE_CHUNK", "500"))
+# Archive ZIP du lot écrite sur disque au fil des documents prêts (sinon ZIP généré à la volée au téléchargement)
+BATCH_ZIP_PERSIST = os.environ.get("BATCH_ZIP_PERSIST", "0") == "1"
+# GET /api/documents/status/ : nombre max d'ids, attente max (long-polling) et relecture sans Redis
+DOCUMENT_STATUS_MAX_IDS = int(os.environ.get("DOCUMENT_STATUS_MAX_IDS", "500"))
+DOCUMENT_STATUS_MAX_WAIT = float(os.environ.get("DOCUMENT_STATUS_MAX_WAIT", "30"))
+DOCUMENT_STATUS_POLL_INTERVAL = float(os.environ.get("DOCUMENT_STATUS_POLL_INTERVAL", "1"))
 
 AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
@@ -137,7 +201,7 @@ AWS_STORAGE_BUCKET_NAME = os.environ.get("AWS_STORAGE_BUCKET_NAME")
 AWS_S3_ENDPOINT_URL = os.environ.get("AWS_S3_ENDPOINT_URL")
 AWS_REGION = os.environ.get("AWS_REGION")
 
-# Planification Celery Beat (optionnelle) pour purger les fichiers expirés
+# Planification Celery Beat (optionnelle) : purge des fichiers expirés, régénération nocturne des documents périmés
 CELERY_BEAT_SCHEDULE = {}
 if PURGE_EXPIRED_EVERY_SECONDS > 0:
     CELERY_BEAT_SCHEDULE["purge-expired-docs"] = {
@@ -145,3 +209,17 @@ if PURGE_EXPIRED_EVERY_SECONDS > 0:
         "schedule": PURGE_EXPIRED_EVERY_SECONDS,
         "args": (PURGE_EXPIRED_HOURS,),
     }
+if REGENERATE_STALE_CRON:
+    from celery.schedules import crontab
+
+    _minute, _hour, _day_of_month, _month_of_year, _day_of_week = REGENERATE_STALE_CRON.split()
+    CELERY_BEAT_SCHEDULE["regenerate-stale-docs"] = {
+        "task": "documents.tasks.regenerate_stale_documents",
+        "schedule": crontab(
+            minute=_minute,
+            hour=_hour,
+            day_of_month=_day_of_month,
+            month_of_year=_month_of_year,
+            day_of_week=_day_of_week,
+        ),
+    }
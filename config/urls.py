@@ -2,18 +2,21 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, re_path
-from django.views.static import serve
 
 from documents.api import (
     GenerateBulletinView,
     GenerateHonorView,
     DownloadDocumentView,
+    DocumentStatusView,
     ResetMetricsView,
     StreamBulletinView,
     StreamHonorView,
+    AsyncStreamBulletinView,
+    AsyncStreamHonorView,
     CreateBatchView,
     BatchStatusView,
     BatchDownloadView,
+    serve_media,
 )
 
 
@@ -23,15 +26,20 @@ urlpatterns = [
     path("api/documents/honor-board/", GenerateHonorView.as_view(), name="generate-honor"),
     path("api/documents/bulletin/stream/", StreamBulletinView.as_view(), name="stream-bulletin"),
     path("api/documents/honor-board/stream/", StreamHonorView.as_view(), name="stream-honor"),
+    # Variantes async (ASGI/daphne) : la compilation n'occupe pas de thread
+    path("api/documents/bulletin/stream-async/", AsyncStreamBulletinView.as_view(), name="stream-bulletin-async"),
+    path("api/documents/honor-board/stream-async/", AsyncStreamHonorView.as_view(), name="stream-honor-async"),
     path("api/documents/<int:pk>/download/", DownloadDocumentView.as_view(), name="download-document"),
+    # Statuts groupés + long-polling (?ids=1,2,3&wait=25)
+    path("api/documents/status/", DocumentStatusView.as_view(), name="documents-status"),
     path("api/batches/", CreateBatchView.as_view(), name="create-batch"),
     path("api/batches/<int:pk>/", BatchStatusView.as_view(), name="batch-status"),
     path("api/batches/<int:pk>/download/", BatchDownloadView.as_view(), name="batch-download"),
     path("api/metrics/reset/", ResetMetricsView.as_view(), name="reset-metrics"),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+] + static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
 
 # Ensure media files are served even if DEBUG is False during local dev.
 if not settings.DEBUG and settings.MEDIA_URL and settings.MEDIA_ROOT:
     urlpatterns += [
-        re_path(r"^%s(?P<path>.*)$" % settings.MEDIA_URL.lstrip("/"), serve, {"document_root": settings.MEDIA_ROOT}),
+        re_path(r"^%s(?P<path>.*)$" % settings.MEDIA_URL.lstrip("/"), serve_media, {"document_root": settings.MEDIA_ROOT}),
     ]
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Document
+from .models import Document, DocumentSnapshot
 
 
 @admin.register(Document)
@@ -8,3 +8,9 @@ class DocumentAdmin(admin.ModelAdmin):
     list_display = ("id", "student", "doc_type", "term", "status", "created_at")
     list_filter = ("doc_type", "term", "status")
     search_fields = ("student__first_name", "student__last_name", "student__matricule")
+
+
+@admin.register(DocumentSnapshot)
+class DocumentSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("document", "version", "digest", "updated_at")
+    readonly_fields = ("document", "version", "digest", "template_digest", "context", "created_at", "updated_at")
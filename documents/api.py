@@ -1,22 +1,37 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.db import transaction
 from django.shortcuts import get_object_or_404
-from rest_framework import serializers, status
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, serializers, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from django.http import StreamingHttpResponse, HttpResponse, FileResponse
+from django.http import Http404, StreamingHttpResponse, HttpResponse, JsonResponse
+from django.views.decorators.http import require_safe
 from django.utils import timezone
 
 from documents.models import Document, Batch
 from documents.tasks import generate_document, purge_document_file, purge_batch_zip
-from documents.services.metrics import mark_pending, mark_failed
+from documents.services.metrics import mark_pending, mark_pending_many, mark_failed
 from documents.services.builder import build_context
+from documents.services.compile_slots import CompileSlotUnavailable, acompile_slot, compile_slot
+from documents.services.batch_progress import progress_of
+from documents.services.batch_zip import batch_members, iter_batch_zip, zip_etag, zip_length
+from documents.services.enqueue import enqueue_on_commit
+from documents.services.http_files import file_response, media_file, stream_response
+from documents.services.profiling import DocumentProfile
+from documents.services import status_watch
+from documents.services.single_flight import flight_key, single_flight
 from documents.services.latex_renderer import LatexRenderer
 from schools.models import Student, TermResult
 from django.conf import settings
 from documents.services.metrics import reset_metrics
 from pathlib import Path
-import zipfile
 import os
 import threading
 import logging
@@ -61,6 +76,13 @@ def _schedule_local_purge(path: str, ttl_seconds: int):
         threading.Timer(ttl_seconds, _delete).start()
 
 
+def _slot_unavailable(exc: CompileSlotUnavailable, response_class=Response):
+    """429/503 with Retry-After when no compile slot is available on this node."""
+    response = response_class({"detail": exc.detail}, status=exc.status)
+    response["Retry-After"] = str(exc.retry_after)
+    return response
+
+
 class DocumentRequestSerializer(serializers.Serializer):
     student_id = serializers.IntegerField(required=True)
     term = serializers.ChoiceField(choices=[c[0] for c in TermResult.TERM_CHOICES])
@@ -121,11 +143,16 @@ class GenerateBulletinView(APIView):
 
         try:
             if getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False):
-                res = generate_document.apply(args=[doc.id])
+                # compilation dans le processus web : bornée par les slots du nœud
+                with compile_slot():
+                    res = generate_document.apply(args=[doc.id])
                 pdf_url = res.get()
                 return Response({"id": doc.id, "status": "READY", "pdf_url": pdf_url}, status=status.HTTP_200_OK)
             if enqueue:
                 generate_document.delay(doc.id)
+        except CompileSlotUnavailable as exc:
+            # le document reste PENDING : une nouvelle demande relance la compilation
+            return _slot_unavailable(exc)
         except Exception as exc:
             doc.status = "FAILED"
             doc.completed_at = timezone.now()
@@ -189,11 +216,16 @@ class GenerateHonorView(APIView):
 
         try:
             if getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False):
-                res = generate_document.apply(args=[doc.id])
+                # compilation dans le processus web : bornée par les slots du nœud
+                with compile_slot():
+                    res = generate_document.apply(args=[doc.id])
                 pdf_url = res.get()
                 return Response({"id": doc.id, "status": "READY", "pdf_url": pdf_url}, status=status.HTTP_200_OK)
             if enqueue:
                 generate_document.delay(doc.id)
+        except CompileSlotUnavailable as exc:
+            # le document reste PENDING : une nouvelle demande relance la compilation
+            return _slot_unavailable(exc)
         except Exception as exc:
             doc.status = "FAILED"
             doc.completed_at = timezone.now()
@@ -237,6 +269,31 @@ class ResetMetricsView(APIView):
         return Response({"detail": "Métriques réinitialisées"}, status=status.HTTP_200_OK)
 
 
+def _compile_stream(doc_type: str, student, term: str) -> bytes:
+    profile = DocumentProfile(doc_type, student_id=student.id, stream=True)
+    with profile.stage("build_context", queries=True):
+        context = build_context(Document(student=student, term=term, doc_type=doc_type))
+    renderer = LatexRenderer(Path(settings.LATEX_TEMPLATES[doc_type]), context)
+    with compile_slot():
+        pdf_bytes = renderer.generate()
+    profile.add_renderer(renderer)
+    profile.finish()
+    return pdf_bytes
+
+
+def _stream_pdf(doc_type: str, student, term: str, filename: str):
+    """Compiles and returns the PDF; identical concurrent requests share one compile (single flight)."""
+    try:
+        pdf_bytes = single_flight.do(
+            flight_key(doc_type, student.id, term), lambda: _compile_stream(doc_type, student, term)
+        )
+    except CompileSlotUnavailable as exc:
+        return _slot_unavailable(exc)
+    response = HttpResponse(pdf_bytes, content_type="application/pdf")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 class StreamBulletinView(APIView):
     """
     Génération éphémère : compile et stream le PDF sans le stocker ni créer de Document.
@@ -253,14 +310,7 @@ class StreamBulletinView(APIView):
         if not term_result:
             return Response({"detail": "TermResult manquant pour cet élève/terme."}, status=status.HTTP_400_BAD_REQUEST)
 
-        context = build_context(Document(student=student, term=term, doc_type="BULLETIN"))
-        template = settings.LATEX_TEMPLATES["BULLETIN"]
-        renderer = LatexRenderer(Path(template), context)
-        pdf_bytes = renderer.generate()
-        response = HttpResponse(pdf_bytes, content_type="application/pdf")
-        filename = f"bulletin_{student_id}_{term}.pdf"
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-        return response
+        return _stream_pdf("BULLETIN", student, term, f"bulletin_{student_id}_{term}.pdf")
 
 
 class StreamHonorView(APIView):
@@ -279,16 +329,180 @@ class StreamHonorView(APIView):
         if not term_result:
             return Response({"detail": "TermResult manquant pour cet élève/terme."}, status=status.HTTP_400_BAD_REQUEST)
 
-        context = build_context(Document(student=student, term=term, doc_type="HONOR"))
-        template = settings.LATEX_TEMPLATES["HONOR"]
-        renderer = LatexRenderer(Path(template), context)
-        pdf_bytes = renderer.generate()
+        return _stream_pdf("HONOR", student, term, f"honor_{student_id}_{term}.pdf")
+
+
+def _authenticate(request):
+    """DRF authentication for the plain (async) Django views: (drf_request, error response or None)."""
+    drf_request = Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    try:
+        if not (drf_request.user and drf_request.user.is_authenticated):
+            return drf_request, JsonResponse({"detail": "Authentification requise."}, status=status.HTTP_401_UNAUTHORIZED)
+    except exceptions.AuthenticationFailed as exc:
+        return drf_request, JsonResponse({"detail": str(exc.detail)}, status=exc.status_code)
+    return drf_request, None
+
+
+class AsyncStreamView(View):
+    """
+    Async variant of the stream endpoints for ASGI (daphne): the compile runs as an asyncio subprocess,
+    so a pending stream does not hold a worker thread, and it is killed once every client waiting for it
+    has disconnected. Authentication, validation and context building reuse the DRF settings, in a thread.
+    """
+
+    doc_type = None
+    filename_prefix = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Comme APIView : authentification Basic, pas de CSRF
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def _prepare(self, request):
+        drf_request, error = _authenticate(request)
+        if error is not None:
+            return error
+        try:
+            serializer = DocumentRequestSerializer(data=drf_request.data)
+        except exceptions.ParseError as exc:
+            return JsonResponse({"detail": str(exc.detail)}, status=exc.status_code)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        student_id = serializer.validated_data["student_id"]
+        term = serializer.validated_data["term"]
+        student = Student.objects.filter(pk=student_id).select_related("klass__school").first()
+        if not student:
+            return JsonResponse({"detail": "Élève introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        if not TermResult.objects.filter(student=student, term=term).exists():
+            return JsonResponse(
+                {"detail": "TermResult manquant pour cet élève/terme."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return student, term, f"{self.filename_prefix}_{student_id}_{term}.pdf"
+
+    def _build_context(self, student, term, profile):
+        with profile.stage("build_context", queries=True):
+            return build_context(Document(student=student, term=term, doc_type=self.doc_type))
+
+    async def _compile(self, student, term) -> bytes:
+        profile = DocumentProfile(self.doc_type, student_id=student.id, stream=True)
+        context = await sync_to_async(self._build_context)(student, term, profile)
+        renderer = LatexRenderer(Path(settings.LATEX_TEMPLATES[self.doc_type]), context)
+        async with acompile_slot():
+            pdf_bytes = await renderer.agenerate()
+        profile.add_renderer(renderer)
+        await sync_to_async(profile.finish)()
+        return pdf_bytes
+
+    async def post(self, request):
+        prepared = await sync_to_async(self._prepare)(request)
+        if isinstance(prepared, HttpResponse):
+            return prepared
+        student, term, filename = prepared
+        try:
+            # requêtes identiques simultanées (rafraîchissements) : une seule compilation partagée
+            pdf_bytes = await single_flight.ado(
+                flight_key(self.doc_type, student.id, term), lambda: self._compile(student, term)
+            )
+        except CompileSlotUnavailable as exc:
+            return _slot_unavailable(exc, JsonResponse)
         response = HttpResponse(pdf_bytes, content_type="application/pdf")
-        filename = f"honor_{student_id}_{term}.pdf"
         response["Content-Disposition"] = f'attachment; filename="{filename}"'
         return response
 
 
+class AsyncStreamBulletinView(AsyncStreamView):
+    doc_type = "BULLETIN"
+    filename_prefix = "bulletin"
+
+
+class AsyncStreamHonorView(AsyncStreamView):
+    doc_type = "HONOR"
+    filename_prefix = "honor"
+
+
+class DocumentStatusView(View):
+    """
+    Statuses of many documents in one primary-key query: GET /api/documents/status/?ids=1,2,3&wait=25.
+    With `wait` (seconds), the request is held while every listed document is still PENDING, until a worker
+    publishes a status change (Redis pub/sub, see services.status_watch) or the wait expires; without Redis
+    the database is re-read every DOCUMENT_STATUS_POLL_INTERVAL seconds instead.
+    """
+
+    def _parse(self, request):
+        _, error = _authenticate(request)
+        if error is not None:
+            return error
+        raw = ",".join(request.GET.getlist("ids"))
+        try:
+            ids = list(dict.fromkeys(int(value) for value in raw.split(",") if value.strip()))
+            wait = float(request.GET.get("wait", 0) or 0)
+        except ValueError:
+            return JsonResponse({"detail": "Paramètres ids/wait invalides."}, status=status.HTTP_400_BAD_REQUEST)
+        max_ids = int(getattr(settings, "DOCUMENT_STATUS_MAX_IDS", 500))
+        if not ids or len(ids) > max_ids:
+            return JsonResponse(
+                {"detail": f"Entre 1 et {max_ids} identifiants attendus (ids=1,2,3)."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        wait = min(max(wait, 0), float(getattr(settings, "DOCUMENT_STATUS_MAX_WAIT", 30)))
+        return ids, wait
+
+    @staticmethod
+    def _statuses(ids):
+        return list(Document.objects.filter(id__in=ids).values("id", "status", "completed_at"))
+
+    @staticmethod
+    def _all_pending(rows) -> bool:
+        return bool(rows) and all(row["status"] == "PENDING" for row in rows)
+
+    async def get(self, request):
+        parsed = await sync_to_async(self._parse)(request)
+        if isinstance(parsed, HttpResponse):
+            return parsed
+        ids, wait = parsed
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        # inscription avant la lecture : une notification arrivée entre les deux n'est pas perdue
+        handle = status_watch.watch(ids) if wait else None
+        try:
+            rows = await sync_to_async(self._statuses)(ids)
+            while wait and self._all_pending(rows):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                if handle is not None:
+                    if not await handle.wait(remaining):
+                        break
+                    status_watch.unwatch(handle)
+                    handle = status_watch.watch(ids)
+                else:
+                    await asyncio.sleep(min(float(getattr(settings, "DOCUMENT_STATUS_POLL_INTERVAL", 1)), remaining))
+                rows = await sync_to_async(self._statuses)(ids)
+        finally:
+            status_watch.unwatch(handle)
+
+        by_id = {row["id"]: row for row in rows}
+        documents = []
+        for doc_id in ids:
+            row = by_id.get(doc_id)
+            if row is None:
+                continue
+            documents.append(
+                {
+                    "id": doc_id,
+                    "status": row["status"],
+                    "completed_at": row["completed_at"].isoformat() if row["completed_at"] else None,
+                    "download_url": request.build_absolute_uri(f"/api/documents/{doc_id}/download/")
+                    if row["status"] == "READY"
+                    else None,
+                }
+            )
+        return JsonResponse({"documents": documents, "missing": [doc_id for doc_id in ids if doc_id not in by_id]})
+
+
 # ============================
 # Batch (zip) generation
 # ============================
@@ -312,83 +526,111 @@ class CreateBatchView(APIView):
         serializer = BatchCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         items = serializer.validated_data["items"]
-        force_new = serializer.validated_data.get("force_new", False)
 
-        batch = Batch.objects.create(status="PENDING", documents=[])
-        doc_ids = []
+        self._validate_items(items)
+
+        slot_errors = []
+        batch = self._create_documents(items, slot_errors)
+        if slot_errors:
+            # lot et documents validés : ceux déjà compilés sont stockés, les autres restent PENDING
+            response = _slot_unavailable(slot_errors[0])
+            response.data["batch_id"] = batch.id
+            return response
+
+        return Response(
+            {"batch_id": batch.id, "count": len(batch.documents), "status": batch.status}, status=status.HTTP_202_ACCEPTED
+        )
+
+    @staticmethod
+    def _validate_items(items):
+        """Checks every (student, term) pair with two queries, whatever the batch size."""
+        student_ids = {item["student_id"] for item in items}
+        existing = set(Student.objects.filter(id__in=student_ids).values_list("id", flat=True))
+        missing = [item["student_id"] for item in items if item["student_id"] not in existing]
+        if missing:
+            raise Http404(f"Élève introuvable : {missing[0]}")
+        pairs = set(
+            TermResult.objects.filter(student_id__in=student_ids, term__in={item["term"] for item in items}).values_list(
+                "student_id", "term"
+            )
+        )
+        for item in items:
+            if (item["student_id"], item["term"]) not in pairs:
+                raise serializers.ValidationError(
+                    {"detail": f"TermResult manquant pour l'élève {item['student_id']} / {item['term']}"}
+                )
+
+    def _create_documents(self, items, slot_errors):
+        eager = getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False)
         with transaction.atomic():
-            for item in items:
-                student = get_object_or_404(Student, pk=item["student_id"])
-                if not TermResult.objects.filter(student=student, term=item["term"]).exists():
-                    raise serializers.ValidationError(
-                        {"detail": f"TermResult manquant pour l'élève {student.id} / {item['term']}"}
+            batch = Batch.objects.create(status="PENDING", documents=[])
+            docs = Document.objects.bulk_create(
+                [
+                    Document(
+                        batch=batch,
+                        student_id=item["student_id"],
+                        term=item["term"],
+                        doc_type=item["type"],
+                        status="PENDING",
+                        pdf_path="",
+                        completed_at=None,
                     )
-                doc = Document.objects.create(
-                    student=student,
-                    term=item["term"],
-                    doc_type=item["type"],
-                    status="PENDING",
-                    pdf_path="",
-                    completed_at=None,
-                )
-                doc_ids.append(doc.id)
-                mark_pending(doc.id)
-                if getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False):
-                    generate_document.apply(args=[doc.id])
-                elif not force_new:
-                    generate_document.delay(doc.id)
-                else:
-                    generate_document.delay(doc.id)
+                    for item in items
+                ],
+                batch_size=1000,
+            )
+            doc_ids = [doc.id for doc in docs]
 
             batch.documents = doc_ids
+            batch.total = len(doc_ids)
             batch.status = "IN_PROGRESS"
-            batch.save(update_fields=["documents", "status"])
+            batch.save(update_fields=["documents", "total", "status"])
 
-        return Response({"batch_id": batch.id, "count": len(doc_ids), "status": batch.status}, status=status.HTTP_202_ACCEPTED)
+            if eager:
+                # compilation après le commit, comme l'envoi au broker : aucune transaction ouverte pendant XeLaTeX
+                transaction.on_commit(lambda: self._compile_eager(doc_ids, slot_errors))
+            else:
+                # envoi au broker après le commit, par groupes (DOCUMENT_ENQUEUE_CHUNK)
+                enqueue_on_commit(doc_ids)
+        if eager:
+            batch.refresh_from_db(fields=["status"])
+        return batch
+
+    @staticmethod
+    def _compile_eager(doc_ids, slot_errors):
+        """Compiles the committed documents in this process, one compile slot each; stops at the first refusal."""
+        try:
+            mark_pending_many(doc_ids)
+        except Exception as exc:
+            logger.warning("Pending metrics not updated: %s", exc, extra={"count": len(doc_ids)})
+        try:
+            for doc_id in doc_ids:
+                with compile_slot():
+                    generate_document.apply(args=[doc_id])
+        except CompileSlotUnavailable as exc:
+            slot_errors.append(exc)
 
 
 class BatchStatusView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
+        # compteurs tenus par les workers (cf. services.batch_progress) : ni chargement des documents ni écriture
         batch = get_object_or_404(Batch, pk=pk)
-        docs = list(Document.objects.filter(id__in=batch.documents))
-        status_counts = {"READY": 0, "PENDING": 0, "FAILED": 0}
-        for d in docs:
-            status_counts[d.status] = status_counts.get(d.status, 0) + 1
-
-        # update batch status
-        if status_counts.get("FAILED", 0) > 0:
-            batch.status = "FAILED"
-        elif status_counts.get("READY", 0) == len(docs) and docs:
-            batch.status = "READY"
-        else:
-            batch.status = "IN_PROGRESS"
-        batch.save(update_fields=["status"])
+        progress = progress_of(batch)
 
         zip_url = None
         zip_path = ""
         if batch.status == "READY":
-            zip_file = batch.zip_full_path()
-            if not zip_file.exists():
-                zip_file.parent.mkdir(parents=True, exist_ok=True)
-                with zipfile.ZipFile(zip_file, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                    for d in docs:
-                        if not d.pdf_path or not os.path.exists(d.pdf_path):
-                            continue
-                        arcname = os.path.basename(d.pdf_path)
-                        zf.write(d.pdf_path, arcname=arcname)
-                batch.zip_path = str(zip_file)
-                batch.completed_at = timezone.now()
-                batch.save(update_fields=["zip_path", "completed_at"])
-            zip_path = str(batch.zip_full_path())
+            if batch.zip_full_path().exists():
+                zip_path = str(batch.zip_full_path())
             zip_url = request.build_absolute_uri(f"/api/batches/{batch.id}/download/")
 
         return Response(
             {
                 "id": batch.id,
                 "status": batch.status,
-                "counts": status_counts,
+                "counts": {"READY": progress["ready"], "PENDING": progress["pending"], "FAILED": progress["failed"]},
                 # Chemin local uniquement pour debug ; le lien à utiliser est zip_url
                 "zip_path": zip_path,
                 "zip_url": zip_url,
@@ -402,17 +644,17 @@ class BatchDownloadView(APIView):
     def get(self, request, pk):
         batch = get_object_or_404(Batch, pk=pk, status="READY")
         zip_path = batch.zip_full_path()
-        if not zip_path.exists():
-            return Response({"detail": "Archive manquante"}, status=status.HTTP_404_NOT_FOUND)
+        persisted = zip_path.exists()
         ttl = int(getattr(settings, "DOCUMENT_TTL_SECONDS", 300))
         if batch.first_download_at is None:
             batch.first_download_at = timezone.now()
             batch.save(update_fields=["first_download_at"])
-            purge_batch_zip.apply_async(args=[batch.id], countdown=ttl)
-            _schedule_local_purge(str(zip_path), ttl)
+            if persisted:
+                purge_batch_zip.apply_async(args=[batch.id], countdown=ttl)
+                _schedule_local_purge(str(zip_path), ttl)
 
         # Planifie aussi la purge des PDFs individuels du batch
-        docs = Document.objects.filter(id__in=batch.documents)
+        docs = list(Document.objects.filter(id__in=batch.documents).order_by("id"))
         for d in docs:
             if not d.pdf_path:
                 continue
@@ -422,6 +664,36 @@ class BatchDownloadView(APIView):
                 purge_document_file.apply_async(args=[d.id], countdown=ttl)
                 _schedule_local_purge(d.pdf_path, ttl)
 
-        response = FileResponse(open(zip_path, "rb"), content_type="application/zip")
-        response["Content-Disposition"] = f'attachment; filename=\"{zip_path.name}\"'
-        return response
+        if persisted:
+            # ETag / Range : reprise d'un téléchargement interrompu, 304 si l'archive est déjà à jour chez le client
+            return file_response(request, zip_path, "application/zip", filename=zip_path.name)
+
+        members = batch_members(docs)
+        if not members:
+            return Response({"detail": "Archive manquante"}, status=status.HTTP_404_NOT_FOUND)
+        # ZIP en mode stocké généré à la volée depuis les PDFs (disque ou S3), mémoire constante
+        member_docs = [doc for doc, _, _ in members]
+        size = zip_length(members)
+        if size is None:
+            # archive ZIP64 (très gros lot) : taille non calculée, flux simple sans reprise
+            response = StreamingHttpResponse(iter_batch_zip(member_docs), content_type="application/zip")
+            response["Content-Disposition"] = f'attachment; filename="{zip_path.name}"'
+            return response
+        # taille et ETag connus d'avance (en-têtes + tailles des PDFs) : 304, Range et reprise comme pour un fichier
+        return stream_response(
+            request,
+            lambda: iter_batch_zip(member_docs),
+            size,
+            zip_etag(members),
+            "application/zip",
+            filename=zip_path.name,
+        )
+
+
+@require_safe
+def serve_media(request, path, document_root=None):
+    """MEDIA_URL files (stored PDFs, ZIPs) with ETag / Last-Modified, 304 and byte ranges (replaces static.serve)."""
+    target = media_file(document_root or settings.MEDIA_ROOT, path)
+    if target is None:
+        raise Http404("Fichier introuvable")
+    return file_response(request, target)
@@ -2,7 +2,10 @@ import asyncio
 import contextlib
 from datetime import timedelta
 
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from documents.models import Batch
+from documents.services.batch_progress import batch_group, progress_of
 from documents.services.metrics import get_metrics
 
 
@@ -60,3 +63,34 @@ class DocumentMetricsConsumer(AsyncJsonWebsocketConsumer):
                 "elapsed_seconds": metrics["elapsed_seconds"],
             }
         )
+
+
+class BatchProgressConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes the progress of one batch (ws/batches/<id>/): the current counters on connect, then every
+    update sent by the workers to the batch group, so waiting clients no longer poll the status endpoint.
+    """
+
+    async def connect(self):
+        self.batch_id = self.scope["url_route"]["kwargs"]["batch_id"]
+        progress = await self._progress()
+        if progress is None:
+            await self.close(code=4404)
+            return
+        self.group_name = batch_group(self.batch_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send_json({"type": "batch", **progress})
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @database_sync_to_async
+    def _progress(self):
+        batch = Batch.objects.filter(pk=self.batch_id).first()
+        return progress_of(batch) if batch else None
+
+    async def batch_progress(self, event):
+        payload = {key: value for key, value in event.items() if key != "type"}
+        await self.send_json({"type": "batch", **payload})
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.models import Document, DocumentSnapshot
+from documents.services.snapshots import diff_snapshot
+from documents.tasks import generate_document
+
+
+class Command(BaseCommand):
+    help = "Compare le contexte figé d'un ou plusieurs documents avec les données actuelles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("document_ids", nargs="+", type=int, help="Ids des documents à comparer.")
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Régénère les documents qui diffèrent à partir des données actuelles (nouveau snapshot).",
+        )
+
+    def handle(self, *args, **options):
+        docs = list(Document.objects.filter(id__in=options["document_ids"]).order_by("id"))
+        if not docs:
+            raise CommandError("Aucun document trouvé.")
+        for doc in docs:
+            try:
+                diff = diff_snapshot(doc)
+            except DocumentSnapshot.DoesNotExist:
+                self.stdout.write(self.style.WARNING(f"Document {doc.id}: aucun snapshot."))
+                continue
+            if not diff:
+                self.stdout.write(f"Document {doc.id}: identique aux données actuelles.")
+                continue
+            self.stdout.write(self.style.WARNING(f"Document {doc.id}: {len(diff)} différence(s)"))
+            for key, values in diff.items():
+                self.stdout.write(f"  {key}: {values['snapshot']!r} -> {values['live']!r}")
+            if options["refresh"]:
+                generate_document.delay(doc.id, fresh=True)
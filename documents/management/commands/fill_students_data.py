@@ -5,7 +5,9 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils import timezone
 
+from documents.services.staleness import defer_staleness
 from schools.models import School, Class, Student, Subject, Grade, TermResult, FollowUp
+from schools.stats import defer_class_stats
 
 
 DEFAULT_SUBJECTS = [
@@ -45,8 +47,10 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING("Aucune école trouvée."))
             return
 
-        for school in schools:
-            self._fill_school(school)
+        # Statistiques de classe et documents périmés traités une seule fois à la fin du remplissage
+        with defer_class_stats(), defer_staleness():
+            for school in schools:
+                self._fill_school(school)
 
         self.stdout.write(self.style.SUCCESS("Données complètes injectées pour tous les élèves."))  # type: ignore
 
@@ -4,8 +4,8 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
 from documents.models import Document
-from documents.tasks import generate_document
-from documents.services.metrics import mark_pending
+from documents.tasks import generate_document, generate_documents_bulk
+from documents.services.metrics import mark_pending_many
 from schools.models import Student
 
 
@@ -46,6 +46,18 @@ class Command(BaseCommand):
             dest="student_ids",
             help="Liste d'IDs d'élèves à traiter (sinon tous les élèves).",
         )
+        parser.add_argument(
+            "--multi",
+            action="store_true",
+            help="Compile chaque classe en une seule exécution XeLaTeX (tâche generate_documents_bulk).",
+        )
+        parser.add_argument(
+            "--multi-size",
+            dest="multi_size",
+            type=int,
+            default=60,
+            help="Nombre maximum de documents par compilation groupée (défaut: 60).",
+        )
 
     def handle(self, *args, **options):
         doc_type = options["doc_type"].upper()
@@ -53,6 +65,8 @@ class Command(BaseCommand):
         batch_size = options["batch_size"]
         queue = options["queue"]
         student_ids = options.get("student_ids")
+        multi = options.get("multi", False)
+        multi_size = max(1, options.get("multi_size") or 60)
 
         if doc_type not in dict(Document.DOC_TYPES):
             raise CommandError(f"Type inconnu: {doc_type}. Choisir parmi: bulletin, honor.")
@@ -74,6 +88,7 @@ class Command(BaseCommand):
         for offset in range(0, total, batch_size):
             batch = list(students_qs.order_by("id")[offset : offset + batch_size])
             to_enqueue = []
+            pending = []
             with transaction.atomic():
                 for student in batch:
                     existing_qs = Document.objects.filter(student=student, term=term, doc_type=doc_type).order_by("-created_at")
@@ -95,7 +110,7 @@ class Command(BaseCommand):
                         doc.completed_at = None
                         doc.save(update_fields=["status", "pdf_path", "completed_at"])
                         if prev_status != "PENDING":
-                            mark_pending(doc.id)
+                            pending.append(doc.id)
                     else:
                         doc = Document.objects.create(
                             student=student,
@@ -105,12 +120,24 @@ class Command(BaseCommand):
                             pdf_path="",
                             completed_at=None,
                         )
-                        mark_pending(doc.id)
+                        pending.append(doc.id)
                         created += 1
-                    to_enqueue.append(doc.id)
-            for doc_id in to_enqueue:
-                generate_document.apply_async(args=[doc_id], queue=queue)
-                enqueued += 1
+                    to_enqueue.append((student.klass_id, doc.id))
+            # compteurs pending : un seul pipeline Redis par lot
+            mark_pending_many(pending)
+            if multi:
+                by_class = {}
+                for klass_id, doc_id in to_enqueue:
+                    by_class.setdefault(klass_id, []).append(doc_id)
+                for doc_ids in by_class.values():
+                    for start in range(0, len(doc_ids), multi_size):
+                        chunk = doc_ids[start : start + multi_size]
+                        generate_documents_bulk.apply_async(args=[chunk], kwargs={"fresh": True}, queue=queue)
+                        enqueued += len(chunk)
+            else:
+                for _, doc_id in to_enqueue:
+                    generate_document.apply_async(args=[doc_id], kwargs={"fresh": True}, queue=queue)
+                    enqueued += 1
             self.stdout.write(f"Lot {offset//batch_size + 1}: {len(batch)} élèves traités, {enqueued} tâches en file.")
 
         self.stdout.write(self.style.SUCCESS(f"Terminé. Documents créés/réinitialisés: {created}. Tâches enqueued: {enqueued}."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from documents.services.assets_pipeline import manifest_path, prepare_assets
+
+
+class Command(BaseCommand):
+    help = "Prépare les assets LaTeX (filigrane compilé, logos réduits) et met à jour le manifeste."
+
+    def handle(self, *args, **options):
+        manifest = prepare_assets()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Assets préparés ({len(manifest.get('schools', {}))} logos d'école). Manifeste: {manifest_path()}"
+            )
+        )
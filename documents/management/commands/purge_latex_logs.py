@@ -1,25 +1,32 @@
-import shutil
+import time
 from pathlib import Path
 
-from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from documents.services.latex_logs import log_root, purge_segments
+
 
 class Command(BaseCommand):
-    help = "Purge les logs/tex LaTeX archivés (media/latex_logs par défaut)."
+    help = "Purge les segments de logs LaTeX archivés (media/latex_logs par défaut) via leur index."
 
     def add_arguments(self, parser):
         parser.add_argument(
             "--days",
             type=int,
             default=None,
-            help="Supprimer les fichiers modifiés il y a plus de N jours.",
+            help="Supprimer les segments plus vieux que N jours.",
+        )
+        parser.add_argument(
+            "--max-bytes",
+            type=int,
+            default=None,
+            help="Garder au plus N octets de segments (les plus récents), supprimer le reste.",
         )
         parser.add_argument(
             "--max-files",
             type=int,
             default=None,
-            help="Garder seulement les N fichiers les plus récents, supprimer le reste.",
+            help="Garder seulement les N segments les plus récents, supprimer le reste.",
         )
         parser.add_argument(
             "--path",
@@ -27,31 +34,39 @@ class Command(BaseCommand):
             default=None,
             help="Chemin du répertoire de logs (défaut: settings.LATEX_LOG_DIR).",
         )
+        parser.add_argument(
+            "--legacy",
+            action="store_true",
+            help="Supprimer aussi les anciens fichiers .log/.compile.log/.tex archivés un par un.",
+        )
 
     def handle(self, *args, **options):
-        log_dir = Path(options["path"] or getattr(settings, "LATEX_LOG_DIR", settings.MEDIA_ROOT / "latex_logs"))
+        log_dir = Path(options["path"]) if options["path"] else log_root()
         days = options["days"]
-        max_files = options["max_files"]
 
         if not log_dir.exists():
             self.stdout.write(self.style.WARNING(f"Répertoire inexistant: {log_dir}"))
             return
 
-        files = sorted([p for p in log_dir.iterdir() if p.is_file()], key=lambda p: p.stat().st_mtime, reverse=True)
-        deleted = 0
-
-        if max_files is not None and max_files >= 0:
-            for p in files[max_files:]:
-                p.unlink(missing_ok=True)
-                deleted += 1
-
-        if days is not None and days > 0:
-            import time
+        deleted = purge_segments(
+            log_dir,
+            days=days if days and days > 0 else None,
+            max_bytes=options["max_bytes"],
+            max_segments=options["max_files"],
+        )
 
-            cutoff = time.time() - days * 86400
-            for p in list(log_dir.iterdir()):
-                if p.is_file() and p.stat().st_mtime < cutoff:
+        legacy_deleted = 0
+        if options["legacy"]:
+            cutoff = time.time() - days * 86400 if days and days > 0 else None
+            for p in log_dir.rglob("*"):
+                if not p.is_file() or not p.name.endswith((".log", ".tex")):
+                    continue
+                if cutoff is None or p.stat().st_mtime < cutoff:
                     p.unlink(missing_ok=True)
-                    deleted += 1
+                    legacy_deleted += 1
 
-        self.stdout.write(self.style.SUCCESS(f"Purges effectuées dans {log_dir}. Fichiers supprimés: {deleted}."))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Purges effectuées dans {log_dir}. Segments supprimés: {deleted}. Anciens fichiers: {legacy_deleted}."
+            )
+        )
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from documents.services.staleness import regenerate_stale, stale_documents
+from schools.models import TermResult
+
+
+class Command(BaseCommand):
+    help = "Régénère uniquement les documents dont les données sources ont changé depuis leur dernier rendu."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--term",
+            choices=[code for code, _ in TermResult.TERM_CHOICES],
+            help="Trimestre (par défaut tous).",
+        )
+        parser.add_argument(
+            "--type",
+            dest="doc_type",
+            choices=["bulletin", "honor"],
+            help="Type de document (par défaut tous).",
+        )
+        parser.add_argument(
+            "--multi",
+            action="store_true",
+            help="Compile chaque classe en une seule exécution XeLaTeX (tâche generate_documents_bulk).",
+        )
+        parser.add_argument(
+            "--multi-size",
+            dest="multi_size",
+            type=int,
+            default=60,
+            help="Nombre maximum de documents par compilation groupée (défaut: 60).",
+        )
+        parser.add_argument("--limit", type=int, help="Nombre maximum de documents à régénérer.")
+        parser.add_argument(
+            "--queue",
+            default="documents",
+            help="Nom de la file Celery à utiliser (défaut: documents).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Affiche le nombre de documents périmés sans les régénérer.",
+        )
+
+    def handle(self, *args, **options):
+        doc_type = options["doc_type"].upper() if options.get("doc_type") else None
+        if options["dry_run"]:
+            count = stale_documents(options.get("term"), doc_type).count()
+            self.stdout.write(f"{count} document(s) périmé(s).")
+            return
+        queued = regenerate_stale(
+            term=options.get("term"),
+            doc_type=doc_type,
+            multi=options["multi"],
+            multi_size=max(1, options["multi_size"]),
+            limit=options.get("limit"),
+            queue=options["queue"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"{queued} document(s) périmé(s) remis en file."))
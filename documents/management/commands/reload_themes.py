@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.services.themes import reload_themes
+
+
+class Command(BaseCommand):
+    help = "Vide le cache des thèmes et, avec LATEX_THEME_PUBSUB=1, le fait recharger par tous les workers."
+
+    def handle(self, *args, **options):
+        reload_themes()
+        if getattr(settings, "LATEX_THEME_PUBSUB", False):
+            self.stdout.write(self.style.SUCCESS("Rechargement des thèmes diffusé aux workers."))
+        else:
+            self.stdout.write(
+                self.style.WARNING(
+                    "LATEX_THEME_PUBSUB désactivé : seuls les changements de fichier (mtime) sont détectés par les workers."
+                )
+            )
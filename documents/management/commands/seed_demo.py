@@ -5,14 +5,17 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils import timezone
 
+from documents.services.staleness import defer_staleness
 from schools.models import School, Class, Student, Subject, Grade, TermResult, FollowUp
+from schools.stats import defer_class_stats
 
 
 class Command(BaseCommand):
     help = "Peuple la base avec des données de démonstration (3 trimestres). Sans duplication si déjà présent."
 
     def handle(self, *args, **options):
-        with transaction.atomic():
+        # Statistiques de classe et documents périmés traités une seule fois en fin de transaction
+        with transaction.atomic(), defer_class_stats(), defer_staleness():
             school, _ = School.objects.get_or_create(
                 name="Lycée Horizon Académique",
                 defaults={
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_auto_add_download_ttl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveSmallIntegerField()),
+                ('digest', models.CharField(max_length=64)),
+                ('template_digest', models.CharField(blank=True, max_length=64)),
+                ('context', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='documents.document')),
+            ],
+        ),
+    ]
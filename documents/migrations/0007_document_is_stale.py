@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_documentsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='is_stale',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='stale_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_document_is_stale'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='documents.batch'),
+        ),
+    ]
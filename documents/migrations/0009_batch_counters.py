@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:02
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_counters(apps, schema_editor):
+    """
+    Counters of the batches created before the workers kept them. Their documents are linked to the batch
+    (record_outcome needs Document.batch) and the finished ones flagged as counted, so in-flight batches finish.
+    """
+    Batch = apps.get_model("documents", "Batch")
+    Document = apps.get_model("documents", "Document")
+    for batch in Batch.objects.all().iterator():
+        members = Document.objects.filter(id__in=batch.documents)
+        members.update(batch_id=batch.id)
+        members.filter(status__in=["READY", "FAILED"]).update(batch_counted=True)
+        statuses = list(members.values_list("status", flat=True))
+        batch.total = len(batch.documents)
+        batch.ready_count = statuses.count("READY")
+        batch.failed_count = statuses.count("FAILED")
+        if batch.total and batch.ready_count + batch.failed_count >= batch.total:
+            batch.finalized_at = batch.completed_at or timezone.now()
+        batch.save(update_fields=["total", "ready_count", "failed_count", "finalized_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_document_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='finalized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='ready_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='batch_counted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
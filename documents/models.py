@@ -20,6 +20,13 @@ class Document(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     first_download_at = models.DateTimeField(null=True, blank=True)
+    # Données sources modifiées depuis le dernier rendu (cf. services.staleness)
+    is_stale = models.BooleanField(default=False, db_index=True)
+    stale_since = models.DateTimeField(null=True, blank=True)
+    # Lot d'origine (création via POST /api/batches/), pour l'archive construite au fil de l'eau
+    batch = models.ForeignKey("Batch", null=True, blank=True, on_delete=models.SET_NULL, related_name="items")
+    # Issue finale déjà comptée dans les compteurs du lot (cf. services.batch_progress)
+    batch_counted = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.get_doc_type_display()} - {self.student} - {self.term}"
@@ -44,6 +51,11 @@ class Batch(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     first_download_at = models.DateTimeField(null=True, blank=True)
+    # Compteurs tenus par les workers : le statut se lit sans charger les documents
+    total = models.PositiveIntegerField(default=0)
+    ready_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    finalized_at = models.DateTimeField(null=True, blank=True)
 
     def batches_dir(self) -> Path:
         return Path(getattr(settings, "MEDIA_ROOT", Path("."))) / "batches"
@@ -52,3 +64,18 @@ class Batch(models.Model):
         batches_dir = self.batches_dir()
         batches_dir.mkdir(parents=True, exist_ok=True)
         return batches_dir / f"batch_{self.id}.zip"
+
+
+class DocumentSnapshot(models.Model):
+    """Frozen render context of a Document (see services.snapshots), used to re-render without the schools tables."""
+
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name="snapshot")
+    version = models.PositiveSmallIntegerField()
+    digest = models.CharField(max_length=64)  # sha256 du contexte canonique
+    template_digest = models.CharField(max_length=64, blank=True)
+    context = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Snapshot v{self.version} - document {self.document_id}"
@@ -1,7 +1,8 @@
 from django.urls import path
 
-from .consumers import DocumentMetricsConsumer
+from .consumers import BatchProgressConsumer, DocumentMetricsConsumer
 
 websocket_urlpatterns = [
     path("ws/documents/metrics/", DocumentMetricsConsumer.as_asgi()),
+    path("ws/batches/<int:batch_id>/", BatchProgressConsumer.as_asgi()),
 ]
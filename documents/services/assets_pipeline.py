@@ -0,0 +1,279 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from documents.services.pdf_cache import file_digest
+from documents.services.themes import DEFAULT_THEMES, get_theme
+
+logger = logging.getLogger(__name__)
+
+# Ordre de préférence du filigrane (PDF précompilé d'abord, plus léger à charger)
+WATERMARK_CANDIDATES = ("filigrane.pdf", "filigrame.pdf", "filigrane.png", "filigrame.png")
+
+_manifest_memo = {"mtime": None, "data": None}
+_memo_lock = threading.Lock()
+# Préparation déjà demandée par ce process (pid -> empreintes des thèmes) : une seule tâche par version
+_requested = {}
+
+
+def asset_root() -> Path:
+    return Path(settings.BASE_DIR) / "assets"
+
+
+def prepared_dir() -> Path:
+    return Path(getattr(settings, "LATEX_CACHE_DIR", Path(tempfile.gettempdir()) / "docgen_latex")) / "prepared"
+
+
+def manifest_path() -> Path:
+    return prepared_dir() / "manifest.json"
+
+
+def _logo_max_px() -> int:
+    dpi = int(getattr(settings, "LATEX_ASSET_DPI", 300))
+    width_cm = float(getattr(settings, "LATEX_LOGO_WIDTH_CM", 3.5))
+    return max(1, int(round(width_cm / 2.54 * dpi)))
+
+
+def _locked_manifest():
+    prepared_dir().mkdir(parents=True, exist_ok=True)
+    lock = open(prepared_dir() / ".manifest.lock", "w")
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+
+def _read_manifest() -> dict:
+    try:
+        data = json.loads(manifest_path().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_manifest(data: dict):
+    path = manifest_path()
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_manifest() -> Optional[dict]:
+    """Manifest of prepared assets, memoised per process and re-read only when the file changes."""
+    try:
+        mtime = manifest_path().stat().st_mtime_ns
+    except OSError:
+        return None
+    with _memo_lock:
+        if _manifest_memo["mtime"] != mtime:
+            _manifest_memo["data"] = _read_manifest()
+            _manifest_memo["mtime"] = mtime
+        return _manifest_memo["data"]
+
+
+def _compile_watermark(root: Path, entry: Optional[dict]) -> dict:
+    """Compiles templates_latex/filigrane.tex into assets/filigrane.pdf when its source changed."""
+    source_tex = Path(settings.BASE_DIR) / "templates_latex" / "filigrane.tex"
+    target_pdf = root / "filigrane.pdf"
+    source_digest = file_digest(source_tex)
+    if not source_digest:
+        return {}
+    if entry and entry.get("source") == source_digest and target_pdf.exists():
+        return entry
+    if target_pdf.exists() and not entry:
+        # PDF déjà présent (déploiement existant) : on l'adopte pour cette version du source
+        return {"source": source_digest, "path": str(target_pdf)}
+    try:
+        subprocess.run(
+            [
+                getattr(settings, "XELATEX_BIN", "xelatex"),
+                "-interaction=nonstopmode",
+                "-halt-on-error",
+                f"-output-directory={root}",
+                source_tex.name,
+            ],
+            cwd=source_tex.parent,
+            check=True,
+            capture_output=True,
+            timeout=60,
+        )
+        logger.info("Compiled default filigrane into assets: %s", target_pdf)
+    except Exception as exc:
+        logger.warning("Unable to compile default filigrane.tex: %s", exc)
+        return {}
+    return {"source": source_digest, "path": str(target_pdf)}
+
+
+def prepare_image(source, name: str, entry: Optional[dict] = None) -> Optional[dict]:
+    """
+    Downscales an image to the width used by the templates (LATEX_LOGO_WIDTH_CM at LATEX_ASSET_DPI)
+    and converts it to PNG, once per source digest. Returns {"source", "path"} or None if missing.
+    """
+    if not source:
+        return None
+    source = Path(source)
+    digest = file_digest(source)
+    if not digest:
+        return None
+    if entry and entry.get("source") == digest and Path(entry.get("path", "")).exists():
+        return entry
+    target = prepared_dir() / f"{name}-{digest[:16]}.png"
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            from PIL import Image
+
+            with Image.open(source) as img:
+                img.load()
+                max_px = _logo_max_px()
+                if img.width > max_px:
+                    img.thumbnail((max_px, max_px * img.height // img.width or 1), Image.LANCZOS)
+                if img.mode not in ("RGB", "RGBA", "L", "LA"):
+                    img = img.convert("RGBA")
+                img.save(tmp, format="PNG", optimize=True)
+        except Exception as exc:
+            # Pillow absent ou format non géré : on garde l'original (XeLaTeX sait le lire)
+            logger.warning("Unable to downscale %s, using original: %s", source, exc)
+            if source.suffix.lower() not in (".png", ".jpg", ".jpeg", ".pdf"):
+                return None
+            target = target.with_suffix(source.suffix.lower())
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    return {"source": digest, "path": str(target)}
+
+
+def _theme_digests() -> dict:
+    return {doc_type: file_digest(path) for doc_type, path in getattr(settings, "LATEX_THEME_FILES", {}).items()}
+
+
+def _theme_assets(manifest: dict) -> dict:
+    themes = {}
+    previous = manifest.get("themes", {})
+    for doc_type in DEFAULT_THEMES:
+        resolved = get_theme(doc_type)["resolved"]
+        old = previous.get(doc_type, {})
+        logo = prepare_image(resolved["logo"], f"theme-{doc_type.lower()}-logo", old.get("logo"))
+        themes[doc_type] = {
+            "logo": logo,
+            "watermark": resolved["watermark"] or None,
+        }
+    return themes
+
+
+def prepare_assets(schools=None) -> dict:
+    """
+    Prepares every asset once per version (watermark PDF, default/theme/school logos) and records the
+    results in the manifest, under a file lock so concurrent workers do the work only once.
+    `schools`: iterable of School instances (default: all schools with a logo).
+    """
+    started = time.monotonic()
+    with _locked_manifest():
+        manifest = _read_manifest()
+        root = asset_root()
+        root.mkdir(parents=True, exist_ok=True)
+        manifest["watermark_build"] = _compile_watermark(root, manifest.get("watermark_build"))
+        manifest["watermark"] = next(
+            (str(root / name) for name in WATERMARK_CANDIDATES if (root / name).exists()), None
+        )
+        manifest["logo"] = prepare_image(root / "logo.png", "default-logo", manifest.get("logo"))
+        manifest["themes"] = _theme_assets(manifest)
+        manifest["asset_dir"] = str(root)
+        manifest["theme_digests"] = _theme_digests()
+        manifest.setdefault("schools", {})
+        if schools is None:
+            from schools.models import School
+
+            schools = School.objects.exclude(logo="")
+        for school in schools:
+            _prepare_school(manifest, school)
+        _write_manifest(manifest)
+    logger.info("Assets prepared", extra={"seconds": round(time.monotonic() - started, 3)})
+    return manifest
+
+
+def _prepare_school(manifest: dict, school):
+    key = str(school.pk)
+    try:
+        source = school.logo.path if school.logo else ""
+    except Exception:
+        source = ""
+    prepared = prepare_image(source, f"school-{school.pk}-logo", manifest["schools"].get(key))
+    if prepared:
+        prepared["name"] = school.logo.name
+        manifest["schools"][key] = prepared
+    else:
+        manifest["schools"].pop(key, None)
+
+
+def prepare_school_logo(school):
+    """Prepares a single uploaded school logo and updates the manifest."""
+    with _locked_manifest():
+        manifest = _read_manifest()
+        manifest.setdefault("schools", {})
+        _prepare_school(manifest, school)
+        _write_manifest(manifest)
+
+
+def _original_assets(manifest: Optional[dict]) -> dict:
+    """Manifest pointing at the unprepared assets (original logos and watermark), used until a worker prepares them."""
+    root = asset_root()
+    themes = {}
+    for doc_type in DEFAULT_THEMES:
+        resolved = get_theme(doc_type)["resolved"]
+        themes[doc_type] = {
+            "logo": {"path": resolved["logo"]} if resolved["logo"] else None,
+            "watermark": resolved["watermark"] or None,
+        }
+    if manifest is not None:
+        # Seuls les thèmes ont changé : le reste du manifeste (logos d'écoles, filigrane compilé) reste valable
+        return dict(manifest, themes=themes)
+    logo = root / "logo.png"
+    return {
+        "watermark": next((str(root / name) for name in WATERMARK_CANDIDATES if (root / name).exists()), None),
+        "logo": {"path": str(logo)} if logo.exists() else None,
+        "themes": themes,
+        "asset_dir": str(root),
+        "schools": {},
+    }
+
+
+def _request_preparation(digests: dict):
+    """Enqueues prepare_assets_task once per process and theme version, from a thread so a down broker never stalls a render."""
+    key = json.dumps(digests, sort_keys=True)
+    with _memo_lock:
+        if _requested.get(os.getpid()) == key:
+            return
+        _requested[os.getpid()] = key
+
+    def _enqueue():
+        from documents.tasks import prepare_assets_task
+
+        try:
+            prepare_assets_task.apply_async(retry=False, ignore_result=True)
+        except Exception as exc:
+            logger.warning("Unable to enqueue asset preparation: %s", exc)
+
+    threading.Thread(target=_enqueue, name="assets-prepare-enqueue", daemon=True).start()
+
+
+def get_manifest() -> dict:
+    """
+    Manifest for build_context. When no worker prepared the assets yet or a theme file changed, returns the
+    original asset paths and enqueues prepare_assets_task instead of preparing them on the render path.
+    """
+    manifest = load_manifest()
+    digests = _theme_digests()
+    if manifest is None or manifest.get("theme_digests") != digests:
+        logger.info("Asset manifest missing or outdated, using original assets until prepared")
+        _request_preparation(digests)
+        return _original_assets(manifest)
+    return manifest
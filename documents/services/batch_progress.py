@@ -0,0 +1,75 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from documents.models import Batch, Document
+
+logger = logging.getLogger(__name__)
+
+
+def batch_group(batch_id: int) -> str:
+    return f"batch_{batch_id}"
+
+
+def progress_of(batch) -> dict:
+    return {
+        "batch_id": batch.id,
+        "status": batch.status,
+        "total": batch.total,
+        "ready": batch.ready_count,
+        "failed": batch.failed_count,
+        "pending": max(batch.total - batch.ready_count - batch.failed_count, 0),
+        "finalized": batch.finalized_at is not None,
+    }
+
+
+def _push(batch_id: int):
+    """Sends the batch counters to its WebSocket group (best-effort: clients can still poll)."""
+    try:
+        from channels.layers import get_channel_layer
+
+        layer = get_channel_layer()
+        if layer is None:
+            return
+        batch = Batch.objects.filter(pk=batch_id).first()
+        if batch is None:
+            return
+        async_to_sync(layer.group_send)(batch_group(batch_id), {"type": "batch.progress", **progress_of(batch)})
+    except Exception as exc:
+        logger.warning("Batch progress push failed: %s", exc, extra={"batch_id": batch_id})
+
+
+def record_outcome(doc, ready: bool) -> bool:
+    """
+    Counts the final outcome of a batch document (READY, or FAILED once retries are exhausted) exactly once,
+    through conditional UPDATEs: a redelivered task or a later re-render does not count twice. The worker
+    that brings the counters to the total finalizes the batch (READY, or FAILED if a document failed);
+    progress is pushed to the batch WebSocket group after commit. Returns True if this call finalized it.
+    """
+    if not doc.batch_id:
+        return False
+    with transaction.atomic():
+        if not Document.objects.filter(pk=doc.pk, batch_counted=False).update(batch_counted=True):
+            return False
+        counter = "ready_count" if ready else "failed_count"
+        Batch.objects.filter(pk=doc.batch_id).update(**{counter: F(counter) + 1})
+        now = timezone.now()
+        finalized = bool(
+            Batch.objects.filter(
+                pk=doc.batch_id,
+                finalized_at__isnull=True,
+                total__gt=0,
+                total__lte=F("ready_count") + F("failed_count"),
+            ).update(
+                finalized_at=now,
+                completed_at=now,
+                status=Case(When(failed_count__gt=0, then=Value("FAILED")), default=Value("READY")),
+            )
+        )
+        transaction.on_commit(lambda: _push(doc.batch_id))
+    if finalized:
+        logger.info("Batch finalized", extra={"batch_id": doc.batch_id})
+    return finalized
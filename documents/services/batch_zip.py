@@ -0,0 +1,171 @@
+import fcntl
+import hashlib
+import logging
+import os
+import zipfile
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+from documents.services.storage import open_pdf, stat_pdf
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Descripteur de données écrit après chaque membre (flux non seekable) : signature, CRC, tailles sur 4 octets
+DATA_DESCRIPTOR_SIZE = 16
+
+
+class _Sink:
+    """Write-only, non-seekable target for ZipFile: what it writes is handed out by drain()."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> list:
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def _arcname(doc) -> str:
+    return os.path.basename(doc.pdf_path)
+
+
+def _zip_info(doc) -> zipfile.ZipInfo:
+    # date fixe à défaut de completed_at : deux générations de l'archive doivent produire les mêmes octets (Range)
+    date_time = timezone.localtime(doc.completed_at).timetuple()[:6] if doc.completed_at else (1980, 1, 1, 0, 0, 0)
+    info = zipfile.ZipInfo(_arcname(doc), date_time=date_time)
+    info.compress_type = zipfile.ZIP_STORED
+    return info
+
+
+def iter_batch_zip(docs, chunk_size: int = CHUNK_SIZE):
+    """
+    Yields a stored-mode (uncompressed) ZIP of the documents' PDFs, read from local files or S3 in chunks:
+    memory stays constant whatever the batch size. The PDFs are already compressed, recompressing them
+    would only cost CPU. Documents whose file is gone are skipped.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        for doc in docs:
+            if not doc.pdf_path:
+                continue
+            try:
+                source = open_pdf(doc.pdf_path)
+            except Exception as exc:
+                logger.warning("Skipping missing PDF in batch zip: %s", exc, extra={"document_id": doc.id})
+                continue
+            with closing(source), zf.open(_zip_info(doc), "w") as entry:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def batch_members(docs) -> list:
+    """(doc, size, version) of the documents whose PDF is still stored, without reading the files."""
+    members = []
+    for doc in docs:
+        if not doc.pdf_path:
+            continue
+        try:
+            size, version = stat_pdf(doc.pdf_path)
+        except Exception as exc:
+            logger.warning("Skipping missing PDF in batch zip: %s", exc, extra={"document_id": doc.id})
+            continue
+        members.append((doc, size, version))
+    return members
+
+
+def _name_length(name: str) -> int:
+    try:
+        return len(name.encode("ascii"))
+    except UnicodeEncodeError:
+        return len(name.encode("utf-8"))
+
+
+def zip_length(members) -> Optional[int]:
+    """
+    Exact size of the archive iter_batch_zip yields for `members` (stored mode: headers + PDF bytes), or None
+    when it would need ZIP64 records (over 4 GiB or 65535 entries).
+    """
+    total = zipfile.sizeEndCentDir
+    for doc, size, _ in members:
+        name_length = _name_length(_arcname(doc))
+        total += zipfile.sizeFileHeader + name_length + size + DATA_DESCRIPTOR_SIZE
+        total += zipfile.sizeCentralDir + name_length
+    if len(members) >= zipfile.ZIP_FILECOUNT_LIMIT or total > zipfile.ZIP64_LIMIT:
+        return None
+    return total
+
+
+def zip_etag(members) -> str:
+    """Strong ETag of the generated archive, from each member's name, date, size and stored version."""
+    digest = hashlib.sha256()
+    for doc, size, version in members:
+        digest.update(f"{_arcname(doc)}|{_zip_info(doc).date_time}|{size}|{version}\n".encode("utf-8"))
+    return quote_etag(digest.hexdigest()[:32])
+
+
+def _persist_enabled() -> bool:
+    return getattr(settings, "BATCH_ZIP_PERSIST", False)
+
+
+@contextmanager
+def _locked(path: Path):
+    fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def append_to_batch_archive(doc, pdf_bytes: bytes) -> bool:
+    """
+    With BATCH_ZIP_PERSIST, adds a freshly stored PDF to its batch archive (`batch_<id>.zip.part`); the archive
+    is renamed to `batch_<id>.zip` and recorded on the batch once every document is in it.
+    Returns True when the archive got completed.
+    """
+    batch = doc.batch
+    if batch is None or not _persist_enabled():
+        return False
+    final = batch.zip_full_path()
+    part = final.with_name(final.name + ".part")
+    with _locked(part):
+        if final.exists():
+            return False
+        # mode "a" : seul le répertoire central est réécrit à chaque ajout
+        with zipfile.ZipFile(part, "a", compression=zipfile.ZIP_STORED) as zf:
+            names = set(zf.namelist())
+            if _arcname(doc) not in names:
+                zf.writestr(_zip_info(doc), pdf_bytes)
+                names.add(_arcname(doc))
+        if len(names) < len(batch.documents):
+            return False
+        os.replace(part, final)
+    type(batch).objects.filter(pk=batch.pk).update(zip_path=str(final), completed_at=timezone.now())
+    Path(f"{part}.lock").unlink(missing_ok=True)
+    logger.info("Batch archive completed", extra={"batch_id": batch.pk, "count": len(names)})
+    return True
@@ -1,14 +1,14 @@
-import json
 import logging
-import subprocess
 from pathlib import Path
 
 from django.conf import settings
-from django.db.models import Avg
 from django.utils import timezone
 
-from schools.models import Grade, TermResult, FollowUp, Subject
+from schools.models import ClassTermStats, Grade, TermResult, FollowUp, Student, Subject
+from schools.stats import refresh_class_stats
 from documents.models import Document
+from documents.services.assets_pipeline import get_manifest
+from documents.services.themes import DEFAULT_THEMES, get_theme
 
 logger = logging.getLogger(__name__)
 
@@ -33,150 +33,110 @@ def latex_escape(value):
         return value
     return "".join(LATEX_REPLACEMENTS.get(ch, ch) for ch in value)
 
-DEFAULT_THEMES = {
-    "BULLETIN": {
-        "colors": {
-            "bg": "F9FAFB",
-            "card": "FFFFFF",
-            "primary": "0F172A",
-            "muted": "64748B",
-            "footer": "1E3A8A",
-        },
-        "logo": {
-            "enabled": True,
-            "path": str(Path("logo.png")),
-            "override_school_logo": False,
-        },
-        "watermark": {
-            "enabled": True,
-            "path": str(Path("filigrame.png")),
-        },
-        "school": {
-            "name": "",
-            "country": "",
-            "city": "",
-            "phone": "",
-            "email": "",
-        },
-    },
-    "HONOR": {
-        "colors": {
-            "gold_bg": "FBF3D0",
-            "gold": "C9A24D",
-            "primary": "1E3A8A",
-            "muted": "475569",
-        },
-        "logo": {
-            "enabled": True,
-            "path": str(Path("logo.png")),
-            "override_school_logo": False,
-        },
-        "watermark": {
-            "enabled": True,
-            "path": str(Path("filigrame.png")),
-        },
-        "school": {
-            "name": "",
-            "country": "",
-            "city": "",
-            "phone": "",
-            "email": "",
-        },
-    },
-}
-
-
-def _deep_merge(base: dict, override: dict) -> dict:
-    merged = dict(base)
-    for key, value in override.items():
-        if isinstance(value, dict) and isinstance(merged.get(key), dict):
-            merged[key] = _deep_merge(merged[key], value)
-        else:
-            merged[key] = value
-    return merged
 
-
-def _resolve_theme_path(path_value) -> str:
-    if not path_value:
-        return ""
-    candidate = Path(path_value)
-    if not candidate.is_absolute():
-        candidate = Path(settings.BASE_DIR) / candidate
-    if candidate.exists():
-        return str(candidate)
-    logger.warning("Theme asset not found: %s", candidate)
-    return ""
+def _prefetch(docs: list) -> dict:
+    """
+    Loads everything the contexts of `docs` need in a fixed number of queries: students (with class and
+    school), term results, grades, follow-ups, subject catalogs and class statistics (ClassTermStats).
+    """
+    student_ids = {doc.student_id for doc in docs}
+    students = Student.objects.select_related("klass__school").in_bulk(student_ids)
+
+    term_results = {}
+    for result in TermResult.objects.filter(student_id__in=student_ids).order_by("pk"):
+        term_results.setdefault(result.student_id, []).append(result)
+    grades = {}
+    for grade in Grade.objects.filter(student_id__in=student_ids).select_related("subject").order_by("pk"):
+        grades.setdefault(grade.student_id, []).append(grade)
+    follow_ups = {}
+    for follow in FollowUp.objects.filter(student_id__in=student_ids).order_by("pk"):
+        # même choix que .first() : le suivi le plus ancien
+        follow_ups.setdefault(follow.student_id, follow)
+
+    subjects = {}
+    school_ids = {student.klass.school_id for student in students.values()}
+    for subject in Subject.objects.filter(school_id__in=school_ids).order_by("name", "pk"):
+        subjects.setdefault(subject.school_id, []).append(subject)
+
+    pairs = {(students[doc.student_id].klass_id, doc.term) for doc in docs if doc.student_id in students}
+    return {
+        "students": students,
+        "term_results": term_results,
+        "grades": grades,
+        "follow_ups": follow_ups,
+        "subjects": subjects,
+        "class_stats": _class_stats(pairs),
+    }
 
 
-def _ensure_default_filigrane(asset_root: Path):
+def _class_stats(pairs: set) -> dict:
     """
-    Compile templates_latex/filigrane.tex into assets/filigrane.pdf if missing.
-    This avoids manual steps and runs once until the file exists.
+    Class best/average/min per (class id, term), read from the materialized ClassTermStats.
+    Rows missing (results loaded without signals) are computed once and stored.
     """
-    target_pdf = asset_root / "filigrane.pdf"
-    if target_pdf.exists():
-        return
-    source_tex = Path(settings.BASE_DIR) / "templates_latex" / "filigrane.tex"
-    if not source_tex.exists():
-        return
-    asset_root.mkdir(parents=True, exist_ok=True)
-    try:
-        subprocess.run(
-            [
-                getattr(settings, "XELATEX_BIN", "xelatex"),
-                "-interaction=nonstopmode",
-                "-halt-on-error",
-                f"-output-directory={asset_root}",
-                source_tex.name,
-            ],
-            cwd=source_tex.parent,
-            check=True,
-            capture_output=True,
-            timeout=60,
+    def _load(keys):
+        rows = ClassTermStats.objects.filter(
+            klass_id__in={klass_id for klass_id, _ in keys}, term__in={term for _, term in keys}
         )
-        logger.info("Compiled default filigrane into assets: %s", target_pdf)
-    except Exception as exc:
-        logger.warning("Unable to compile default filigrane.tex: %s", exc)
-
+        return {
+            (row.klass_id, row.term): {"best": row.best_average, "avg": row.average, "min": row.min_average}
+            for row in rows
+        }
 
-def _load_theme(doc_type: str) -> dict:
-    theme_files = getattr(settings, "LATEX_THEME_FILES", {})
-    theme_file = theme_files.get(doc_type)
-    defaults = DEFAULT_THEMES.get(doc_type, {})
-    if not theme_file:
-        return defaults
+    if not pairs:
+        return {}
+    stats = _load(pairs)
+    missing = pairs - set(stats)
+    if missing:
+        refresh_class_stats(missing)
+        stats.update(_load(missing))
+    return stats
 
-    try:
-        parsed = json.loads(Path(theme_file).read_text(encoding="utf-8"))
-        if not isinstance(parsed, dict):
-            logger.warning("Theme config is not an object for %s: %s", doc_type, theme_file)
-            parsed = {}
-    except FileNotFoundError:
-        logger.warning("Theme config file not found for %s: %s", doc_type, theme_file)
-        parsed = {}
-    except json.JSONDecodeError as exc:
-        logger.warning("Theme config JSON invalid for %s: %s", doc_type, exc)
-        parsed = {}
 
-    return _deep_merge(defaults, parsed)
+def build_contexts(docs) -> list:
+    """
+    Builds the contexts of several documents (typically a whole class) with a constant number of queries.
+    Same result as calling build_context on each document.
+    """
+    docs = list(docs)
+    if not docs:
+        return []
+    data = _prefetch(docs)
+    # Assets préparés une fois (filigrane compilé, logos réduits) : lecture du manifeste, pas du disque
+    manifest = get_manifest()
+    contexts = []
+    for doc in docs:
+        student = data["students"].get(doc.student_id)
+        theme = get_theme(doc.doc_type, student.klass.school_id if student else None)
+        contexts.append(_assemble_context(doc, data, theme, manifest))
+    return contexts
 
 
 def build_context(doc: Document) -> dict:
-    theme = _load_theme(doc.doc_type)
+    return build_contexts([doc])[0]
+
+
+def _assemble_context(doc: Document, data: dict, theme: dict, manifest: dict) -> dict:
     theme_colors = theme.get("colors", {})
     theme_logo = theme.get("logo", {})
     theme_watermark = theme.get("watermark", {})
     theme_school = theme.get("school", {})
     default_colors = DEFAULT_THEMES.get(doc.doc_type, {}).get("colors", {})
-    asset_root = Path(settings.BASE_DIR) / "assets"
-    _ensure_default_filigrane(asset_root)
-    asset_root.mkdir(parents=True, exist_ok=True)
+    theme_assets = manifest.get("themes", {}).get(doc.doc_type, {})
 
-    student = doc.student
+    student = data["students"].get(doc.student_id)
+    if student is None:
+        raise Student.DoesNotExist(f"Student {doc.student_id} not found")
     school = student.klass.school
-    term_result = TermResult.objects.get(student=student, term=doc.term)
+    student_results = data["term_results"].get(student.id, [])
+    matches = [tr for tr in student_results if tr.term == doc.term]
+    if not matches:
+        raise TermResult.DoesNotExist(f"TermResult not found for student {student.id} / {doc.term}")
+    if len(matches) > 1:
+        raise TermResult.MultipleObjectsReturned(f"Several TermResult for student {student.id} / {doc.term}")
+    term_result = matches[0]
     # Rappels T1/T2 et moyenne annuelle (si disponibles)
-    term_map = {tr.term: tr for tr in TermResult.objects.filter(student=student)}
+    term_map = {tr.term: tr for tr in student_results}
     t1_avg_val = term_map.get("T1").average if term_map.get("T1") else None
     t2_avg_val = term_map.get("T2").average if term_map.get("T2") else None
     # moyenne annuelle simple (moyenne des averages disponibles)
@@ -184,14 +144,14 @@ def build_context(doc: Document) -> dict:
     avg_values = [v for v in (t1_avg_val, t2_avg_val, term_result.average) if v is not None]
     if avg_values:
         year_avg_val = sum([float(v) for v in avg_values]) / len(avg_values)
-    grades = Grade.objects.filter(student=student).select_related("subject")
-    follow = FollowUp.objects.filter(student=student).first()
-    class_results = TermResult.objects.filter(student__klass=student.klass, term=doc.term)
+    grades = data["grades"].get(student.id, [])
+    follow = data["follow_ups"].get(student.id)
+    class_stats = data["class_stats"].get((student.klass_id, doc.term), {})
 
     # Construit la liste des matières à partir du catalogue (pour ne pas perdre les compléments si une note manque)
     subjects = []
     grade_map = {g.subject_id: g for g in grades}
-    all_subjects = Subject.objects.filter(school=school).order_by("name")
+    all_subjects = data["subjects"].get(school.id, [])
 
     def fmt_decimal(value):
         if value is None:
@@ -229,46 +189,39 @@ def build_context(doc: Document) -> dict:
     school_address = latex_escape(school.address)
     school_motto = latex_escape(school.motto or "UNITÉ — PROGRÈS — JUSTICE")
 
-    try:
-        logo_path = school.logo.path
-    except Exception:
-        logo_path = ""
+    school_logo = manifest.get("schools", {}).get(str(school.pk))
+    if school_logo and school_logo.get("name") == school.logo.name:
+        logo_path = school_logo["path"]
+    else:
+        # Logo pas encore préparé (import direct en base) : on garde l'original
+        try:
+            logo_path = school.logo.path if school.logo and Path(school.logo.path).exists() else ""
+        except Exception:
+            logo_path = ""
 
-    theme_logo_path = _resolve_theme_path(theme_logo.get("path"))
+    # Logo du thème propre à l'école s'il y en a un, sinon logo du thème préparé par le pipeline d'assets
+    theme_logo_path = theme["resolved"]["school_logo"] or (theme_assets.get("logo") or {}).get("path", "")
     if theme_logo.get("override_school_logo"):
         logo_path = theme_logo_path
     elif not logo_path:
         logo_path = theme_logo_path
 
-    # fallback: uniquement assets/logo.png si aucune source définie ou existante
-    fallback_logo_candidates = [asset_root / "logo.png"]
-    for cand in fallback_logo_candidates:
-        if (not logo_path or not Path(logo_path).exists()) and cand.exists():
-            logo_path = str(cand)
-            break
+    # fallback: uniquement assets/logo.png si aucune source définie
+    if not logo_path:
+        logo_path = (manifest.get("logo") or {}).get("path", "")
 
     logo_enabled = theme_logo.get("enabled", True)
     if not logo_enabled:
         logo_path = ""
-    has_logo = 1 if logo_enabled and logo_path and Path(logo_path).exists() else 0
-
-    # Préférence pour un filigrane précompilé en PDF (plus léger à charger)
-    fallback_wm = ""
-    wm_candidates = [
-        asset_root / "filigrane.pdf",
-        asset_root / "filigrame.pdf",
-        asset_root / "filigrane.png",
-        asset_root / "filigrame.png",
-    ]
-    for cand in wm_candidates:
-        if cand.exists():
-            fallback_wm = str(cand)
-            break
-
-    wm_path_candidate = _resolve_theme_path(theme_watermark.get("path")) or fallback_wm
+    has_logo = 1 if logo_enabled and logo_path else 0
+
+    # Préférence pour un filigrane précompilé en PDF (plus léger à charger), résolue par le pipeline d'assets
+    wm_path_candidate = (
+        theme["resolved"]["school_watermark"] or theme_assets.get("watermark") or manifest.get("watermark") or ""
+    )
     wm_enabled = theme_watermark.get("enabled", True)
     wm_path_str = wm_path_candidate if wm_enabled else ""
-    has_wm = 1 if wm_path_str and Path(wm_path_str).exists() else 0
+    has_wm = 1 if wm_path_str else 0
 
     def color_value(key: str, fallback: str = "000000") -> str:
         return theme_colors.get(key, default_colors.get(key, fallback))
@@ -326,7 +279,7 @@ def build_context(doc: Document) -> dict:
         "HAS_LOGO": has_logo,
         "WATERMARK_PATH": wm_path_str,
         "HAS_WATERMARK": has_wm,
-        "ASSET_DIR": str(asset_root) if asset_root.exists() else "",
+        "ASSET_DIR": manifest.get("asset_dir", ""),
         "DOC_TYPE": doc.doc_type,
         "STUDENT_NAME": latex_escape(f"{student.first_name} {student.last_name}"),
         "MATRICULE": latex_escape(student.matricule),
@@ -350,23 +303,13 @@ def build_context(doc: Document) -> dict:
         }
     )
 
-    # Informations de classe
-    class_best_avg = class_results.order_by("-average").values_list("average", flat=True).first()
-    class_avg = class_results.aggregate(avg=Avg("average")).get("avg")
-
-    def fmt_decimal(value):
-        if value is None:
-            return ""
-        try:
-            return f"{float(value):.2f}"
-        except Exception:
-            return str(value)
-
+    # Informations de classe (statistiques matérialisées, cf. schools.stats)
     context.update(
         {
             "TERM_LABEL": {"T1": "Trimestre 1", "T2": "Trimestre 2", "T3": "Trimestre 3"}.get(doc.term, doc.term),
-            "CLASS_BEST_AVG": fmt_decimal(class_best_avg),
-            "CLASS_AVG": fmt_decimal(class_avg),
+            "CLASS_BEST_AVG": fmt_decimal(class_stats.get("best")),
+            "CLASS_AVG": fmt_decimal(class_stats.get("avg")),
+            "CLASS_MIN": fmt_decimal(class_stats.get("min")),
         }
     )
 
@@ -415,19 +358,6 @@ def build_context(doc: Document) -> dict:
     main_avg = weighted_avg(main_subs)
     comp_avg = weighted_avg(comp_subs)
 
-    class_best_avg = class_results.order_by("-average").values_list("average", flat=True).first()
-    class_avg = class_results.aggregate(avg=Avg("average")).get("avg")
-    class_min = class_results.order_by("average").values_list("average", flat=True).first()
-
-    context.update(
-        {
-            "TERM_LABEL": {"T1": "Trimestre 1", "T2": "Trimestre 2", "T3": "Trimestre 3"}.get(doc.term, doc.term),
-            "CLASS_BEST_AVG": fmt_decimal(class_best_avg),
-            "CLASS_AVG": fmt_decimal(class_avg),
-            "CLASS_MIN": fmt_decimal(class_min),
-        }
-    )
-
     # template loop markers for subjects (honor placeholder legacy)
     subject_rows = []
     for item in subjects:
@@ -483,6 +413,11 @@ def build_context(doc: Document) -> dict:
         macros["logopath"] = logo_path
 
     context["_MACROS"] = macros
-    # passes XeLaTeX : 2 pour bulletin et tableau d'honneur afin de stabiliser les refs/overlays
-    context["XELATEX_PASSES"] = 2 if doc.doc_type in ("BULLETIN", "HONOR") else 1
+    # passes XeLaTeX : bulletin et tableau d'honneur ont des overlays tikz qui peuvent demander une 2e passe ;
+    # le renderer ne la lance que si l'.aux change ou si le log la réclame (borne LATEX_MAX_PASSES)
+    if doc.doc_type in ("BULLETIN", "HONOR"):
+        context["XELATEX_MAX_PASSES"] = getattr(settings, "LATEX_MAX_PASSES", 3)
+    else:
+        context["XELATEX_PASSES"] = 1
+        context["XELATEX_MAX_PASSES"] = 1
     return context
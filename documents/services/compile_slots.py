@@ -0,0 +1,191 @@
+import asyncio
+import fcntl
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from documents.services.metrics import record_compile_slots
+
+logger = logging.getLogger(__name__)
+
+
+class CompileSlotUnavailable(Exception):
+    """No compile slot could be obtained: `status` is 429 (wait queue full) or 503 (wait timed out)."""
+
+    def __init__(self, status: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class CompileSlots:
+    """
+    Node-wide limit on concurrent XeLaTeX compiles in web processes. Each slot is a lock file held with flock,
+    shared by every process of the node and released by the kernel if the holder dies; the holder writes its
+    pid in it for usage(). Waiters also take a
+    lock file from a bounded pool: when it is full the request is refused at once (429), and a waiter
+    that does not get a slot within `timeout` seconds gives up (503).
+    """
+
+    def __init__(self, directory: Path, slots: int, queue_max: int, timeout: float, retry_after: int):
+        self.directory = Path(directory)
+        self.slots = slots
+        self.queue_max = queue_max
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _try_lock(self, prefix: str, count: int) -> Optional[int]:
+        # départ décalé par pid pour ne pas toujours tester les mêmes fichiers en premier
+        offset = os.getpid() % count if count else 0
+        for step in range(count):
+            path = self.directory / f"{prefix}-{(offset + step) % count}.lock"
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            # pid du détenteur écrit dans le fichier : usage() le lit sans jamais prendre le verrou
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, str(os.getpid()).encode(), 0)
+            return fd
+        return None
+
+    @staticmethod
+    def _release(fd: Optional[int]):
+        if fd is None:
+            return
+        try:
+            os.ftruncate(fd, 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _enter_queue(self) -> int:
+        waiter = self._try_lock("wait", self.queue_max) if self.queue_max > 0 else None
+        if waiter is None:
+            record_compile_slots("rejected")
+            logger.warning("Compile queue full", extra={"slots": self.slots, "queue_max": self.queue_max})
+            raise CompileSlotUnavailable(429, self.retry_after, "Trop de compilations en attente, réessayez plus tard.")
+        return waiter
+
+    def _timed_out(self):
+        record_compile_slots("timeouts")
+        logger.warning("Compile slot wait timed out", extra={"slots": self.slots, "timeout": self.timeout})
+        return CompileSlotUnavailable(503, self.retry_after, "Serveur de compilation saturé, réessayez plus tard.")
+
+    @contextmanager
+    def slot(self):
+        if self.slots <= 0:
+            yield
+            return
+        started = time.monotonic()
+        fd = self._try_lock("slot", self.slots)
+        if fd is None:
+            waiter = self._enter_queue()
+            try:
+                delay = 0.02
+                while fd is None:
+                    if time.monotonic() - started >= self.timeout:
+                        raise self._timed_out()
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.25)
+                    fd = self._try_lock("slot", self.slots)
+            finally:
+                self._release(waiter)
+        record_compile_slots("acquired", time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(fd)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Same as slot() for the async views: the wait does not block the event loop."""
+        if self.slots <= 0:
+            yield
+            return
+        started = time.monotonic()
+        fd = self._try_lock("slot", self.slots)
+        if fd is None:
+            waiter = self._enter_queue()
+            try:
+                delay = 0.02
+                while fd is None:
+                    if time.monotonic() - started >= self.timeout:
+                        raise self._timed_out()
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 0.25)
+                    fd = self._try_lock("slot", self.slots)
+            finally:
+                self._release(waiter)
+        record_compile_slots("acquired", time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(fd)
+
+    def _held(self, prefix: str, count: int) -> int:
+        """Files holding the pid of a live process; read only, so a metrics scrape never competes for a slot."""
+        held = 0
+        for idx in range(count):
+            try:
+                pid = int((self.directory / f"{prefix}-{idx}.lock").read_text() or 0)
+            except (OSError, ValueError):
+                continue
+            if pid and _alive(pid):
+                held += 1
+        return held
+
+    def usage(self) -> dict:
+        """Current occupancy of the node (slots in use and requests waiting)."""
+        return {
+            "capacity": self.slots,
+            "in_use": self._held("slot", self.slots),
+            "waiting": self._held("wait", self.queue_max),
+            "queue_max": self.queue_max,
+        }
+
+
+def _alive(pid: int) -> bool:
+    # un détenteur tué garde son pid dans le fichier, mais le noyau a libéré son verrou
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_slots = {"config": None, "instance": None}
+
+
+def get_compile_slots() -> CompileSlots:
+    """Limiter configured from the LATEX_COMPILE_* settings (rebuilt when they change)."""
+    config = (
+        str(getattr(settings, "LATEX_COMPILE_SLOT_DIR", Path(settings.LATEX_CACHE_DIR) / "compile_slots")),
+        int(getattr(settings, "LATEX_COMPILE_SLOTS", os.cpu_count() or 2)),
+        int(getattr(settings, "LATEX_COMPILE_QUEUE_MAX", 16)),
+        float(getattr(settings, "LATEX_COMPILE_QUEUE_TIMEOUT", 10)),
+        int(getattr(settings, "LATEX_COMPILE_RETRY_AFTER", 5)),
+    )
+    if _slots["config"] != config:
+        _slots["instance"] = CompileSlots(Path(config[0]), *config[1:])
+        _slots["config"] = config
+    return _slots["instance"]
+
+
+def compile_slot():
+    return get_compile_slots().slot()
+
+
+def acompile_slot():
+    return get_compile_slots().aslot()
@@ -0,0 +1,40 @@
+import logging
+from typing import Optional
+
+from celery import group
+from django.conf import settings
+from django.db import transaction
+
+from documents.services.metrics import mark_pending_many
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_documents(doc_ids: list, queue: Optional[str] = None, chunk_size: Optional[int] = None) -> int:
+    """Sends one generate_document task per document, as Celery groups of `chunk_size` messages."""
+    from documents.tasks import generate_document
+
+    chunk_size = max(1, chunk_size or int(getattr(settings, "DOCUMENT_ENQUEUE_CHUNK", 500)))
+    options = {"queue": queue} if queue else {}
+    for start in range(0, len(doc_ids), chunk_size):
+        chunk = doc_ids[start : start + chunk_size]
+        group(generate_document.si(doc_id) for doc_id in chunk).apply_async(**options)
+    return len(doc_ids)
+
+
+def enqueue_on_commit(doc_ids: list, queue: Optional[str] = None):
+    """
+    Enqueues the documents once the current transaction commits, so no worker can pick a row that does not
+    exist yet (nothing is sent on rollback). Pending metrics follow in one pipeline.
+    """
+    doc_ids = list(doc_ids)
+
+    def _send():
+        enqueue_documents(doc_ids, queue=queue)
+        try:
+            mark_pending_many(doc_ids)
+        except Exception as exc:
+            # les tâches sont parties : une métrique manquante ne doit pas faire échouer la requête
+            logger.warning("Pending metrics not updated: %s", exc, extra={"count": len(doc_ids)})
+
+    transaction.on_commit(_send)
@@ -0,0 +1,137 @@
+import hashlib
+import io
+import logging
+from pathlib import Path
+
+from documents.services.latex_renderer import LatexMultiRenderer, LatexRenderer
+from documents.services.templates import get_template
+
+logger = logging.getLogger(__name__)
+
+# Drapeau posé par les templates qui savent produire leurs couches séparément
+LAYER_FLAG = "\\DOCGENLAYER"
+# Valeurs propres à chaque élève : absentes du fond, seules imprimées dans l'overlay
+VARIABLE_KEYS = ("STUDENT_NAME", "CLASS_LEVEL", "RANK", "CLASS_SIZE", "AVG")
+# Macros du builder communes à toute la classe (les autres décrivent l'élève et sont écartées du fond)
+STATIC_MACROS = (
+    "TRIMCODE",
+    "TERMLABEL",
+    "ACADEMICYEAR",
+    "SCHOOLNAME",
+    "SCHOOLCOUNTRY",
+    "SCHOOLCITY",
+    "SCHOOLADDRESS",
+    "SCHOOLPHONE",
+    "SCHOOLEMAIL",
+    "TODAYVAL",
+    "logopath",
+)
+# Paliers visuels du tableau d'honneur (titre, couleurs, distinction) : (borne haute exclue, moyenne représentative)
+HONOR_TIERS = ((14.0, "10"), (16.0, "15"), (None, "17"))
+
+
+def supports_layers(template_path: Path) -> bool:
+    return LAYER_FLAG in get_template(template_path).source
+
+
+def honor_tier(average) -> str:
+    """Representative average of the visual tier the template derives from `average`."""
+    try:
+        value = float(average)
+    except (TypeError, ValueError):
+        value = 15.0  # valeur par défaut du template
+    for upper, representative in HONOR_TIERS:
+        if upper is None or value < upper:
+            return representative
+    return HONOR_TIERS[-1][1]
+
+
+def _background_context(context: dict, average: str) -> dict:
+    neutral = {key: value for key, value in context.items() if key != "_MACROS"}
+    neutral.update({key: "" for key in VARIABLE_KEYS})
+    neutral["AVG"] = average
+    macros = context.get("_MACROS") or {}
+    neutral["_MACROS"] = {name: macros[name] for name in STATIC_MACROS if name in macros}
+    return neutral
+
+
+def stamp_pdf(background: bytes, overlay: bytes) -> bytes:
+    """
+    Draws the first page of `overlay` on top of the first page of `background`.
+    Both documents keep their own font subsets: pypdf renames clashing resources while merging.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(background)))
+    writer.pages[0].merge_page(PdfReader(io.BytesIO(overlay)).pages[0])
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+class HonorOverlayRenderer:
+    """
+    Renders honor boards as a cached static background (one per school/term/tier, compiled once and kept
+    in the PDF cache) stamped with a light overlay holding the student's variable text.
+    The overlays of a group are compiled together in a single XeLaTeX run.
+    """
+
+    def __init__(self, template_path: Path, contexts: list):
+        if not contexts:
+            raise ValueError("HonorOverlayRenderer requires at least one context")
+        self.template_path = Path(template_path)
+        self.contexts = contexts
+        self._backgrounds = {}
+
+    def background_key(self, context: dict, average: str = "") -> str:
+        """Digest of the background source: contexts sharing it only differ by their variable text."""
+        neutral = _background_context(context, average)
+        macros = neutral.pop("_MACROS")
+        tex = get_template(self.template_path).render(neutral, LatexRenderer._macro_block(macros))
+        return hashlib.sha256(tex.encode("utf-8")).hexdigest()
+
+    def background(self, context: dict) -> bytes:
+        average = honor_tier(context.get("AVG"))
+        key = self.background_key(context, average)
+        if key not in self._backgrounds:
+            renderer = LatexRenderer(self.template_path, _background_context(context, average))
+            renderer.layer = "background"
+            renderer.aux_seed_key = f"{renderer.aux_seed_key}-background"
+            self._backgrounds[key] = renderer.generate()
+        return self._backgrounds[key]
+
+    def generate(self) -> list:
+        groups = {}
+        for idx, context in enumerate(self.contexts):
+            groups.setdefault(self.background_key(context), []).append(idx)
+
+        results = [None] * len(self.contexts)
+        for indexes in groups.values():
+            overlays = HonorOverlayLayer(self.template_path, [self.contexts[idx] for idx in indexes]).generate()
+            for idx, overlay in zip(indexes, overlays):
+                results[idx] = stamp_pdf(self.background(self.contexts[idx]), overlay)
+        logger.info(
+            "Honor boards stamped",
+            extra={"count": len(self.contexts), "groups": len(groups), "backgrounds": len(self._backgrounds)},
+        )
+        return results
+
+
+class HonorOverlayLayer(LatexMultiRenderer):
+    """Overlay pages only (transparent, variable text at the background's positions), one per context."""
+
+    def __init__(self, template_path: Path, contexts: list):
+        super().__init__(template_path, contexts)
+        self.layer = "overlay"
+        self.aux_seed_key = f"{self.aux_seed_key}-overlay"
+
+    def _context_block(self, context: dict, macros) -> str:
+        average = context.get("AVG")
+        values = {
+            "STUDENTNAME": context.get("STUDENT_NAME", ""),
+            "CLASSLEVEL": context.get("CLASS_LEVEL", ""),
+            "RANKVAL": context.get("RANK", ""),
+            "CLASSSIZEVAL": context.get("CLASS_SIZE", ""),
+            "moyenne": "" if average is None else average,
+        }
+        return self._macro_block(values)
@@ -0,0 +1,163 @@
+import mimetypes
+import re
+from pathlib import Path
+from typing import Optional
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from documents.services.pdf_cache import file_digest
+
+CHUNK_SIZE = 64 * 1024
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_etag(path) -> str:
+    """Strong ETag from the file content (sha256, memoized per process on size + mtime)."""
+    digest = file_digest(path)
+    return quote_etag(digest[:32]) if digest else ""
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple]:
+    """(start, end) inclusive for a single `bytes=` range, "invalid" when unsatisfiable, None to ignore it."""
+    match = _RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None  # multi-plages ou syntaxe inconnue : réponse complète (permis par la RFC 9110)
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return "invalid"
+    return start, end
+
+
+def _iter_range(path, start: int, length: int):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _slice(chunks, start: int, length: int):
+    """Bytes [start, start + length) of a regenerated chunk stream: what comes before is read and dropped."""
+    for chunk in chunks:
+        if length <= 0:
+            break
+        if start >= len(chunk):
+            start -= len(chunk)
+            continue
+        piece = chunk[start : start + length]
+        start = 0
+        length -= len(piece)
+        yield piece
+
+
+def _if_range_matches(request, etag: str, mtime: Optional[int]) -> bool:
+    value = request.META.get("HTTP_IF_RANGE")
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith("W/"):
+        return value == etag  # comparaison forte : un ETag faible ne valide jamais une plage
+    return mtime is not None and parse_http_date_safe(value) == mtime
+
+
+def _with_validators(response, etag: str, mtime: Optional[int], filename: Optional[str]):
+    if etag:
+        response["ETag"] = etag
+    if mtime is not None:
+        response["Last-Modified"] = http_date(mtime)
+    response["Accept-Ranges"] = "bytes"
+    if filename:
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _requested_range(request, etag: str, mtime: Optional[int], size: int):
+    if request.method in ("GET", "HEAD") and request.META.get("HTTP_RANGE") and _if_range_matches(request, etag, mtime):
+        return _parse_range(request.META["HTTP_RANGE"], size)
+    return None
+
+
+def _unsatisfiable(size: int) -> HttpResponse:
+    response = HttpResponse(status=416)
+    response["Content-Range"] = f"bytes */{size}"
+    return response
+
+
+def file_response(request, path, content_type: Optional[str] = None, filename: Optional[str] = None):
+    """
+    Serves a stored file with ETag / Last-Modified validators: 304 on If-None-Match / If-Modified-Since,
+    206 for a single byte range (If-Range honoured), 416 when the range cannot be satisfied.
+    `filename` adds an attachment Content-Disposition.
+    """
+    path = Path(path)
+    stat = path.stat()
+    size = stat.st_size
+    mtime = int(stat.st_mtime)
+    etag = file_etag(path)
+    content_type = content_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+    def _validators(response):
+        return _with_validators(response, etag, mtime, filename)
+
+    conditional = get_conditional_response(request, etag=etag or None, last_modified=mtime)
+    if conditional is not None:
+        return _validators(conditional)
+
+    byte_range = _requested_range(request, etag, mtime, size)
+    if byte_range == "invalid":
+        return _validators(_unsatisfiable(size))
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(_iter_range(path, start, end - start + 1), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+        return _validators(response)
+
+    # réponse complète : FileResponse laisse le serveur utiliser sendfile (wsgi.file_wrapper)
+    response = FileResponse(open(path, "rb"), content_type=content_type)
+    response["Content-Length"] = str(size)
+    return _validators(response)
+
+
+def stream_response(request, chunks, size: int, etag: str, content_type: str, filename: Optional[str] = None):
+    """
+    Same validators as file_response for content generated on the fly: `chunks()` must yield the same `size`
+    bytes at every call (it is called again for each request), a byte range is cut out of that stream.
+    """
+    conditional = get_conditional_response(request, etag=etag or None)
+    if conditional is not None:
+        return _with_validators(conditional, etag, None, filename)
+
+    byte_range = _requested_range(request, etag, None, size)
+    if byte_range == "invalid":
+        return _with_validators(_unsatisfiable(size), etag, None, filename)
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(_slice(chunks(), start, end - start + 1), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+        return _with_validators(response, etag, None, filename)
+
+    response = StreamingHttpResponse(chunks(), content_type=content_type)
+    response["Content-Length"] = str(size)
+    return _with_validators(response, etag, None, filename)
+
+
+def media_file(document_root, path: str) -> Optional[Path]:
+    """Resolves `path` under `document_root`; None if it escapes the root or is not a regular file."""
+    root = Path(document_root).resolve()
+    candidate = (root / path.lstrip("/")).resolve()
+    if root != candidate and root not in candidate.parents:
+        return None
+    return candidate if candidate.is_file() else None
@@ -0,0 +1,138 @@
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from documents.services.pdf_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+# Marqueur posé dans une version remplacée ; supprimée à la publication suivante une fois ce délai écoulé
+# (les compilations en cours gardent leur lien symbolique valide)
+SUPERSEDED_MARKER = ".superseded"
+SUPERSEDED_GRACE_SECONDS = 3600
+
+_versions: dict = {}  # source -> (signature des mtimes, version)
+
+
+def assets_root() -> Path:
+    return Path(getattr(settings, "LATEX_CACHE_DIR", Path(tempfile.gettempdir()) / "docgen_latex")) / "assets"
+
+
+def _tree_signature(source: Path) -> tuple:
+    """(path, mtime, size) of every directory and file of the tree, from stat only (no file read)."""
+    entries = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        # mtime du répertoire : ajout, suppression ou renommage d'un fichier
+        entries.append((root, os.stat(root).st_mtime_ns, 0))
+        for name in sorted(files):
+            st = os.stat(Path(root) / name)
+            entries.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(entries)
+
+
+def asset_version(source: Path) -> str:
+    """
+    Content version of an assets tree (relative paths + file digests), memoised on the tree's mtimes and sizes:
+    files are only hashed again after a change.
+    """
+    signature = _tree_signature(source)
+    cached = _versions.get(str(source))
+    if cached and cached[0] == signature:
+        return cached[1]
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            path = Path(root) / name
+            digest.update(f"{path.relative_to(source).as_posix()}:{file_digest(path)}\0".encode())
+    version = digest.hexdigest()[:16]
+    _versions[str(source)] = (signature, version)
+    return version
+
+
+def retire_versions(root: Path, name: str, current: Path) -> int:
+    """
+    Marks the other `<name>-<version>` copies as superseded and deletes those superseded for more than
+    SUPERSEDED_GRACE_SECONDS. Returns the number of deleted directories.
+    """
+    (current / SUPERSEDED_MARKER).unlink(missing_ok=True)
+    now = time.time()
+    deleted = 0
+    for path in root.glob(f"{name}-*"):
+        if path == current or not path.is_dir() or len(path.name) != len(name) + 17:
+            continue
+        marker = path / SUPERSEDED_MARKER
+        try:
+            superseded = marker.stat().st_mtime
+        except FileNotFoundError:
+            marker.touch()
+            continue
+        if now - superseded > SUPERSEDED_GRACE_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+            deleted += 1
+    if deleted:
+        logger.info("Superseded LaTeX assets removed", extra={"name": name, "deleted": deleted})
+    return deleted
+
+
+def shared_asset_dir(source) -> Optional[Path]:
+    """
+    Returns a read-only copy of `source` under LATEX_CACHE_DIR/assets/<name>-<version>, built once per
+    content version and shared by every render (a modified asset yields a new directory, the previous ones
+    are removed by retire_versions).
+    """
+    source = Path(source)
+    if not source.is_dir():
+        return None
+    root = assets_root()
+    known = _versions.get(str(source))
+    target = root / f"{source.name}-{asset_version(source)}"
+    if target.is_dir() and known and root / f"{source.name}-{known[1]}" == target:
+        return target
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / ".build.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if target.is_dir():
+            # version déjà publiée (autre processus, ou retour à un contenu antérieur)
+            retire_versions(root, source.name, target)
+            return target
+        build_dir = Path(tempfile.mkdtemp(prefix=".build-", dir=root))
+        try:
+            shutil.copytree(source, build_dir, dirs_exist_ok=True)
+            for dirpath, _, files in os.walk(build_dir):
+                for name in files:
+                    os.chmod(Path(dirpath) / name, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.chmod(build_dir, 0o755)
+            os.replace(build_dir, target)
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+        retire_versions(root, source.name, target)
+    logger.info("Shared LaTeX assets published", extra={"source": str(source), "target": str(target)})
+    return target
+
+
+def link_assets(source, dest: Path):
+    """
+    Exposes `source` as dest (e.g. <tmpdir>/assets) through a symlink to the shared versioned copy,
+    so relative `assets/...` paths keep working; falls back to a plain copy if symlinks are unavailable.
+    """
+    if dest.exists() or dest.is_symlink():
+        return
+    try:
+        shared = shared_asset_dir(source)
+        if shared is None:
+            return
+        os.symlink(shared, dest, target_is_directory=True)
+    except OSError as exc:
+        logger.warning("Shared assets unavailable, copying instead: %s", exc)
+        shutil.copytree(source, dest)
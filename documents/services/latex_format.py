@@ -0,0 +1,222 @@
+import fcntl
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Commandes de préambule purement statiques (chargement de classe/paquets) que l'on peut figer dans un .fmt.
+# Les polices (\setmainfont, \IfFontExistsTF…) restent dans le document : XeTeX ne sait pas dumper les polices natives.
+_DUMPABLE_PREFIXES = ("\\documentclass", "\\usepackage", "\\RequirePackage", "\\usetikzlibrary")
+
+# Mémo process : (template, mtime, theme mtime) -> clé du format
+_format_keys: dict = {}
+
+
+def _statements(preamble: str):
+    """
+    Yields (text, is_dumpable) for each top-level statement of the preamble.
+    A dumpable statement may span several lines (e.g. \\usepackage[\\n a4paper,\\n]{geometry}).
+    """
+    lines = preamble.splitlines(keepends=True)
+    idx = 0
+    while idx < len(lines):
+        line = lines[idx]
+        stripped = line.lstrip()
+        if not stripped.startswith(_DUMPABLE_PREFIXES):
+            yield line, False
+            idx += 1
+            continue
+        buf = [line]
+        depth = _depth(line)
+        while depth > 0 and idx + 1 < len(lines):
+            idx += 1
+            buf.append(lines[idx])
+            depth += _depth(lines[idx])
+        text = "".join(buf)
+        yield text, "<<" not in text and depth == 0
+        idx += 1
+
+
+def _depth(text: str) -> int:
+    code = text.split("%", 1)[0]
+    return code.count("{") + code.count("[") - code.count("}") - code.count("]")
+
+
+def split_preamble(tex: str) -> tuple:
+    """
+    Returns (documentclass, static_lines) extracted from the template preamble.
+    documentclass is "" when the template cannot be precompiled.
+    """
+    head = tex.split("\\begin{document}", 1)[0]
+    documentclass = ""
+    static_lines = []
+    for text, dumpable in _statements(head):
+        if not dumpable:
+            continue
+        if text.lstrip().startswith("\\documentclass"):
+            if documentclass:
+                return "", []
+            documentclass = text
+        elif documentclass:
+            static_lines.append(text)
+    return documentclass, static_lines
+
+
+def strip_documentclass(tex: str, documentclass: str) -> str:
+    """Removes the \\documentclass statement already contained in the precompiled format."""
+    if not documentclass or documentclass not in tex:
+        return tex
+    return tex.replace(documentclass, "% documentclass: format précompilé\n", 1)
+
+
+@functools.lru_cache(maxsize=4)
+def engine_version(binary: str) -> str:
+    try:
+        result = subprocess.run([binary, "--version"], capture_output=True, text=True, timeout=15, check=True)
+    except Exception as exc:
+        logger.warning("Unable to read XeLaTeX version: %s", exc)
+        return ""
+    return (result.stdout.splitlines() or [""])[0].strip()
+
+
+def format_dir() -> Path:
+    return Path(getattr(settings, "LATEX_CACHE_DIR", Path(tempfile.gettempdir()) / "docgen_latex")) / "formats"
+
+
+def _file_digest(path) -> str:
+    if not path:
+        return ""
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except OSError:
+        return ""
+
+
+def format_key(template_path: Path, doc_type: str, preamble: str, binary: str) -> str:
+    theme_file = getattr(settings, "LATEX_THEME_FILES", {}).get(doc_type)
+    digest = hashlib.sha256()
+    digest.update(preamble.encode("utf-8"))
+    digest.update(engine_version(binary).encode("utf-8"))
+    digest.update(_file_digest(theme_file).encode("utf-8"))
+    return f"{template_path.stem}-{digest.hexdigest()[:20]}"
+
+
+def ensure_format(template_path: Path, doc_type: str) -> Optional[dict]:
+    """
+    Builds (once) the XeLaTeX format holding the static preamble of a template and returns
+    {"name", "dir", "documentclass"} to start each compile from it, or None when disabled/unavailable.
+    The cache key covers the preamble, the engine version and the theme file, so any change rebuilds it.
+    """
+    if not getattr(settings, "LATEX_FORMAT_CACHE", True):
+        return None
+    template_path = Path(template_path)
+    binary = getattr(settings, "XELATEX_BIN", "xelatex")
+    theme_file = getattr(settings, "LATEX_THEME_FILES", {}).get(doc_type)
+    try:
+        theme_mtime = Path(theme_file).stat().st_mtime_ns if theme_file else 0
+    except OSError:
+        theme_mtime = 0
+    try:
+        memo_key = (str(template_path), template_path.stat().st_mtime_ns, doc_type, theme_mtime)
+    except OSError:
+        return None
+
+    cached = _format_keys.get(memo_key)
+    if cached is None:
+        documentclass, static_lines = split_preamble(template_path.read_text(encoding="utf-8"))
+        if not documentclass:
+            return None
+        preamble = documentclass + "".join(static_lines)
+        cached = {
+            "name": format_key(template_path, doc_type, preamble, binary),
+            "documentclass": documentclass,
+            "preamble": preamble,
+        }
+        _format_keys[memo_key] = cached
+
+    target_dir = format_dir()
+    fmt_file = target_dir / f"{cached['name']}.fmt"
+    if format_disabled(target_dir, cached["name"]):
+        return None
+    if not fmt_file.exists() and not _build_format(target_dir, cached["name"], cached["preamble"], binary):
+        return None
+    return {"name": cached["name"], "dir": target_dir, "documentclass": cached["documentclass"]}
+
+
+def format_disabled(target_dir: Path, name: str) -> bool:
+    """True while a `.failed` marker younger than LATEX_FORMAT_FAILED_TTL exists (an expired one is removed)."""
+    marker = Path(target_dir) / f"{name}.failed"
+    try:
+        age = time.time() - marker.stat().st_mtime
+    except OSError:
+        return False
+    if age < int(getattr(settings, "LATEX_FORMAT_FAILED_TTL", 3600)):
+        return True
+    # marqueur expiré : on retente le format (nouvelle construction si besoin)
+    marker.unlink(missing_ok=True)
+    return False
+
+
+def mark_format_failed(fmt: dict, reason: str):
+    """
+    Disables a format that breaks compiles so the next documents use the full preamble, for
+    LATEX_FORMAT_FAILED_TTL seconds.
+    """
+    try:
+        (Path(fmt["dir"]) / f"{fmt['name']}.failed").write_text(reason[:2000], encoding="utf-8")
+    except OSError:
+        pass
+
+
+def _build_format(target_dir: Path, name: str, preamble: str, binary: str) -> bool:
+    target_dir.mkdir(parents=True, exist_ok=True)
+    lock_path = target_dir / f"{name}.lock"
+    with open(lock_path, "w") as lock:
+        # Un seul worker construit le format, les autres attendent puis le réutilisent
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if (target_dir / f"{name}.fmt").exists():
+                return True
+            if format_disabled(target_dir, name):
+                return False
+            build_dir = Path(tempfile.mkdtemp(prefix="latexfmt_", dir=target_dir))
+            try:
+                source = build_dir / f"{name}.ltx"
+                source.write_text(preamble + "\\dump\n", encoding="utf-8")
+                subprocess.run(
+                    [
+                        binary,
+                        "-ini",
+                        "-interaction=nonstopmode",
+                        "-halt-on-error",
+                        f"-jobname={name}",
+                        "&xelatex",
+                        source.name,
+                    ],
+                    cwd=build_dir,
+                    check=True,
+                    capture_output=True,
+                    timeout=120,
+                )
+                os.replace(build_dir / f"{name}.fmt", target_dir / f"{name}.fmt")
+                logger.info("LaTeX format built", extra={"format": name, "dir": str(target_dir)})
+                return True
+            except Exception as exc:
+                # Marqueur d'échec : on ne retente pas à chaque document, compilation classique en repli
+                (target_dir / f"{name}.failed").write_text(str(exc), encoding="utf-8")
+                logger.warning("Unable to build LaTeX format %s, falling back to full preamble: %s", name, exc)
+                return False
+            finally:
+                shutil.rmtree(build_dir, ignore_errors=True)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
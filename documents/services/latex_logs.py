@@ -0,0 +1,307 @@
+import atexit
+import fcntl
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_EXTENSIONS = (".log", ".compile.log", ".tex")
+INDEX_NAME = "index.json"
+# Marge au-delà de LATEX_LOG_SEGMENT_SECONDS avant de considérer un segment ouvert comme abandonné
+ABANDONED_GRACE_SECONDS = 600
+
+
+def log_root() -> Path:
+    log_dir = getattr(settings, "LATEX_LOG_DIR", None)
+    if not log_dir:
+        # fallback vers media/latex_logs
+        log_dir = Path(getattr(settings, "MEDIA_ROOT", Path("."))) / "latex_logs"
+    return Path(log_dir)
+
+
+class SegmentIndex:
+    """
+    JSON index of the segment files ({relative path: {created, closed, bytes, records, failures}}),
+    shared by every process through a file lock; purges read it instead of stat-ing the tree.
+    Written only when a segment opens or closes: counters of an open segment stay at zero until then.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.path = root / INDEX_NAME
+
+    def _locked(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        lock = open(self.root / ".index.lock", "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def load(self) -> dict:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries: dict):
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(entries, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def update(self, mutate):
+        """Applies mutate(entries) under the lock and saves; returns mutate's result."""
+        with self._locked():
+            entries = self.load()
+            result = mutate(entries)
+            self._save(entries)
+            return result
+
+
+class SegmentWriter:
+    """Appends gzip members (one JSON record each) to a per-process segment, rolled by size or age."""
+
+    def __init__(self, root: Path, max_bytes: int, max_age: int):
+        self.root = root
+        self.index = SegmentIndex(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._current = {}  # doc_type -> (relative path, created)
+        # Compteurs du segment ouvert, reportés dans l'index à sa clôture (pas d'écriture d'index par enregistrement)
+        self._counts = {}  # doc_type -> {"records", "failures"}
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _segment(self, doc_type: str) -> Path:
+        rel, created = self._current.get(doc_type, (None, 0))
+        if rel:
+            path = self.root / rel
+            try:
+                size = path.stat().st_size
+            except OSError:
+                size = None
+            if size is not None and size < self.max_bytes and time.time() - created < self.max_age:
+                return path
+            self._close(rel, size or 0, self._counts.pop(doc_type, {}))
+        created = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(created))
+        self._seq += 1
+        rel = f"{doc_type}/segment-{stamp}-{os.getpid()}-{self._seq}.jsonl.gz"
+        (self.root / doc_type).mkdir(parents=True, exist_ok=True)
+
+        def _register(entries):
+            entries[rel] = {"created": created, "closed": None, "bytes": 0, "records": 0, "failures": 0}
+
+        self.index.update(_register)
+        self._current[doc_type] = (rel, created)
+        self._counts[doc_type] = {"records": 0, "failures": 0}
+        return self.root / rel
+
+    def _close(self, rel: str, size: int, counts: dict):
+        def _mark(entries):
+            if rel in entries:
+                entries[rel].update(counts, closed=time.time(), bytes=size)
+
+        self.index.update(_mark)
+
+    def write(self, record: dict):
+        payload = gzip.compress((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        doc_type = record["doc_type"]
+        with self._lock:
+            path = self._segment(doc_type)
+            # Membres gzip concaténés : le segment reste lisible à tout moment (zcat)
+            with open(path, "ab") as fh:
+                fh.write(payload)
+            counts = self._counts[doc_type]
+            counts["records"] += 1
+            counts["failures"] += int(record["failed"])
+
+    def close_all(self):
+        with self._lock:
+            for doc_type, (rel, _) in self._current.items():
+                try:
+                    size = (self.root / rel).stat().st_size
+                except OSError:
+                    size = 0
+                self._close(rel, size, self._counts.get(doc_type, {}))
+            self._current.clear()
+            self._counts.clear()
+
+
+class LatexLogArchiver:
+    """
+    Keeps every failure (written synchronously so it survives a worker crash) and a sample of successes
+    (LATEX_LOG_SAMPLE_RATE), compressed into rolling segments by a background thread.
+    """
+
+    def __init__(self, root: Path, sample_rate: float, max_bytes: int, max_age: int):
+        self.root = root
+        self.sample_rate = sample_rate
+        self.writer = SegmentWriter(root, max_bytes, max_age)
+        self.pid = os.getpid()
+        self._queue = queue.Queue(maxsize=1000)
+        self._thread = None
+
+    def should_archive(self, failed: bool) -> bool:
+        return failed or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def archive(self, doc_type: str, name: str, workdir: Path, stem: str, failed: bool):
+        if not self.should_archive(failed):
+            return
+        files = {}
+        for ext in ARCHIVED_EXTENSIONS:
+            src = workdir / f"{stem}{ext}"
+            try:
+                files[ext] = src.read_text(encoding="utf-8", errors="ignore")
+            except OSError:
+                continue
+        if not files:
+            return
+        record = {"ts": time.time(), "doc_type": doc_type, "name": name, "failed": failed, "files": files}
+        if failed:
+            self._write(record)
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            logger.warning("LaTeX log archive queue full, dropping sampled log", extra={"name": name})
+
+    def _write(self, record: dict):
+        try:
+            self.writer.write(record)
+        except OSError as exc:
+            logger.warning("Unable to archive LaTeX log: %s", exc)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="latex-log-archiver", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                self._write(record)
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0):
+        """Waits (bounded) for queued records; used at exit and in tests."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+_archiver: Optional[LatexLogArchiver] = None
+_archiver_lock = threading.Lock()
+
+
+def get_log_archiver() -> LatexLogArchiver:
+    global _archiver
+    root = log_root()
+    if _archiver is not None and _archiver.pid == os.getpid() and _archiver.root == root:
+        return _archiver
+    with _archiver_lock:
+        if _archiver is None or _archiver.pid != os.getpid() or _archiver.root != root:
+            _archiver = LatexLogArchiver(
+                root,
+                sample_rate=float(getattr(settings, "LATEX_LOG_SAMPLE_RATE", 0.05)),
+                max_bytes=int(getattr(settings, "LATEX_LOG_SEGMENT_BYTES", 16 * 1024 * 1024)),
+                max_age=int(getattr(settings, "LATEX_LOG_SEGMENT_SECONDS", 3600)),
+            )
+    return _archiver
+
+
+@atexit.register
+def _flush_on_exit():
+    if _archiver is not None and _archiver.pid == os.getpid():
+        _archiver.flush()
+        _archiver.writer.close_all()
+
+
+def read_segment(path: Path) -> Iterator[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _owner_alive(rel: str) -> bool:
+    """False when the process named in the segment file (segment-<stamp>-<pid>-<seq>) is gone."""
+    try:
+        pid = int(Path(rel).name.split("-")[-2])
+        os.kill(pid, 0)
+    except (ValueError, IndexError):
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _close_abandoned(root: Path, rel: str, entry: dict, now: float, max_age: int) -> bool:
+    """
+    Closes in the index an open segment whose writer is gone (dead pid, or past the roll age plus a grace
+    period: a live writer rolls it before its next append). Size and close date come from the file itself.
+    """
+    if entry["created"] + max_age + ABANDONED_GRACE_SECONDS > now and _owner_alive(rel):
+        return False
+    try:
+        stat = (root / rel).stat()
+        entry.update(closed=stat.st_mtime, bytes=stat.st_size)
+    except OSError:
+        entry.update(closed=entry["created"], bytes=0)
+    return True
+
+
+def purge_segments(root: Path, days: Optional[int] = None, max_bytes: Optional[int] = None,
+                   max_segments: Optional[int] = None) -> int:
+    """
+    Deletes the oldest closed segments by age, total size or count, using the index only.
+    Open segments (closed is None) are kept, as their writer would recreate the file outside the index, unless
+    their writer is gone (never closed them: SIGKILL, OOM, no atexit in a prefork child).
+    Returns the number of deleted segments.
+    """
+    index = SegmentIndex(root)
+    now = time.time()
+    cutoff = now - days * 86400 if days else None
+    max_age = int(getattr(settings, "LATEX_LOG_SEGMENT_SECONDS", 3600))
+
+    def _purge(entries):
+        ordered = sorted(entries.items(), key=lambda item: item[1]["created"], reverse=True)
+        keep, drop = [], []
+        total = 0
+        for rel, entry in ordered:
+            if entry["closed"] is None and not _close_abandoned(root, rel, entry, now, max_age):
+                # segment encore ouvert par un writer actif : conservé (et compté dans le budget)
+                keep.append(rel)
+                total += entry["bytes"]
+                continue
+            last = entry["closed"]
+            too_old = cutoff is not None and last < cutoff
+            too_many = max_segments is not None and len(keep) >= max_segments
+            too_big = max_bytes is not None and total + entry["bytes"] > max_bytes
+            if too_old or too_many or too_big:
+                drop.append(rel)
+            else:
+                keep.append(rel)
+                total += entry["bytes"]
+        for rel in drop:
+            try:
+                (root / rel).unlink()
+            except FileNotFoundError:
+                pass
+            entries.pop(rel, None)
+        return len(drop)
+
+    return index.update(_purge)
@@ -0,0 +1,66 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+# Messages LaTeX/paquets demandant explicitement une passe supplémentaire
+RERUN_PATTERN = re.compile(
+    r"(Rerun to get|Label\(s\) may have changed|Please rerun LaTeX|rerunfilecheck Warning)",
+    re.IGNORECASE,
+)
+
+
+def aux_digest(aux_path: Path) -> Optional[str]:
+    try:
+        return hashlib.sha256(aux_path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def needs_rerun(log_path: Path, aux_before: Optional[str], aux_after: Optional[str]) -> bool:
+    """
+    A new pass is needed when the log asks for it, or when the pass changed the .aux
+    (labels, positions tikz `remember picture`, …) that the next pass would read.
+    """
+    if aux_after is not None and aux_after != aux_before:
+        return True
+    try:
+        log_text = log_path.read_text(encoding="utf-8", errors="ignore")
+    except OSError:
+        return False
+    return bool(RERUN_PATTERN.search(log_text))
+
+
+def _seed_path(seed_key: str) -> Path:
+    base = Path(getattr(settings, "LATEX_CACHE_DIR", Path(tempfile.gettempdir()) / "docgen_latex"))
+    safe_key = re.sub(r"[^A-Za-z0-9_.-]+", "_", seed_key)
+    return base / "aux" / f"{safe_key}.aux"
+
+
+def seed_aux(seed_key: str, aux_path: Path) -> Optional[str]:
+    """
+    Copies the last converged .aux of the same template into the workdir.
+    For identical layouts (overlays at fixed positions) the first pass then converges directly.
+    """
+    src = _seed_path(seed_key)
+    try:
+        shutil.copyfile(src, aux_path)
+    except OSError:
+        return None
+    return aux_digest(aux_path)
+
+
+def store_aux_seed(seed_key: str, aux_path: Path):
+    dest = _seed_path(seed_key)
+    try:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_suffix(f".{os.getpid()}.tmp")
+        shutil.copyfile(aux_path, tmp)
+        os.replace(tmp, dest)
+    except OSError:
+        pass
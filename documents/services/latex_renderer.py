@@ -1,17 +1,40 @@
+import asyncio
+import io
+import os
+import re
+import resource
 import shutil
 import subprocess
 import tempfile
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 import logging
 
 from django.conf import settings
 
+from documents.services.latex_assets import link_assets
+from documents.services.latex_logs import get_log_archiver
+from documents.services.latex_format import ensure_format, mark_format_failed, strip_documentclass
+from documents.services.latex_passes import aux_digest, needs_rerun, seed_aux, store_aux_seed
+from documents.services.metrics import record_latex_passes
+from documents.services.pdf_cache import get_pdf_cache
+from documents.services.templates import get_template
+from documents.services.workdir_pool import get_workdir_pool
+
 
 class LatexRenderError(Exception):
     pass
 
 
+def _children_cpu() -> float:
+    # CPU (user + sys) des sous-processus terminés : le delta autour d'une passe donne le coût de XeLaTeX.
+    # En async, des compilations concurrentes peuvent s'y ajouter ; la valeur reste indicative.
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
 class LatexRenderer:
     """
     Renders a LaTeX template by simple placeholder replacement and compiles it with XeLaTeX.
@@ -22,24 +45,42 @@ class LatexRenderer:
         self.template_path = Path(template_path)
         self.context = context
         self.logger = logging.getLogger(__name__)
+        # Format XeLaTeX précompilé du préambule statique (cf. latex_format.ensure_format)
+        self.format = None
         try:
             self.passes = max(1, int(context.get("XELATEX_PASSES", getattr(settings, "LATEX_DEFAULT_PASSES", 1))))
         except Exception:
             self.passes = 1
+        # Borne haute des passes quand la convergence est activée (LATEX_CONVERGENCE)
+        try:
+            self.max_passes = max(1, int(context.get("XELATEX_MAX_PASSES", getattr(settings, "LATEX_MAX_PASSES", 3))))
+        except Exception:
+            self.max_passes = 3
+        self.passes_run = 0
+        self.timeout = 60
+        # Cache PDF adressé par contenu (désactivé pour les compilations groupées)
+        self.cacheable = True
+        self.cache_hit = False
+        # Clé de l'.aux convergé réutilisé pour amorcer la compilation suivante du même template
+        self.aux_seed_key = f"{self.template_path.stem}-{context.get('DOC_TYPE', 'generic')}"
+        # Couche à produire pour les templates qui la gèrent (\DOCGENLAYER : background / overlay)
+        self.layer = None
+        # Durées par étape (render_tex) et par passe XeLaTeX (mur / CPU), lues par profiling.DocumentProfile
+        self.timings = {}
+        self.pass_timings = []
 
-    def render_tex(self, dest_dir: Path) -> Path:
-        tex = self.template_path.read_text(encoding="utf-8")
+    def _prepare_context(self, raw_context: dict, dest_dir: Path) -> tuple:
+        """Returns (context, macros) with default assets resolved; assets are made available in dest_dir."""
         # Inject template directory and default assets so logos/filigranes remain accessibles dans le tmpdir
-        context = dict(self.context)
+        context = dict(raw_context)
         asset_dir = self.template_path.parent
         context.setdefault("ASSET_DIR", str(asset_dir))
-        # Copie éventuelle du dossier assets fourni (logos/filigranes) dans le tmpdir pour conserver les chemins relatifs
-        assets_source = Path(context.get("ASSET_DIR"))
-        assets_dest = dest_dir / "assets"
-        if assets_source.exists() and assets_source.is_dir():
+        # Dossier assets partagé (versionné par contenu) exposé en lien symbolique dans le tmpdir
+        # pour conserver les chemins relatifs assets/... des thèmes
+        assets_source = Path(context.get("ASSET_DIR") or asset_dir)
+        if assets_source.is_dir():
             try:
-                if not assets_dest.exists():
-                    shutil.copytree(assets_source, assets_dest)
+                link_assets(assets_source, dest_dir / "assets")
             except Exception:
                 pass
 
@@ -64,22 +105,25 @@ class LatexRenderer:
         )
 
         macros = context.pop("_MACROS", None)
+        return context, macros
 
-        for key, value in context.items():
-            tex = tex.replace(f"<<{key}>>", str(value))
+    @staticmethod
+    def _macro_block(macros) -> str:
+        if not macros:
+            return ""
+        macro_lines = [f"% injected"]
+        for name, value in macros.items():
+            # ignore macro names containing spaces
+            if not name:
+                continue
+            macro_lines.append(f"\\def\\{name}{{{value}}}")
+        return "\n".join(macro_lines) + "\n"
 
-        if macros:
-            macro_lines = [f"% injected"]
-            for name, value in macros.items():
-                # ignore macro names containing spaces
-                if not name:
-                    continue
-                macro_lines.append(f"\\def\\{name}{{{value}}}")
-            macro_block = "\n".join(macro_lines) + "\n"
-            if "\\begin{document}" in tex:
-                tex = tex.replace("\\begin{document}", macro_block + "\\begin{document}", 1)
-            else:
-                tex = macro_block + tex
+    def _write_tex(self, tex: str, dest_dir: Path, context: dict) -> Path:
+        if self.format:
+            tex = strip_documentclass(tex, self.format["documentclass"])
+        if self.layer:
+            tex = f"\\def\\DOCGENLAYER{{{self.layer}}}\n" + tex
 
         out = dest_dir / "document.tex"
         out.write_text(tex, encoding="utf-8")
@@ -96,7 +140,82 @@ class LatexRenderer:
         )
         return out
 
+    def render_tex(self, dest_dir: Path) -> Path:
+        template = get_template(self.template_path)
+        context, macros = self._prepare_context(self.context, dest_dir)
+        template.report(context.keys())
+        tex = template.render(context, self._macro_block(macros))
+        return self._write_tex(tex, dest_dir, context)
+
     def compile_pdf(self, tex_path: Path) -> Path:
+        steps = self._compile_steps(tex_path)
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    result = self._run_pass(*request)
+                except subprocess.CalledProcessError as exc:
+                    request = steps.throw(exc)
+                else:
+                    request = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+
+    async def acompile_pdf(self, tex_path: Path) -> Path:
+        """Same passes as compile_pdf, each XeLaTeX run being an asyncio subprocess."""
+        steps = self._compile_steps(tex_path)
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    result = await self._arun_pass(*request)
+                except subprocess.CalledProcessError as exc:
+                    request = steps.throw(exc)
+                else:
+                    request = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+
+    def _run_pass(self, cmd: list, cwd: Path, env) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            cmd,
+            cwd=cwd,
+            check=True,
+            capture_output=True,
+            timeout=self.timeout,
+            text=True,
+            env=env,
+        )
+
+    async def _arun_pass(self, cmd: list, cwd: Path, env) -> subprocess.CompletedProcess:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=cwd,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=self.timeout)
+        except BaseException as exc:
+            # Timeout ou annulation (client déconnecté) : on tue XeLaTeX avant de propager
+            if proc.returncode is None:
+                proc.kill()
+                await asyncio.shield(proc.wait())
+            if isinstance(exc, asyncio.TimeoutError):
+                raise subprocess.TimeoutExpired(cmd, self.timeout) from exc
+            raise
+        stdout = stdout.decode("utf-8", errors="replace")
+        stderr = stderr.decode("utf-8", errors="replace")
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+    def _compile_steps(self, tex_path: Path):
+        """
+        Pass loop shared by compile_pdf and acompile_pdf: yields (cmd, cwd, env) for each XeLaTeX run
+        and receives the CompletedProcess (or a thrown CalledProcessError); returns the PDF path.
+        """
         workdir = tex_path.parent
         cmd = [
             getattr(settings, "XELATEX_BIN", "xelatex"),
@@ -104,16 +223,29 @@ class LatexRenderer:
             "-halt-on-error",
             tex_path.name,
         ]
+        env = None
+        if self.format:
+            cmd.insert(1, f"-fmt={self.format['name']}")
+            # séparateur final : kpathsea complète avec les chemins de formats par défaut
+            env = dict(os.environ, TEXFORMATS=f"{self.format['dir']}{os.pathsep}")
         run_logs = []
+        converge = getattr(settings, "LATEX_CONVERGENCE", True)
+        max_passes = self.max_passes if converge else self.passes
+        aux_path = workdir / f"{tex_path.stem}.aux"
+        seed_key = self.aux_seed_key
+        aux_before = seed_aux(seed_key, aux_path) if converge else None
+        converged = False
+        self.passes_run = 0
+        self.pass_timings = []
         try:
-            for idx in range(self.passes):
-                result = subprocess.run(
-                    cmd,
-                    cwd=workdir,
-                    check=True,
-                    capture_output=True,
-                    timeout=60,
-                    text=True,
+            for idx in range(max_passes):
+                started, cpu_before = time.perf_counter(), _children_cpu()
+                result = yield (cmd, workdir, env)
+                self.pass_timings.append(
+                    {
+                        "seconds": round(time.perf_counter() - started, 4),
+                        "cpu": round(_children_cpu() - cpu_before, 4),
+                    }
                 )
                 run_logs.append(
                     f"""PASS {idx+1}: {' '.join(cmd)}
@@ -124,6 +256,18 @@ STDERR:
 {result.stderr}
 """.strip()
                 )
+                self.passes_run = idx + 1
+                if not converge:
+                    continue
+                aux_after = aux_digest(aux_path)
+                if not needs_rerun(workdir / f"{tex_path.stem}.log", aux_before, aux_after):
+                    converged = True
+                    break
+                aux_before = aux_after
+            if converged and aux_path.exists():
+                store_aux_seed(seed_key, aux_path)
+            if converge:
+                record_latex_passes(self.template_path.stem, self.passes_run)
             log_path = workdir / f"{tex_path.stem}.compile.log"
             log_path.write_text("\n\n".join(run_logs).strip(), encoding="utf-8")
             self.logger.info(
@@ -131,9 +275,20 @@ STDERR:
                 extra={
                     "tex": str(tex_path),
                     "pdf": str(workdir / (tex_path.stem + ".pdf")),
+                    "passes": self.passes_run,
+                    "converged": converged,
                 },
             )
         except subprocess.CalledProcessError as exc:
+            if self.format:
+                # Nouvel essai avec le préambule complet ; une erreur de données (caractère non échappé,
+                # image manquante) échoue aussi et ne doit pas désactiver le format pour tout le nœud
+                failed_format, self.format = self.format, None
+                self.logger.warning("XeLaTeX failed with precompiled format %s, retrying without it", failed_format["name"])
+                pdf_path = yield from self._compile_steps(self.render_tex(workdir))
+                # le préambule complet compile : c'est bien le format qui est en cause
+                mark_format_failed(failed_format, f"{exc}\n{exc.stdout or ''}")
+                return pdf_path
             log_path = workdir / (tex_path.stem + ".log")
             log_content = ""
             if log_path.exists():
@@ -155,34 +310,177 @@ STDERR:
             raise LatexRenderError(log_content or str(exc)) from exc
         return workdir / (tex_path.stem + ".pdf")
 
-    def generate(self) -> bytes:
+    def _collect(self, pdf_path: Path):
+        return pdf_path.read_bytes()
+
+    @contextmanager
+    def _workdir(self):
+        pool = get_workdir_pool()
+        if pool is not None:
+            # Répertoire pré-créé (tmpfs si possible), nettoyé et rendu au pool après usage
+            with pool.lease() as workdir:
+                yield workdir
+            return
         tmpdir = Path(
             tempfile.mkdtemp(
                 prefix="latexdoc_",
                 dir=getattr(settings, "LATEX_TMP_DIR", None) or None,
             )
         )
-        tex = None
         try:
-            tex = self.render_tex(tmpdir)
-            pdf_path = self.compile_pdf(tex)
-            return pdf_path.read_bytes()
+            yield tmpdir
         finally:
-            # Sauvegarde optionnelle des logs/tex dans un répertoire dédié (y compris en cas d'erreur)
-            log_dir = getattr(settings, "LATEX_LOG_DIR", None)
-            if not log_dir:
-                # fallback vers media/latex_logs
-                log_dir = Path(getattr(settings, "MEDIA_ROOT", Path("."))) / "latex_logs"
-            if tex is not None and log_dir:
-                # Sous-dossier par type de document (si fourni)
-                doc_type = str(self.context.get("DOC_TYPE", "generic")).lower()
-                log_dir = Path(log_dir) / doc_type
-                log_dir.mkdir(parents=True, exist_ok=True)
-                suffix = tmpdir.name
-                for ext in (".log", ".compile.log", ".tex"):
-                    src = tmpdir / f"{tex.stem}{ext}"
-                    if src.exists():
-                        dest = log_dir / f"{tex.stem}_{suffix}{ext}"
-                        shutil.copy(src, dest)
-                        self.logger.info("LaTeX log archived", extra={"src": str(src), "dest": str(dest)})
             shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def generate(self) -> bytes:
+        with self._workdir() as tmpdir:
+            tex = None
+            failed = True
+            try:
+                self.format = ensure_format(self.template_path, str(self.context.get("DOC_TYPE", "")))
+                started = time.perf_counter()
+                tex = self.render_tex(tmpdir)
+                self.timings["render_tex"] = round(time.perf_counter() - started, 4)
+                cache_key, cached = self._cache_lookup(tex)
+                if cached is not None:
+                    return cached
+                result = self._cache_store(cache_key, self._collect(self.compile_pdf(tex)))
+                failed = False
+                return result
+            finally:
+                self._archive_logs(tmpdir, tex, failed)
+
+    async def agenerate(self) -> bytes:
+        """
+        Async variant of generate() for ASGI views: XeLaTeX runs through asyncio subprocesses, so the
+        event loop is free during the compile; cancelling the task (client gone) kills the compile.
+        """
+        with self._workdir() as tmpdir:
+            tex = None
+            failed = True
+            try:
+                # La construction éventuelle du format (long) part dans un thread
+                self.format = await asyncio.to_thread(
+                    ensure_format, self.template_path, str(self.context.get("DOC_TYPE", ""))
+                )
+                started = time.perf_counter()
+                tex = self.render_tex(tmpdir)
+                self.timings["render_tex"] = round(time.perf_counter() - started, 4)
+                cache_key, cached = self._cache_lookup(tex)
+                if cached is not None:
+                    return cached
+                result = self._cache_store(cache_key, self._collect(await self.acompile_pdf(tex)))
+                failed = False
+                return result
+            finally:
+                self._archive_logs(tmpdir, tex, failed)
+
+    def _cache_lookup(self, tex: Path) -> tuple:
+        """Returns (cache_key, cached_pdf); both None when the PDF cache does not apply."""
+        cache = get_pdf_cache() if self.cacheable else None
+        if not cache:
+            return None, None
+        cache_key = cache.key(
+            tex,
+            self.template_path,
+            asset_paths=(self.context.get("LOGO_PATH"), self.context.get("WATERMARK_PATH")),
+            asset_dir=self.context.get("ASSET_DIR") or self.template_path.parent,
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            self.cache_hit = True
+            self.logger.info("LaTeX PDF served from cache", extra={"template": str(self.template_path)})
+        return cache_key, cached
+
+    def _cache_store(self, cache_key, result):
+        if cache_key:
+            get_pdf_cache().put(cache_key, result)
+        return result
+
+    def _archive_logs(self, tmpdir: Path, tex, failed: bool):
+        # Échecs toujours conservés, succès échantillonnés (LATEX_LOG_SAMPLE_RATE), écrits hors chemin critique
+        if tex is None or self.cache_hit:
+            return
+        doc_type = str(self.context.get("DOC_TYPE", "generic")).lower()
+        try:
+            get_log_archiver().archive(doc_type, self.template_path.stem, tmpdir, tex.stem, failed)
+        except Exception as exc:
+            self.logger.warning("LaTeX log archival failed: %s", exc)
+
+
+# Marqueur écrit dans le .log à la fin de chaque groupe de pages (nombre de pages expédiées jusque-là)
+GROUP_MARK = "DOCGEN-GROUP-END:"
+GROUP_MARK_PATTERN = re.compile(re.escape(GROUP_MARK) + r"(\d+)")
+
+
+class LatexMultiRenderer(LatexRenderer):
+    """
+    Compiles N contexts of the same template in a single XeLaTeX run (one page group per context)
+    and splits the resulting PDF back into one PDF per context.
+    Only templates driven by macros injected before \\begin{document} are supported: the preamble is
+    shared, so it must not contain <<PLACEHOLDER>> values (see supports()).
+    """
+
+    def __init__(self, template_path: Path, contexts: list):
+        if not contexts:
+            raise ValueError("LatexMultiRenderer requires at least one context")
+        super().__init__(template_path, contexts[0])
+        self.contexts = contexts
+        self.timeout = 60 + 2 * len(contexts)
+        self.cacheable = False
+        self.aux_seed_key = f"{self.aux_seed_key}-multi{len(contexts)}"
+
+    @staticmethod
+    def supports(template_path: Path) -> bool:
+        template = get_template(template_path)
+        return template.has_document and "<<" not in template.source.partition("\\begin{document}")[0]
+
+    def render_tex(self, dest_dir: Path) -> Path:
+        template = get_template(self.template_path)
+        first_context, _ = self._prepare_context(self.contexts[0], dest_dir)
+        parts = [template.head.render(first_context), "\\begin{document}\n"]
+        for idx, raw_context in enumerate(self.contexts, start=1):
+            context, macros = self._prepare_context(raw_context, dest_dir)
+            parts.append(f"% ===== document {idx}/{len(self.contexts)} =====\n")
+            parts.append(self._context_block(context, macros))
+            parts.append(template.body.render(context))
+            # Fin de groupe : on expédie la page, on note la frontière et on retire les hooks de page
+            # ajoutés par le corps (\\AddToHook{shipout/foreground}) pour qu'ils ne s'accumulent pas.
+            parts.append(
+                "\n\\clearpage\n"
+                f"\\typeout{{{GROUP_MARK}\\the\\ReadonlyShipoutCounter}}\n"
+                "\\RemoveFromHook{shipout/foreground}[top-level]\n"
+            )
+        parts.append("\\end{document}\n")
+        return self._write_tex("".join(parts), dest_dir, first_context)
+
+    def _context_block(self, context: dict, macros) -> str:
+        """Definitions injected before each page group (the builder macros by default)."""
+        return self._macro_block(macros)
+
+    def _collect(self, pdf_path: Path) -> list:
+        log_text = pdf_path.with_suffix(".log").read_text(encoding="utf-8", errors="ignore")
+        boundaries = [int(value) for value in GROUP_MARK_PATTERN.findall(log_text)]
+        if len(boundaries) != len(self.contexts):
+            raise LatexRenderError(
+                f"Multi-document split failed: {len(boundaries)} page groups for {len(self.contexts)} documents"
+            )
+        return split_pdf(pdf_path.read_bytes(), boundaries)
+
+
+def split_pdf(pdf_bytes: bytes, boundaries: list) -> list:
+    """Splits a PDF at cumulative page counts (e.g. [1, 3] -> pages [0:1], [1:3])."""
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    outputs = []
+    start = 0
+    for end in boundaries:
+        writer = PdfWriter()
+        for page in reader.pages[start:end]:
+            writer.add_page(page)
+        buf = io.BytesIO()
+        writer.write(buf)
+        outputs.append(buf.getvalue())
+        start = end
+    return outputs
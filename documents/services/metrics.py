@@ -1,16 +1,24 @@
+import os
 import time
 from typing import Optional
 
 import redis
 from django.conf import settings
 
+# Client Redis (et son pool de connexions) par processus et par URL : pas de nouvelle connexion à chaque métrique
+_clients = {}
+
 
 def _client():
     """
     Reuse a single Redis client. Default to CELERY_BROKER_URL if it is Redis, otherwise fallback to localhost.
     """
     url = getattr(settings, "METRICS_REDIS_URL", None) or getattr(settings, "CELERY_BROKER_URL", "redis://localhost:6379/0")
-    return redis.Redis.from_url(url)
+    key = (os.getpid(), url)
+    cli = _clients.get(key)
+    if cli is None:
+        cli = _clients[key] = redis.Redis.from_url(url)
+    return cli
 
 
 def _safe_int(value) -> int:
@@ -23,7 +31,18 @@ def _safe_int(value) -> int:
 def reset_metrics():
     cli = _client()
     pipe = cli.pipeline()
-    pipe.delete("metrics:pending", "metrics:ready", "metrics:failed", "metrics:pending_z", "metrics:timing")
+    pipe.delete(
+        "metrics:pending",
+        "metrics:ready",
+        "metrics:failed",
+        "metrics:pending_z",
+        "metrics:timing",
+        "metrics:latex_passes",
+        "metrics:pdf_cache",
+        "metrics:stages",
+        "metrics:compile_slots",
+        "metrics:single_flight",
+    )
     pipe.set("metrics:start", time.time())
     pipe.execute()
 
@@ -46,6 +65,21 @@ def mark_pending(doc_id: int):
     pipe.execute()
 
 
+def mark_pending_many(doc_ids):
+    """
+    Same as mark_pending for many documents in a single pipeline (batch creation).
+    """
+    if not doc_ids:
+        return
+    cli = _client()
+    _ensure_start(cli)
+    now = time.time()
+    pipe = cli.pipeline()
+    pipe.incrby("metrics:pending", len(doc_ids))
+    pipe.zadd("metrics:pending_z", {doc_id: now for doc_id in doc_ids})
+    pipe.execute()
+
+
 def mark_ready(doc_id: int, duration_seconds: float):
     """
     Move a doc from pending to ready and update timing stats.
@@ -71,6 +105,163 @@ def mark_failed(doc_id: int):
     pipe.execute()
 
 
+def record_latex_passes(template: str, passes: int):
+    """
+    Counts XeLaTeX compiles per template and how many needed more than one pass.
+    Best effort: a Redis outage must never fail a compile.
+    """
+    try:
+        cli = _client()
+        pipe = cli.pipeline()
+        pipe.hincrby("metrics:latex_passes", f"{template}:compiles", 1)
+        pipe.hincrby("metrics:latex_passes", f"{template}:passes", max(passes, 0))
+        if passes > 1:
+            pipe.hincrby("metrics:latex_passes", f"{template}:extra", passes - 1)
+            pipe.hincrby("metrics:latex_passes", f"{template}:rerun", 1)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def record_pdf_cache(event: str, amount: int = 1):
+    """Counts rendered-PDF cache hits / misses / evictions (best effort)."""
+    try:
+        _client().hincrby("metrics:pdf_cache", event, amount)
+    except Exception:
+        pass
+
+
+def record_workdir_pool(pid: int, stats: dict):
+    """Per-process gauges of the LaTeX workdir pool; the key expires when the worker disappears."""
+    try:
+        cli = _client()
+        key = f"metrics:workdir_pool:{pid}"
+        pipe = cli.pipeline()
+        pipe.hset(key, mapping=stats)
+        pipe.expire(key, 600)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def record_compile_slots(event: str, wait_seconds: Optional[float] = None):
+    """Counts compile slot acquisitions / rejections (429) / timeouts (503) and the time spent waiting."""
+    try:
+        pipe = _client().pipeline()
+        pipe.hincrby("metrics:compile_slots", event, 1)
+        if wait_seconds is not None:
+            pipe.hincrbyfloat("metrics:compile_slots", "wait_seconds", max(wait_seconds, 0))
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def record_single_flight(event: str):
+    """Counts stream compiles run as leader vs requests served by another in-flight compile (best effort)."""
+    try:
+        _client().hincrby("metrics:single_flight", event, 1)
+    except Exception:
+        pass
+
+
+def record_stages(doc_type: str, stages: dict):
+    """
+    Accumulates per-stage timings of a document (see profiling.DocumentProfile) per doc type:
+    count, seconds, plus queries/db_seconds/cpu/passes when the stage reports them. Best effort.
+    """
+    try:
+        cli = _client()
+        pipe = cli.pipeline()
+        for stage, values in stages.items():
+            prefix = f"{doc_type}:{stage}"
+            pipe.hincrby("metrics:stages", f"{prefix}:count", 1)
+            for name in ("seconds", "db_seconds", "cpu"):
+                if name in values:
+                    pipe.hincrbyfloat("metrics:stages", f"{prefix}:{name}", max(values[name], 0))
+            if "queries" in values:
+                pipe.hincrby("metrics:stages", f"{prefix}:queries", values["queries"])
+            if "passes" in values:
+                pipe.hincrby("metrics:stages", f"{prefix}:passes", len(values["passes"]))
+        pipe.execute()
+    except Exception:
+        pass
+
+
+_STAGE_DURATIONS = {"seconds": "avg_ms", "db_seconds": "avg_db_ms", "cpu": "avg_cpu_ms"}
+
+
+def _stages(cli) -> dict:
+    totals = {}
+    for field, value in cli.hgetall("metrics:stages").items():
+        doc_type, stage, name = field.decode().split(":", 2)
+        totals.setdefault(doc_type, {}).setdefault(stage, {})[name] = float(value)
+    stats = {}
+    for doc_type, stages in totals.items():
+        for stage, values in stages.items():
+            count = int(values.pop("count", 0))
+            entry = {"count": count}
+            for name, total in values.items():
+                # moyennes par document, durées en ms
+                if name in _STAGE_DURATIONS:
+                    entry[_STAGE_DURATIONS[name]] = round(total * 1000 / count, 1) if count else None
+                else:
+                    entry[f"avg_{name}"] = round(total / count, 2) if count else None
+            stats.setdefault(doc_type, {})[stage] = entry
+    return stats
+
+
+def _workdir_pool(cli) -> dict:
+    totals = {"workers": 0, "capacity": 0, "in_use": 0, "fallbacks": 0, "bytes_in_flight": 0, "memory_backed": 0}
+    for key in cli.scan_iter(match="metrics:workdir_pool:*"):
+        raw = cli.hgetall(key)
+        totals["workers"] += 1
+        for name in ("capacity", "in_use", "fallbacks", "bytes_in_flight", "memory_backed"):
+            totals[name] += _safe_int(raw.get(name.encode(), 0))
+    return totals
+
+
+def _compile_slots(cli) -> dict:
+    from documents.services.compile_slots import get_compile_slots
+
+    raw = cli.hgetall("metrics:compile_slots")
+    stats = {name: _safe_int(raw.get(name.encode(), 0)) for name in ("acquired", "rejected", "timeouts")}
+    wait = float(raw.get(b"wait_seconds", 0) or 0)
+    stats["avg_wait_ms"] = round(wait / stats["acquired"] * 1000, 1) if stats["acquired"] else None
+    # occupation instantanée du nœud qui sert la requête (verrous de fichiers)
+    try:
+        stats.update(get_compile_slots().usage())
+    except OSError:
+        pass
+    return stats
+
+
+def _single_flight(cli) -> dict:
+    raw = cli.hgetall("metrics:single_flight")
+    stats = {name: _safe_int(raw.get(name.encode(), 0)) for name in ("leader", "coalesced", "remote")}
+    requests = sum(stats.values())
+    stats["saved_ratio"] = round((stats["coalesced"] + stats["remote"]) / requests, 3) if requests else None
+    return stats
+
+
+def _pdf_cache(cli) -> dict:
+    raw = cli.hgetall("metrics:pdf_cache")
+    stats = {name: _safe_int(raw.get(name.encode(), 0)) for name in ("hits", "misses", "evictions")}
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else None
+    return stats
+
+
+def _latex_passes(cli) -> dict:
+    stats = {}
+    for field, value in cli.hgetall("metrics:latex_passes").items():
+        template, _, name = field.decode().rpartition(":")
+        stats.setdefault(template, {"compiles": 0, "passes": 0, "extra": 0, "rerun": 0})[name] = _safe_int(value)
+    for values in stats.values():
+        compiles = values["compiles"]
+        values["rerun_ratio"] = round(values["rerun"] / compiles, 3) if compiles else None
+    return stats
+
+
 def get_metrics(timeout_seconds: int = 120) -> Optional[dict]:
     """
     Returns counters and timings from Redis. If Redis is unreachable, returns None.
@@ -99,6 +290,12 @@ def get_metrics(timeout_seconds: int = 120) -> Optional[dict]:
             "total_seconds": round(total, 2),
             "elapsed_seconds": elapsed,
             "docs_per_sec": rate,
+            "latex_passes": _latex_passes(cli),
+            "pdf_cache": _pdf_cache(cli),
+            "workdir_pool": _workdir_pool(cli),
+            "stages": _stages(cli),
+            "compile_slots": _compile_slots(cli),
+            "single_flight": _single_flight(cli),
         }
     except Exception:
         return None
@@ -0,0 +1,151 @@
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from django.conf import settings
+
+from documents.services.latex_format import engine_version
+from documents.services.metrics import record_pdf_cache
+
+logger = logging.getLogger(__name__)
+
+# Mémo process des empreintes de fichiers : path -> ((size, mtime_ns), sha256)
+_file_digests: dict = {}
+
+
+def file_digest(path) -> str:
+    """sha256 of a file, recomputed only when its size or mtime changes."""
+    if not path:
+        return ""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ""
+    signature = (stat.st_size, stat.st_mtime_ns)
+    cached = _file_digests.get(str(path))
+    if cached and cached[0] == signature:
+        return cached[1]
+    try:
+        digest = hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except OSError:
+        return ""
+    _file_digests[str(path)] = (signature, digest)
+    return digest
+
+
+def _dir_files(path) -> list:
+    if not path or not Path(path).is_dir():
+        return []
+    return sorted(str(p) for p in Path(path).rglob("*") if p.is_file())
+
+
+class PdfCache:
+    """
+    Content-addressed cache of compiled PDFs on the local filesystem.
+    Entries are written atomically (tmp + rename) so several workers of the same node can share the
+    directory; least recently used entries are evicted once the directory exceeds max_bytes.
+    """
+
+    evict_interval = 30
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._last_evict = 0.0
+
+    def key(self, tex_path: Path, template_path: Path, asset_paths: Iterable = (), asset_dir=None) -> str:
+        digest = hashlib.sha256()
+        digest.update(Path(tex_path).read_bytes())
+        digest.update(b"\0template:" + file_digest(template_path).encode())
+        digest.update(b"\0engine:" + engine_version(getattr(settings, "XELATEX_BIN", "xelatex")).encode())
+        for path in sorted({str(p) for p in asset_paths if p}) + _dir_files(asset_dir):
+            digest.update(f"\0asset:{path}:{file_digest(path)}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.pdf"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            record_pdf_cache("misses")
+            return None
+        try:
+            # mtime = dernier accès, utilisé pour l'éviction LRU
+            os.utime(path)
+        except OSError:
+            pass
+        record_pdf_cache("hits")
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except OSError as exc:
+            logger.warning("Unable to store PDF in cache: %s", exc)
+            return
+        if time.monotonic() - self._last_evict > self.evict_interval:
+            self.evict()
+
+    def evict(self):
+        self._last_evict = time.monotonic()
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".evict.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return  # un autre worker est déjà en train d'évincer
+            entries = []
+            total = 0
+            for shard in os.scandir(self.root):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if not entry.name.endswith(".pdf"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            evicted = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                evicted += 1
+            record_pdf_cache("evictions", evicted)
+            logger.info("PDF cache evicted", extra={"evicted": evicted, "bytes": total})
+
+
+_cache: Optional[PdfCache] = None
+
+
+def get_pdf_cache() -> Optional[PdfCache]:
+    global _cache
+    if not getattr(settings, "LATEX_PDF_CACHE", True):
+        return None
+    root = Path(getattr(settings, "LATEX_CACHE_DIR", Path(tempfile.gettempdir()) / "docgen_latex")) / "pdf"
+    max_bytes = int(getattr(settings, "LATEX_PDF_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    if _cache is None or _cache.root != root or _cache.max_bytes != max_bytes:
+        _cache = PdfCache(root, max_bytes)
+    return _cache
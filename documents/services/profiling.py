@@ -0,0 +1,82 @@
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import connection
+
+from documents.services.metrics import record_stages
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """connection.execute_wrapper counting queries and the time spent in the database."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class DocumentProfile:
+    """
+    Per-document stage timings (build_context queries and DB time, render_tex, each XeLaTeX pass wall/CPU,
+    store_pdf), logged and aggregated into the Redis metrics.
+    """
+
+    def __init__(self, doc_type: str, **log_extra):
+        self.doc_type = doc_type
+        self.log_extra = log_extra
+        self.stages = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, queries: bool = False):
+        counter = QueryCounter() if queries else None
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter) if counter else nullcontext():
+                yield
+        finally:
+            entry = {"seconds": round(time.perf_counter() - started, 4)}
+            if counter:
+                entry.update(queries=counter.count, db_seconds=round(counter.seconds, 4))
+            self.stages[name] = entry
+
+    def add_renderer(self, renderer):
+        """Copies the timings collected by a LatexRenderer (render_tex and XeLaTeX passes)."""
+        if "render_tex" in renderer.timings:
+            self.stages["render_tex"] = {"seconds": renderer.timings["render_tex"]}
+        if renderer.cache_hit:
+            self.stages["pdf_cache"] = {"seconds": 0.0, "hit": True}
+        if renderer.pass_timings:
+            self.stages["xelatex"] = {
+                "seconds": round(sum(item["seconds"] for item in renderer.pass_timings), 4),
+                "cpu": round(sum(item["cpu"] for item in renderer.pass_timings), 4),
+                "passes": list(renderer.pass_timings),
+            }
+
+    def as_dict(self) -> dict:
+        return {"doc_type": self.doc_type, "total_seconds": round(time.perf_counter() - self._started, 4), **self.stages}
+
+    def finish(self):
+        """Logs the profile, warns when build_context exceeds LATEX_QUERY_BUDGET and records the metrics."""
+        profile = self.as_dict()
+        budget = getattr(settings, "LATEX_QUERY_BUDGET", 10)
+        queries = self.stages.get("build_context", {}).get("queries")
+        if budget and queries is not None and queries > budget:
+            logger.warning(
+                "build_context query budget exceeded",
+                extra={**self.log_extra, "queries": queries, "budget": budget},
+            )
+        logger.info("Document profile", extra={**self.log_extra, "profile": profile})
+        record_stages(self.doc_type, self.stages)
+        return profile
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from documents.services.metrics import _client, record_single_flight
+
+logger = logging.getLogger(__name__)
+
+# Durée de vie du résultat remis aux processus en attente (le lock, lui, suit LATEX_SINGLE_FLIGHT_TIMEOUT)
+RESULT_TTL = 30
+POLL_INTERVAL = 0.05
+# Suppression du verrou seulement s'il porte encore notre jeton (atomique côté Redis)
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+def _enabled() -> bool:
+    return getattr(settings, "LATEX_SINGLE_FLIGHT", True)
+
+
+def _redis_enabled() -> bool:
+    return getattr(settings, "LATEX_SINGLE_FLIGHT_REDIS", False)
+
+
+def _timeout() -> float:
+    return float(getattr(settings, "LATEX_SINGLE_FLIGHT_TIMEOUT", 60))
+
+
+class RedisFlight:
+    """
+    Cross-process half of the single flight: the leader holds `docgen:flight:<key>` (SET NX, token as value)
+    and hands its bytes over under `docgen:flight:<key>:<token>`. A waiter learns the token when its SET NX
+    fails; if it then sees the lock vanish without a result (leader failed or died), it tries to lead in turn.
+    """
+
+    def __init__(self, key: str):
+        self.lock_key = f"docgen:flight:{key}"
+        self.token: Optional[bytes] = None
+        self.cli = _client()
+
+    def acquire(self) -> bool:
+        """Takes the lock, or records the current leader's token in the same MULTI/EXEC (no lost hand-off)."""
+        token = uuid.uuid4().hex.encode()
+        pipe = self.cli.pipeline()
+        pipe.set(self.lock_key, token, nx=True, px=int(_timeout() * 1000))
+        pipe.get(self.lock_key)
+        acquired, current = pipe.execute()
+        self.token = token if acquired else current
+        return bool(acquired)
+
+    def _result_key(self) -> str:
+        return f"{self.lock_key}:{self.token.decode()}"
+
+    def publish(self, data: bytes):
+        self.cli.set(self._result_key(), data, ex=RESULT_TTL)
+        # résultat d'abord : un waiter qui voit le verrou disparaître trouve déjà le PDF
+        self.release()
+
+    def release(self):
+        """Drops the lock only if this leader still holds it (compare-and-delete in one Lua call)."""
+        self.cli.register_script(RELEASE_SCRIPT)(keys=[self.lock_key], args=[self.token])
+
+    def poll(self) -> tuple:
+        """("result", bytes) once the leader published, ("retry", None) if it vanished, else ("wait", None)."""
+        if self.token is None:
+            return "retry", None
+        current = self.cli.get(self.lock_key)
+        data = self.cli.get(self._result_key())
+        if data is not None:
+            return "result", data
+        if current != self.token:
+            return "retry", None
+        return "wait", None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent work: the first caller for a key runs it, the callers arriving meanwhile
+    get the same bytes (or the same exception). With LATEX_SINGLE_FLIGHT_REDIS the leaders of several processes
+    are coalesced as well through a Redis lock with result hand-off.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}  # (boucle asyncio, clé) -> [tâche, nombre d'attentes]
+
+    def do(self, key: str, fn) -> bytes:
+        if not _enabled():
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            record_single_flight("coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._run_distributed(key, fn) if _redis_enabled() else self._lead(fn)
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    @staticmethod
+    def _lead(fn) -> bytes:
+        record_single_flight("leader")
+        return fn()
+
+    @staticmethod
+    async def _alead(coro_fn) -> bytes:
+        record_single_flight("leader")
+        return await coro_fn()
+
+    def _run_distributed(self, key: str, fn) -> bytes:
+        deadline = time.monotonic() + _timeout()
+        while True:
+            try:
+                flight = RedisFlight(key)
+                acquired = flight.acquire()
+            except Exception as exc:
+                logger.warning("Single-flight Redis unavailable, compiling locally: %s", exc)
+                return self._lead(fn)
+            if acquired:
+                try:
+                    data = self._lead(fn)
+                except BaseException:
+                    flight.release()
+                    raise
+                flight.publish(data)
+                return data
+            state, data = "wait", None
+            while state == "wait":
+                if time.monotonic() > deadline:
+                    return self._lead(fn)
+                time.sleep(POLL_INTERVAL)
+                state, data = flight.poll()
+            if state == "result":
+                record_single_flight("remote")
+                return data
+
+    async def ado(self, key: str, coro_fn) -> bytes:
+        """
+        Async variant: the work runs in its own task shared by the waiters; it is cancelled (killing the
+        XeLaTeX subprocess) only when every waiting client has gone.
+        """
+        if not _enabled():
+            return await coro_fn()
+        slot_key = (asyncio.get_running_loop(), key)
+        entry = self._tasks.get(slot_key)
+        if entry is None:
+            runner = self._arun_distributed(key, coro_fn) if _redis_enabled() else self._alead(coro_fn)
+            entry = self._tasks[slot_key] = [asyncio.ensure_future(runner), 0]
+            entry[0].add_done_callback(lambda _task: self._tasks.pop(slot_key, None))
+        else:
+            record_single_flight("coalesced")
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                entry[0].cancel()
+            raise
+
+    async def _arun_distributed(self, key: str, coro_fn) -> bytes:
+        deadline = time.monotonic() + _timeout()
+        while True:
+            try:
+                flight = await sync_to_async(RedisFlight, thread_sensitive=False)(key)
+                acquired = await sync_to_async(flight.acquire, thread_sensitive=False)()
+            except Exception as exc:
+                logger.warning("Single-flight Redis unavailable, compiling locally: %s", exc)
+                return await self._alead(coro_fn)
+            if acquired:
+                try:
+                    data = await self._alead(coro_fn)
+                except BaseException:
+                    await sync_to_async(flight.release, thread_sensitive=False)()
+                    raise
+                await sync_to_async(flight.publish, thread_sensitive=False)(data)
+                return data
+            state, data = "wait", None
+            while state == "wait":
+                if time.monotonic() > deadline:
+                    return await self._alead(coro_fn)
+                await asyncio.sleep(POLL_INTERVAL)
+                state, data = await sync_to_async(flight.poll, thread_sensitive=False)()
+            if state == "result":
+                record_single_flight("remote")
+                return data
+
+
+single_flight = SingleFlight()
+
+
+def flight_key(doc_type: str, student_id: int, term: str) -> str:
+    return f"{doc_type}:{student_id}:{term}"
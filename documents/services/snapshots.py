@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from documents.models import Document, DocumentSnapshot
+from documents.services.builder import build_contexts
+from documents.services.pdf_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter quand la forme du contexte produit par le builder change : les snapshots plus anciens sont ignorés
+SNAPSHOT_VERSION = 1
+# Chemins absolus d'assets figés dans le contexte, revérifiés à chaque relecture du snapshot
+ASSET_KEYS = ("LOGO_PATH", "WATERMARK_PATH", "ASSET_DIR")
+
+
+def freeze_context(context: dict) -> dict:
+    """JSON-safe copy of a render context (Decimal/date values become strings, as the renderer prints them)."""
+    return json.loads(json.dumps(context, cls=DjangoJSONEncoder))
+
+
+def context_digest(frozen: dict) -> str:
+    return hashlib.sha256(json.dumps(frozen, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def _template_digest(doc_type: str) -> str:
+    template = getattr(settings, "LATEX_TEMPLATES", {}).get(doc_type)
+    return file_digest(template) if template else ""
+
+
+def save_snapshots(pairs) -> list:
+    """Stores (document, context) pairs, replacing previous snapshots, in one upsert. Returns the frozen contexts."""
+    snapshots = []
+    for doc, context in pairs:
+        frozen = freeze_context(context)
+        snapshots.append(
+            DocumentSnapshot(
+                document_id=doc.id,
+                version=SNAPSHOT_VERSION,
+                digest=context_digest(frozen),
+                template_digest=_template_digest(doc.doc_type),
+                context=frozen,
+            )
+        )
+    DocumentSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=["document"],
+        update_fields=["version", "digest", "template_digest", "context", "updated_at"],
+    )
+    return [snapshot.context for snapshot in snapshots]
+
+
+def load_snapshots(docs) -> dict:
+    """
+    Returns {document id: context} for the documents holding a usable snapshot, in one query.
+    Snapshots of stale documents (data changed since), of another SNAPSHOT_VERSION or whose asset files are gone
+    are skipped; a template changed since the snapshot is only logged.
+    """
+    doc_types = {doc.id: doc.doc_type for doc in docs}
+    contexts = {}
+    # is_stale lu en base (jointure, même requête) : l'instance passée peut dater d'avant la modification
+    snapshots = DocumentSnapshot.objects.filter(document_id__in=list(doc_types), document__is_stale=False)
+    for snapshot in snapshots:
+        if snapshot.version != SNAPSHOT_VERSION:
+            logger.info(
+                "Snapshot version outdated, rebuilding context",
+                extra={"document_id": snapshot.document_id, "version": snapshot.version},
+            )
+            continue
+        if snapshot.template_digest and snapshot.template_digest != _template_digest(doc_types[snapshot.document_id]):
+            logger.warning("Template changed since snapshot", extra={"document_id": snapshot.document_id})
+        missing = _missing_assets(snapshot.context)
+        if missing:
+            # assets re-préparés, logo changé ou cache nettoyé depuis : XeLaTeX échouerait sur ces chemins
+            logger.info(
+                "Snapshot assets missing, rebuilding context",
+                extra={"document_id": snapshot.document_id, "paths": missing},
+            )
+            continue
+        contexts[snapshot.document_id] = snapshot.context
+    return contexts
+
+
+def _missing_assets(context: dict) -> list:
+    """Asset paths frozen in a snapshot (logo, watermark, asset dir) that no longer exist on disk."""
+    paths = [context.get(key) for key in ASSET_KEYS]
+    paths.append((context.get("_MACROS") or {}).get("logopath"))
+    return [path for path in paths if path and not os.path.exists(path)]
+
+
+def contexts_for(docs, fresh: bool = False) -> list:
+    """
+    Render contexts of `docs`: frozen snapshot when one exists and the document is not stale (no schools query),
+    otherwise built from live data and snapshotted (clearing Document.is_stale). `fresh` rebuilds every context
+    from live data and replaces the snapshots.
+    """
+    docs = list(docs)
+    frozen = {} if fresh else load_snapshots(docs)
+    missing = [doc for doc in docs if doc.id not in frozen]
+    if missing:
+        # remis à zéro avant lecture : une modification pendant la construction reste signalée
+        Document.objects.filter(id__in=[doc.id for doc in missing], is_stale=True).update(is_stale=False, stale_since=None)
+        # le premier rendu part lui aussi du contexte figé : un re-rendu produit le même .tex
+        built = save_snapshots(zip(missing, build_contexts(missing)))
+        frozen.update((doc.id, context) for doc, context in zip(missing, built))
+    return [frozen[doc.id] for doc in docs]
+
+
+def _flatten(context: dict) -> dict:
+    flat = {key: value for key, value in context.items() if key != "_MACROS"}
+    flat.update((f"_MACROS.{name}", value) for name, value in (context.get("_MACROS") or {}).items())
+    return flat
+
+
+def diff_snapshot(doc: Document) -> dict:
+    """
+    Compares the snapshot of `doc` with a context rebuilt from live data.
+    Returns {key: {"snapshot": value, "live": value}} for the keys that differ (macros as "_MACROS.<name>").
+    """
+    snapshot = DocumentSnapshot.objects.get(document_id=doc.id)
+    live = _flatten(freeze_context(build_contexts([doc])[0]))
+    frozen = _flatten(snapshot.context)
+    return {
+        key: {"snapshot": frozen.get(key), "live": live.get(key)}
+        for key in sorted(set(frozen) | set(live))
+        if frozen.get(key) != live.get(key)
+    }
@@ -0,0 +1,119 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from django.db.models import Q
+from django.utils import timezone
+
+from documents.models import Document
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+# Portée -> lookup sur Document
+SCOPES = {
+    "student": "student_id",
+    "class": "student__klass_id",
+    "school": "student__klass__school_id",
+}
+CHUNK = 1000
+
+
+def _flush(pending) -> int:
+    """Marks the documents matching the pending (scope, id, term, doc_type) entries in grouped UPDATEs."""
+    groups = {}
+    for scope, object_id, term, doc_type in pending:
+        if object_id:
+            groups.setdefault((scope, term, doc_type), set()).add(object_id)
+    marked = 0
+    now = timezone.now()
+    for (scope, term, doc_type), ids in groups.items():
+        ids = sorted(ids)
+        for start in range(0, len(ids), CHUNK):
+            condition = Q(**{f"{SCOPES[scope]}__in": ids[start : start + CHUNK]})
+            if term:
+                condition &= Q(term=term)
+            if doc_type:
+                condition &= Q(doc_type=doc_type)
+            marked += Document.objects.filter(condition, is_stale=False).update(is_stale=True, stale_since=now)
+    return marked
+
+
+def mark_stale(scope: str, ids, term: Optional[str] = None, doc_type: Optional[str] = None) -> int:
+    """
+    Flags the documents of students / classes / schools (`scope`) as stale, optionally for one term or type.
+    Inside defer_staleness() the update is postponed to the end of the block.
+    """
+    entries = {(scope, object_id, term, doc_type) for object_id in ids}
+    pending = getattr(_state, "pending", None)
+    if pending is not None:
+        pending.update(entries)
+        return 0
+    return _flush(entries)
+
+
+@contextmanager
+def defer_staleness():
+    """Collects the documents to flag inside the block (imports, seeding) and flags them once on exit."""
+    if getattr(_state, "pending", None) is not None:
+        yield
+        return
+    _state.pending = set()
+    try:
+        yield
+    finally:
+        pending, _state.pending = _state.pending, None
+    marked = _flush(pending)
+    logger.info("Documents marked stale", extra={"entries": len(pending), "documents": marked})
+
+
+def stale_documents(term: Optional[str] = None, doc_type: Optional[str] = None):
+    """Stale documents not already queued, oldest edits first."""
+    docs = Document.objects.filter(is_stale=True).exclude(status="PENDING")
+    if term:
+        docs = docs.filter(term=term)
+    if doc_type:
+        docs = docs.filter(doc_type=doc_type)
+    return docs.order_by("stale_since", "id")
+
+
+def regenerate_stale(
+    term: Optional[str] = None,
+    doc_type: Optional[str] = None,
+    multi: bool = False,
+    multi_size: int = 60,
+    limit: Optional[int] = None,
+    queue: Optional[str] = None,
+) -> int:
+    """
+    Re-queues the stale documents with a context rebuilt from live data (fresh=True), per class with `multi`.
+    Returns the number of documents queued.
+    """
+    from documents.services.metrics import mark_pending_many
+    from documents.tasks import generate_document, generate_documents_bulk
+
+    docs = stale_documents(term, doc_type)
+    if limit:
+        docs = docs[:limit]
+    rows = list(docs.values_list("id", "student__klass_id", "doc_type"))
+    if not rows:
+        return 0
+    Document.objects.filter(id__in=[row[0] for row in rows]).update(status="PENDING", pdf_path="", completed_at=None)
+    mark_pending_many([row[0] for row in rows])
+    options = {"queue": queue} if queue else {}
+    if multi:
+        groups = {}
+        for doc_id, klass_id, kind in rows:
+            groups.setdefault((klass_id, kind), []).append(doc_id)
+        for doc_ids in groups.values():
+            for start in range(0, len(doc_ids), multi_size):
+                generate_documents_bulk.apply_async(
+                    args=[doc_ids[start : start + multi_size]], kwargs={"fresh": True}, **options
+                )
+    else:
+        for doc_id, _, _ in rows:
+            generate_document.apply_async(args=[doc_id], kwargs={"fresh": True}, **options)
+    logger.info("Stale documents queued", extra={"count": len(rows), "term": term, "doc_type": doc_type})
+    return len(rows)
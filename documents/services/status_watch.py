@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Iterable
+
+from documents.services.metrics import _client
+
+logger = logging.getLogger(__name__)
+
+# Publié par les workers à chaque changement de statut d'un document (payload : id du document)
+STATUS_CHANNEL = "docgen:documents:status"
+
+_listener = {"pid": None, "thread": None}
+_listener_lock = threading.Lock()
+_connected = threading.Event()
+_waiters = {}  # id de document -> ensemble de _Watch
+_waiters_lock = threading.Lock()
+
+
+def notify_status(doc_id: int):
+    """Wakes the long-polls waiting on this document, in every web process (best-effort)."""
+    try:
+        _client().publish(STATUS_CHANNEL, str(doc_id))
+    except Exception as exc:
+        logger.warning("Unable to publish document status: %s", exc, extra={"document_id": doc_id})
+
+
+class _Watch:
+    """Registration of one long-poll on a set of documents, resolved by the first notification for any of them."""
+
+    def __init__(self, doc_ids: Iterable[int]):
+        self.doc_ids = set(doc_ids)
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def _wake(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+    async def wait(self, timeout: float) -> bool:
+        """True when one of the documents changed, False on timeout."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.future), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+
+def _dispatch(doc_id: int):
+    with _waiters_lock:
+        watches = _waiters.pop(doc_id, ())
+    for watch in watches:
+        watch.loop.call_soon_threadsafe(watch._wake)
+
+
+def _listen():
+    while True:
+        try:
+            pubsub = _client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(STATUS_CHANNEL)
+            _connected.set()
+            for message in pubsub.listen():
+                try:
+                    _dispatch(int(message["data"]))
+                except (TypeError, ValueError):
+                    continue
+        except Exception as exc:
+            # Redis indisponible : les long-polls repassent en lecture périodique de la base
+            _connected.clear()
+            logger.warning("Document status listener error: %s", exc)
+            time.sleep(5)
+
+
+def _ensure_listener() -> bool:
+    if not (_listener["pid"] == os.getpid() and _listener["thread"] and _listener["thread"].is_alive()):
+        with _listener_lock:
+            if not (_listener["pid"] == os.getpid() and _listener["thread"] and _listener["thread"].is_alive()):
+                _connected.clear()
+                thread = threading.Thread(target=_listen, name="document-status-listener", daemon=True)
+                _listener.update(pid=os.getpid(), thread=thread)
+                thread.start()
+    return _connected.is_set()
+
+
+def watch(doc_ids: Iterable[int]):
+    """
+    Registers a long-poll before the caller reads the statuses (no notification can be missed in between).
+    Returns None when the Redis listener is not connected: the caller then re-reads the database periodically.
+    """
+    if not _ensure_listener():
+        return None
+    handle = _Watch(doc_ids)
+    with _waiters_lock:
+        for doc_id in handle.doc_ids:
+            _waiters.setdefault(doc_id, set()).add(handle)
+    return handle
+
+
+def unwatch(handle):
+    if handle is None:
+        return
+    with _waiters_lock:
+        for doc_id in handle.doc_ids:
+            watches = _waiters.get(doc_id)
+            if watches is not None:
+                watches.discard(handle)
+                if not watches:
+                    _waiters.pop(doc_id, None)
@@ -16,17 +16,21 @@ def _store_local(doc, pdf_bytes: bytes) -> Tuple[str, str]:
     return url, str(dest)
 
 
-def _store_s3(doc, pdf_bytes: bytes) -> Tuple[str, str]:
+def _s3_client():
     session = boto3.session.Session(
         aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
         aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
         region_name=getattr(settings, "AWS_REGION", None),
     )
-    client = session.client(
+    return session.client(
         "s3",
         endpoint_url=settings.AWS_S3_ENDPOINT_URL,
         config=boto3.session.Config(s3={"addressing_style": "virtual"}),
     )
+
+
+def _store_s3(doc, pdf_bytes: bytes) -> Tuple[str, str]:
+    client = _s3_client()
     filename = f"{doc.id}_{doc.doc_type}_{doc.term}.pdf"
     client.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=filename, Body=pdf_bytes, ContentType="application/pdf")
     base_url = getattr(settings, "DOCUMENT_BASE_URL", None)
@@ -44,3 +48,19 @@ def store_pdf(doc, pdf_bytes: bytes) -> Tuple[str, str]:
     if getattr(settings, "DOCUMENT_STORAGE", "local") == "s3":
         return _store_s3(doc, pdf_bytes)
     return _store_local(doc, pdf_bytes)
+
+
+def open_pdf(pdf_path: str):
+    """Readable binary stream of a stored PDF: local file, or S3 object body (pdf_path is then the key)."""
+    if getattr(settings, "DOCUMENT_STORAGE", "local") == "s3" and not os.path.isabs(pdf_path):
+        return _s3_client().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=pdf_path)["Body"]
+    return open(pdf_path, "rb")
+
+
+def stat_pdf(pdf_path: str) -> Tuple[int, str]:
+    """(size, version) of a stored PDF without reading it: mtime for a local file, object ETag on S3."""
+    if getattr(settings, "DOCUMENT_STORAGE", "local") == "s3" and not os.path.isabs(pdf_path):
+        head = _s3_client().head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=pdf_path)
+        return head["ContentLength"], head.get("ETag", "")
+    stat = os.stat(pdf_path)
+    return stat.st_size, str(stat.st_mtime_ns)
@@ -0,0 +1,124 @@
+"""
+Compiled LaTeX templates: each template is read and tokenized once per process into literal and
+`<<PLACEHOLDER>>` segments, then rendered with a single join.
+Django-free so that scripts/render_*_batch.py can reuse it.
+"""
+
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_PATTERN = re.compile(r"<<([A-Za-z0-9_]+)>>")
+BEGIN_DOCUMENT = "\\begin{document}"
+END_DOCUMENT = "\\end{document}"
+
+
+class Segments:
+    """Alternating literal / placeholder parts: even indexes are literals, odd indexes are keys."""
+
+    def __init__(self, text: str):
+        self.parts = PLACEHOLDER_PATTERN.split(text)
+        self.keys = frozenset(self.parts[1::2])
+
+    def render(self, context: dict) -> str:
+        parts = self.parts[:]
+        for idx in range(1, len(parts), 2):
+            key = parts[idx]
+            # Clé absente du contexte : le placeholder reste tel quel (\valfallback du tableau d'honneur)
+            parts[idx] = str(context[key]) if key in context else f"<<{key}>>"
+        return "".join(parts)
+
+
+class CompiledTemplate:
+    def __init__(self, path: Path, source: str, mtime_ns: int = 0):
+        self.path = Path(path)
+        self.source = source
+        self.mtime_ns = mtime_ns
+        head, sep, rest = source.partition(BEGIN_DOCUMENT)
+        self.has_document = bool(sep)
+        if sep:
+            body, end_sep, tail = rest.partition(END_DOCUMENT)
+        else:
+            body, end_sep, tail = "", "", ""
+        self.head = Segments(head)
+        self.body = Segments(body)
+        self.tail = Segments(end_sep + tail)
+        self.placeholders = self.head.keys | self.body.keys | self.tail.keys
+        self._reported = set()
+        self._lock = threading.Lock()
+        logger.debug(
+            "LaTeX template compiled",
+            extra={"template": str(self.path), "placeholders": sorted(self.placeholders)},
+        )
+
+    def render(self, context: dict, macro_block: str = "") -> str:
+        """Full document; macro_block (\\def lines) is inserted right before \\begin{document}."""
+        if not self.has_document:
+            return macro_block + self.head.render(context)
+        return "".join(
+            (
+                self.head.render(context),
+                macro_block,
+                BEGIN_DOCUMENT,
+                self.body.render(context),
+                self.tail.render(context),
+            )
+        )
+
+    def check(self, keys: Iterable[str]) -> tuple:
+        """Returns (missing, unused): placeholders without value, context keys matching no placeholder."""
+        keys = set(keys)
+        return sorted(self.placeholders - keys), sorted(keys - self.placeholders)
+
+    def report(self, keys: Iterable[str]):
+        """Logs missing/unused placeholders once per distinct key set."""
+        keys = frozenset(keys)
+        with self._lock:
+            if keys in self._reported:
+                return
+            self._reported.add(keys)
+        missing, unused = self.check(keys)
+        if missing:
+            logger.warning(
+                "LaTeX template placeholders without value",
+                extra={"template": str(self.path), "missing": missing},
+            )
+        if unused:
+            logger.debug("LaTeX context keys unused by template", extra={"template": str(self.path), "unused": unused})
+
+
+class TemplateRegistry:
+    """Process-wide cache of compiled templates, reloaded when the file mtime changes."""
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, path) -> CompiledTemplate:
+        path = Path(path)
+        key = str(path.resolve())
+        mtime_ns = os.stat(path).st_mtime_ns
+        template = self._templates.get(key)
+        if template is None or template.mtime_ns != mtime_ns:
+            with self._lock:
+                template = self._templates.get(key)
+                if template is None or template.mtime_ns != mtime_ns:
+                    template = CompiledTemplate(path, path.read_text(encoding="utf-8"), mtime_ns)
+                    self._templates[key] = template
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+registry = TemplateRegistry()
+
+
+def get_template(path) -> CompiledTemplate:
+    return registry.get(path)
@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THEMES = {
+    "BULLETIN": {
+        "colors": {
+            "bg": "F9FAFB",
+            "card": "FFFFFF",
+            "primary": "0F172A",
+            "muted": "64748B",
+            "footer": "1E3A8A",
+        },
+        "logo": {
+            "enabled": True,
+            "path": str(Path("logo.png")),
+            "override_school_logo": False,
+        },
+        "watermark": {
+            "enabled": True,
+            "path": str(Path("filigrame.png")),
+        },
+        "school": {
+            "name": "",
+            "country": "",
+            "city": "",
+            "phone": "",
+            "email": "",
+        },
+    },
+    "HONOR": {
+        "colors": {
+            "gold_bg": "FBF3D0",
+            "gold": "C9A24D",
+            "primary": "1E3A8A",
+            "muted": "475569",
+        },
+        "logo": {
+            "enabled": True,
+            "path": str(Path("logo.png")),
+            "override_school_logo": False,
+        },
+        "watermark": {
+            "enabled": True,
+            "path": str(Path("filigrame.png")),
+        },
+        "school": {
+            "name": "",
+            "country": "",
+            "city": "",
+            "phone": "",
+            "email": "",
+        },
+    },
+}
+
+# Canal Redis sur lequel un rechargement explicite est diffusé à tous les workers
+RELOAD_CHANNEL = "docgen:themes:reload"
+
+
+def _deep_merge(base: dict, override: dict) -> dict:
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _resolve_theme_path(path_value) -> str:
+    if not path_value:
+        return ""
+    candidate = Path(path_value)
+    if not candidate.is_absolute():
+        candidate = Path(settings.BASE_DIR) / candidate
+    if candidate.exists():
+        return str(candidate)
+    logger.warning("Theme asset not found: %s", candidate)
+    return ""
+
+
+def _read_theme_file(path: Path, label: str) -> dict:
+    try:
+        parsed = json.loads(Path(path).read_text(encoding="utf-8"))
+        if not isinstance(parsed, dict):
+            logger.warning("Theme config is not an object for %s: %s", label, path)
+            parsed = {}
+    except FileNotFoundError:
+        logger.warning("Theme config file not found for %s: %s", label, path)
+        parsed = {}
+    except json.JSONDecodeError as exc:
+        logger.warning("Theme config JSON invalid for %s: %s", label, exc)
+        parsed = {}
+    return parsed
+
+
+def school_theme_dir() -> Path:
+    return Path(getattr(settings, "LATEX_SCHOOL_THEME_DIR", Path(settings.BASE_DIR) / "config" / "themes" / "schools"))
+
+
+def _mtime(path) -> Optional[int]:
+    try:
+        return Path(path).stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+class ThemeRegistry:
+    """
+    Process-wide cache of merged themes (defaults + doc type file + optional school file) with their asset
+    paths resolved. An entry is rebuilt when one of its files changes (mtime) or after reload().
+    Returned dicts are shared: callers must not mutate them.
+    """
+
+    def __init__(self):
+        self._entries = {}  # (doc_type, school_id) -> (signature, generation, theme)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _sources(self, doc_type: str, school_id) -> tuple:
+        theme_file = getattr(settings, "LATEX_THEME_FILES", {}).get(doc_type)
+        school_file = school_theme_dir() / f"{school_id}.json" if school_id is not None else None
+        return (theme_file, school_file)
+
+    def get(self, doc_type: str, school_id=None) -> dict:
+        theme_file, school_file = self._sources(doc_type, school_id)
+        # un fichier d'école absent (cas courant) compte aussi dans la signature : sa création invalide l'entrée
+        signature = (
+            str(theme_file or ""),
+            _mtime(theme_file) if theme_file else None,
+            str(school_file or ""),
+            _mtime(school_file) if school_file else None,
+        )
+        key = (doc_type, school_id)
+        entry = self._entries.get(key)
+        if entry and entry[0] == signature and entry[1] == self._generation:
+            return entry[2]
+        with self._lock:
+            generation = self._generation
+            theme = self._build(doc_type, theme_file, school_file if signature[3] is not None else None, school_id)
+            self._entries[key] = (signature, generation, theme)
+        return theme
+
+    def _build(self, doc_type: str, theme_file, school_file, school_id) -> dict:
+        theme = DEFAULT_THEMES.get(doc_type, {})
+        if theme_file:
+            theme = _deep_merge(theme, _read_theme_file(theme_file, doc_type))
+        school_theme = {}
+        if school_file:
+            parsed = _read_theme_file(school_file, f"school {school_id}")
+            # clés communes à tous les types, puis section propre au type ({"HONOR": {...}})
+            school_theme = {key: value for key, value in parsed.items() if key not in DEFAULT_THEMES}
+            if isinstance(parsed.get(doc_type), dict):
+                school_theme = _deep_merge(school_theme, parsed[doc_type])
+            theme = _deep_merge(theme, school_theme)
+        theme = dict(theme)
+        theme["resolved"] = {
+            "logo": _resolve_theme_path(theme.get("logo", {}).get("path")),
+            "watermark": _resolve_theme_path(theme.get("watermark", {}).get("path")),
+            # assets propres à l'école : non préparés par le pipeline, utilisés tels quels
+            "school_logo": _resolve_theme_path(school_theme.get("logo", {}).get("path")),
+            "school_watermark": _resolve_theme_path(school_theme.get("watermark", {}).get("path")),
+        }
+        return theme
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+
+
+registry = ThemeRegistry()
+_listener = {"pid": None, "thread": None}
+_listener_lock = threading.Lock()
+
+
+def get_theme(doc_type: str, school_id=None) -> dict:
+    """Merged theme for a doc type (and a school, when it has its own theme file)."""
+    if getattr(settings, "LATEX_THEME_PUBSUB", False):
+        _ensure_listener()
+    return registry.get(doc_type, school_id)
+
+
+def reload_themes(broadcast: bool = True):
+    """Drops cached themes in this process and, with LATEX_THEME_PUBSUB, in every listening worker."""
+    registry.invalidate()
+    if not broadcast or not getattr(settings, "LATEX_THEME_PUBSUB", False):
+        return
+    try:
+        from documents.services.metrics import _client
+
+        _client().publish(RELOAD_CHANNEL, str(time.time()))
+    except Exception as exc:
+        logger.warning("Unable to broadcast theme reload: %s", exc)
+
+
+def _ensure_listener():
+    if _listener["pid"] == os.getpid() and _listener["thread"] and _listener["thread"].is_alive():
+        return
+    with _listener_lock:
+        if _listener["pid"] == os.getpid() and _listener["thread"] and _listener["thread"].is_alive():
+            return
+        thread = threading.Thread(target=_listen, name="theme-reload-listener", daemon=True)
+        _listener.update(pid=os.getpid(), thread=thread)
+        thread.start()
+
+
+def _listen():
+    from documents.services.metrics import _client
+
+    while True:
+        try:
+            pubsub = _client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(RELOAD_CHANNEL)
+            for _ in pubsub.listen():
+                registry.invalidate()
+                logger.info("Theme cache reloaded on broadcast")
+        except Exception as exc:
+            # Redis indisponible : les changements de fichier (mtime) restent détectés localement
+            logger.warning("Theme reload listener error: %s", exc)
+            time.sleep(5)
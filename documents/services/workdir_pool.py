@@ -0,0 +1,226 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from documents.services.metrics import record_workdir_pool
+
+logger = logging.getLogger(__name__)
+
+MEMORY_FS_TYPES = {"tmpfs", "ramfs"}
+# Jauges publiées dans Redis au plus une fois par seconde (état final d'une rafale compris)
+PUBLISH_INTERVAL = 1.0
+
+
+def is_memory_backed(path) -> bool:
+    """True when `path` lives on a tmpfs/ramfs mount (Linux /proc/mounts)."""
+    try:
+        target = os.path.realpath(path)
+        best, fstype = "", ""
+        with open("/proc/mounts", encoding="utf-8") as fh:
+            for line in fh:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                prefix = mount_point.rstrip("/") + "/"
+                if (target == mount_point or target.startswith(prefix)) and len(mount_point) >= len(best):
+                    best, fstype = mount_point, fields[2]
+        return fstype in MEMORY_FS_TYPES
+    except OSError:
+        return False
+
+
+def pool_base() -> tuple:
+    """
+    Returns (directory, memory_backed). LATEX_WORKDIR_DIR wins when set; otherwise LATEX_TMP_DIR or /dev/shm
+    if memory-backed, else the regular temp directory (disk) as fallback.
+    """
+    configured = getattr(settings, "LATEX_WORKDIR_DIR", None)
+    if configured:
+        return Path(configured), is_memory_backed(configured)
+    tmp_dir = getattr(settings, "LATEX_TMP_DIR", None)
+    for candidate in (tmp_dir, "/dev/shm"):
+        if candidate and os.path.isdir(candidate) and os.access(candidate, os.W_OK) and is_memory_backed(candidate):
+            return Path(candidate) / "docgen_workdirs", True
+    return Path(tmp_dir or tempfile.gettempdir()) / "docgen_workdirs", False
+
+
+def _dir_bytes(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _scrub(path: Path):
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
+
+
+class WorkdirPool:
+    """
+    Per-process pool of pre-created LaTeX work directories, scrubbed between uses instead of deleted.
+    When every directory is leased, or when the estimated bytes in flight would exceed max_bytes,
+    the lease falls back to a throwaway directory under LATEX_TMP_DIR.
+    """
+
+    def __init__(self, base: Path, size: int, max_bytes: int, memory_backed: bool = False):
+        self.base = Path(base)
+        self.size = size
+        self.max_bytes = max_bytes
+        self.memory_backed = memory_backed
+        self.pid = os.getpid()
+        self.config = None
+        self._lock = threading.Lock()
+        self._free = []
+        self._busy = 0
+        self._fallbacks = 0
+        # Estimation (moyenne glissante) de la taille d'un répertoire après compilation
+        self._avg_bytes = 0
+        self._publish_pending = False
+        self._published_at = 0.0
+        self.base.mkdir(parents=True, exist_ok=True)
+        self._remove_orphans()
+        for idx in range(size):
+            path = self.base / f"w{self.pid}-{idx}"
+            path.mkdir(exist_ok=True)
+            _scrub(path)
+            self._free.append(path)
+
+    def _remove_orphans(self):
+        """Drops directories left by dead processes (worker restarts, OOM kills)."""
+        for entry in os.scandir(self.base):
+            name = entry.name
+            if not name.startswith("w") or "-" not in name:
+                continue
+            try:
+                pid = int(name[1:].split("-", 1)[0])
+                if pid == self.pid:
+                    continue
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                shutil.rmtree(entry.path, ignore_errors=True)
+            except (ValueError, PermissionError):
+                continue
+
+    def _in_flight_bytes(self) -> int:
+        return self._busy * self._avg_bytes
+
+    @contextmanager
+    def lease(self):
+        path, pooled = self._acquire()
+        try:
+            yield path
+        finally:
+            self._release(path, pooled)
+
+    def _acquire(self) -> tuple:
+        with self._lock:
+            within_cap = not self.max_bytes or self._in_flight_bytes() + self._avg_bytes <= self.max_bytes
+            if self._free and within_cap:
+                path = self._free.pop()
+                self._busy += 1
+                pooled = True
+            else:
+                self._fallbacks += 1
+                pooled = False
+        if pooled:
+            path.mkdir(parents=True, exist_ok=True)
+        else:
+            path = Path(
+                tempfile.mkdtemp(prefix="latexdoc_", dir=getattr(settings, "LATEX_TMP_DIR", None) or None)
+            )
+            logger.info("LaTeX workdir pool exhausted, using a temporary directory", extra={"dir": str(path)})
+        self._publish()
+        return path, pooled
+
+    def _release(self, path: Path, pooled: bool):
+        if not pooled:
+            shutil.rmtree(path, ignore_errors=True)
+            self._publish()
+            return
+        used = _dir_bytes(path)
+        try:
+            _scrub(path)
+        except OSError:
+            shutil.rmtree(path, ignore_errors=True)
+            path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._avg_bytes = used if not self._avg_bytes else int(0.8 * self._avg_bytes + 0.2 * used)
+            self._busy -= 1
+            self._free.append(path)
+        self._publish()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.size,
+                "in_use": self._busy,
+                "fallbacks": self._fallbacks,
+                "bytes_in_flight": self._in_flight_bytes(),
+                "avg_bytes": self._avg_bytes,
+                "memory_backed": int(self.memory_backed),
+            }
+
+    def _publish(self):
+        """Schedules a gauge update: at most one per PUBLISH_INTERVAL, sent from a timer thread off the compile path."""
+        with self._lock:
+            if self._publish_pending:
+                return
+            self._publish_pending = True
+            delay = max(0.0, PUBLISH_INTERVAL - (time.monotonic() - self._published_at))
+        timer = threading.Timer(delay, self._flush)
+        timer.daemon = True
+        timer.start()
+
+    def _flush(self):
+        with self._lock:
+            self._publish_pending = False
+            self._published_at = time.monotonic()
+        record_workdir_pool(self.pid, self.stats())
+
+
+_pool: Optional[WorkdirPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_workdir_pool() -> Optional[WorkdirPool]:
+    """Pool of the current process (rebuilt after fork), or None when disabled."""
+    global _pool
+    if not getattr(settings, "LATEX_WORKDIR_POOL", True):
+        return None
+    config = (getattr(settings, "LATEX_WORKDIR_DIR", None), getattr(settings, "LATEX_TMP_DIR", None))
+    if _pool is not None and _pool.pid == os.getpid() and _pool.config == config:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid() or _pool.config != config:
+            base, memory_backed = pool_base()
+            if not memory_backed:
+                logger.warning("LaTeX workdir pool is not memory-backed", extra={"dir": str(base)})
+            try:
+                _pool = WorkdirPool(
+                    base,
+                    size=int(getattr(settings, "LATEX_WORKDIR_POOL_SIZE", 4)),
+                    max_bytes=int(getattr(settings, "LATEX_WORKDIR_MAX_BYTES", 256 * 1024 * 1024)),
+                    memory_backed=memory_backed,
+                )
+                _pool.config = config
+            except OSError as exc:
+                logger.warning("LaTeX workdir pool unavailable: %s", exc)
+                return None
+    return _pool
@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from documents.services.assets_pipeline import load_manifest, prepare_school_logo
+from documents.services.staleness import mark_stale
+from schools.models import FollowUp, Grade, School, Student, Subject, TermResult
+from schools.signals import term_results_recomputed
+
+
+@receiver(post_save, sender=School)
+def prepare_uploaded_logo(sender, instance, **kwargs):
+    """Prepares a newly uploaded school logo once, after commit, instead of at each render."""
+    if not instance.logo:
+        return
+    entry = (load_manifest() or {}).get("schools", {}).get(str(instance.pk))
+    if entry and entry.get("name") == instance.logo.name:
+        return
+    transaction.on_commit(lambda: prepare_school_logo(instance))
+
+
+# Invalidation des documents : chaque receveur ne marque que les documents dont le contexte dépend de l'objet
+
+
+@receiver(post_save, sender=School)
+def school_changed(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        mark_stale("school", [instance.pk])
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def subject_changed(sender, instance, raw=False, **kwargs):
+    # catalogue des matières : tous les bulletins de l'école
+    if not raw:
+        mark_stale("school", [instance.school_id], doc_type="BULLETIN")
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+@receiver(post_save, sender=FollowUp)
+@receiver(post_delete, sender=FollowUp)
+def student_input_changed(sender, instance, raw=False, **kwargs):
+    # les notes n'ont pas de trimestre : tous les bulletins de l'élève
+    if not raw:
+        mark_stale("student", [instance.student_id], doc_type="BULLETIN")
+
+
+def _term_result_values(instance) -> tuple:
+    average = TermResult._meta.get_field("average").to_python(instance.average)
+    weighted = TermResult._meta.get_field("weighted_total").to_python(instance.weighted_total)
+    return (instance.student_id, instance.term, average, weighted, instance.rank, instance.honor_board)
+
+
+def _term_result_moved(student_ids: set, terms: set, average_moved: bool):
+    # rappels T1/T2 et moyenne annuelle : documents de l'élève pour tous les trimestres
+    mark_stale("student", student_ids)
+    if average_moved:
+        # moyenne de classe / meilleure / plus faible affichées sur les bulletins de toute la classe
+        class_ids = set(Student.objects.filter(pk__in=student_ids).values_list("klass_id", flat=True))
+        for term in terms:
+            mark_stale("class", class_ids, term=term, doc_type="BULLETIN")
+
+
+@receiver(pre_save, sender=TermResult)
+def remember_term_result(sender, instance, raw=False, **kwargs):
+    instance._previous_values = None
+    if instance.pk and not raw:
+        instance._previous_values = (
+            TermResult.objects.filter(pk=instance.pk)
+            .values_list("student_id", "term", "average", "weighted_total", "rank", "honor_board")
+            .first()
+        )
+
+
+@receiver(post_save, sender=TermResult)
+def term_result_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_values", None)
+    current = _term_result_values(instance)
+    if previous is None:
+        _term_result_moved({instance.student_id}, {instance.term}, True)
+        return
+    if tuple(previous) == current:
+        return  # sauvegarde sans changement
+    _term_result_moved({previous[0], current[0]}, {previous[1], current[1]}, previous[:3] != current[:3])
+
+
+@receiver(post_delete, sender=TermResult)
+def term_result_deleted(sender, instance, **kwargs):
+    _term_result_moved({instance.student_id}, {instance.term}, True)
+
+
+@receiver(term_results_recomputed)
+def term_results_recomputed_changed(sender, term, student_ids, class_ids, **kwargs):
+    mark_stale("student", student_ids)
+    mark_stale("class", class_ids, term=term, doc_type="BULLETIN")
@@ -4,45 +4,140 @@ import os
 from datetime import timedelta
 
 from celery import shared_task
+from celery.signals import worker_ready
 from django.conf import settings
 from django.utils import timezone
 
 from documents.models import Document
-from documents.services.builder import build_context
-from documents.services.latex_renderer import LatexRenderer
+from documents.services.assets_pipeline import prepare_assets
+from documents.services.batch_progress import record_outcome
+from documents.services.batch_zip import append_to_batch_archive
+from documents.services.honor_overlay import HonorOverlayRenderer, supports_layers
+from documents.services.latex_renderer import LatexMultiRenderer, LatexRenderer
 from documents.services.storage import store_pdf
 from documents.services.metrics import mark_ready, mark_failed
+from documents.services.profiling import DocumentProfile
+from documents.services.snapshots import contexts_for
+from documents.services.status_watch import notify_status
 
 logger = logging.getLogger(__name__)
 
 
+@worker_ready.connect
+def prepare_assets_on_worker_start(**kwargs):
+    """Prepares logos/watermark once per asset version before the worker takes documents."""
+    try:
+        prepare_assets()
+    except Exception as exc:
+        logger.warning("Asset preparation failed at worker start: %s", exc)
+
+
+@shared_task
+def prepare_assets_task():
+    prepare_assets()
+
+
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=5, max_retries=3)
-def generate_document(self, document_id: int):
-    doc = Document.objects.select_related("student__klass__school").get(id=document_id)
+def generate_document(self, document_id: int, fresh: bool = False):
+    """
+    Renders and stores one document. A document rendered before (retry, TTL purge) is compiled again from its
+    frozen context snapshot without reading the schools tables; `fresh` rebuilds the context from live data.
+    """
+    doc = Document.objects.get(id=document_id)
     logger.info("Start generate_document", extra={"document_id": document_id, "doc_type": doc.doc_type, "term": doc.term})
+    profile = DocumentProfile(doc.doc_type, document_id=document_id)
     try:
-        context = build_context(doc)
+        with profile.stage("build_context", queries=True):
+            context = contexts_for([doc], fresh=fresh)[0]
         template = settings.LATEX_TEMPLATES[doc.doc_type]
         renderer = LatexRenderer(Path(template), context)
         pdf_bytes = renderer.generate()
+        profile.add_renderer(renderer)
         logger.info("PDF generated", extra={"document_id": document_id, "size_bytes": len(pdf_bytes)})
-        pdf_url, pdf_path = store_pdf(doc, pdf_bytes)
-        doc.pdf_path = pdf_path
-        doc.status = "READY"
-        doc.completed_at = timezone.now()
-        doc.save(update_fields=["pdf_path", "status", "completed_at"])
-        duration = (doc.completed_at - doc.created_at).total_seconds() if doc.created_at and doc.completed_at else 0
-        mark_ready(doc.id, duration)
-        logger.info("PDF stored", extra={"document_id": document_id, "pdf_path": pdf_path, "pdf_url": pdf_url})
+        with profile.stage("store_pdf"):
+            pdf_url = _store_ready(doc, pdf_bytes)
+        profile.finish()
         return pdf_url
     except Exception:
         doc.status = "FAILED"
         doc.completed_at = timezone.now()
         doc.save(update_fields=["status", "completed_at"])
         mark_failed(doc.id)
+        notify_status(doc.id)
+        if self.request.retries >= self.max_retries:
+            # échec définitif (plus de nouvelle tentative) : compté dans le lot
+            record_outcome(doc, ready=False)
         raise
 
 
+def _store_ready(doc: Document, pdf_bytes: bytes) -> str:
+    pdf_url, pdf_path = store_pdf(doc, pdf_bytes)
+    doc.pdf_path = pdf_path
+    doc.status = "READY"
+    doc.completed_at = timezone.now()
+    doc.save(update_fields=["pdf_path", "status", "completed_at"])
+    duration = (doc.completed_at - doc.created_at).total_seconds() if doc.created_at and doc.completed_at else 0
+    mark_ready(doc.id, duration)
+    notify_status(doc.id)
+    logger.info("PDF stored", extra={"document_id": doc.id, "pdf_path": pdf_path, "pdf_url": pdf_url})
+    if doc.batch_id:
+        try:
+            append_to_batch_archive(doc, pdf_bytes)
+        except Exception as exc:
+            # l'archive reste générée à la volée au téléchargement
+            logger.warning("Unable to add PDF to batch archive: %s", exc, extra={"document_id": doc.id})
+        # après l'archive : un lot finalisé READY a son ZIP complet
+        record_outcome(doc, ready=True)
+    return pdf_url
+
+
+@shared_task(
+    bind=True,
+    soft_time_limit=getattr(settings, "MULTI_COMPILE_TIME_LIMIT", 600),
+    time_limit=getattr(settings, "MULTI_COMPILE_TIME_LIMIT", 600) + 30,
+)
+def generate_documents_bulk(self, document_ids: list, fresh: bool = False):
+    """
+    Renders several documents of the same type in one XeLaTeX run (typically a whole class)
+    and stores each PDF as generate_document does. Honor boards are stamped onto a cached
+    background (see honor_overlay) when LATEX_HONOR_OVERLAY is on. Documents whose template cannot be
+    compiled together, or whose group compile fails, fall back to one generate_document each.
+    Contexts come from the documents' snapshots when they exist, unless `fresh` (see generate_document).
+    """
+    docs = list(Document.objects.filter(id__in=document_ids).order_by("id"))
+    groups = {}
+    for doc in docs:
+        groups.setdefault(doc.doc_type, []).append(doc)
+
+    stored = 0
+    for doc_type, group in groups.items():
+        template = Path(settings.LATEX_TEMPLATES[doc_type])
+        overlay = doc_type == "HONOR" and getattr(settings, "LATEX_HONOR_OVERLAY", True) and supports_layers(template)
+        if len(group) == 1 or not (overlay or LatexMultiRenderer.supports(template)):
+            for doc in group:
+                generate_document.delay(doc.id, fresh=fresh)
+            continue
+        logger.info("Start generate_documents_bulk", extra={"doc_type": doc_type, "count": len(group)})
+        try:
+            contexts = contexts_for(group, fresh=fresh)
+            renderer = HonorOverlayRenderer(template, contexts) if overlay else LatexMultiRenderer(template, contexts)
+            pdfs = renderer.generate()
+        except Exception as exc:
+            # Un seul élève en erreur ne doit pas bloquer la classe : repli document par document
+            logger.warning("Multi-document compile failed, falling back to single compiles: %s", exc)
+            for doc in group:
+                generate_document.delay(doc.id, fresh=fresh)
+            continue
+        for doc, pdf_bytes in zip(group, pdfs):
+            try:
+                _store_ready(doc, pdf_bytes)
+                stored += 1
+            except Exception:
+                logger.exception("Unable to store PDF", extra={"document_id": doc.id})
+                generate_document.delay(doc.id, fresh=fresh)
+    return stored
+
+
 def _ttl_seconds():
     try:
         return int(getattr(settings, "DOCUMENT_TTL_SECONDS", 300))
@@ -111,3 +206,18 @@ def purge_expired(hours: int = 1):
         "purge_expired done",
         extra={"hours": hours, "deleted_docs": deleted_docs, "deleted_batches": deleted_batches},
     )
+
+
+@shared_task
+def recompute_term_results_task(school_id: int, term: str, honor: bool = False):
+    from schools.results import recompute_term_results
+
+    return recompute_term_results(school_id, term, honor=honor)
+
+
+@shared_task
+def regenerate_stale_documents(term: str = None, doc_type: str = None, multi: bool = True):
+    """Nightly job: re-renders only the documents whose source data changed since their last render."""
+    from documents.services.staleness import regenerate_stale
+
+    return regenerate_stale(term=term, doc_type=doc_type, multi=multi)
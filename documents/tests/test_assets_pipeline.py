@@ -0,0 +1,47 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from documents.services import assets_pipeline
+from documents.services.assets_pipeline import get_manifest, load_manifest, manifest_path, prepare_assets, prepare_image
+
+
+class AssetsPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+        self.settings = override_settings(
+            LATEX_CACHE_DIR=str(self.base / "cache"), LATEX_ASSET_DPI=100, LATEX_LOGO_WIDTH_CM=2.54
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmp.cleanup()
+
+    def test_logo_downscaled_once_per_version(self):
+        source = self.base / "logo.jpg"
+        Image.new("RGB", (1000, 500), "red").save(source)
+        prepared = prepare_image(source, "school-1-logo")
+        with Image.open(prepared["path"]) as img:
+            self.assertEqual((img.width, img.height, img.format), (100, 50, "PNG"))
+        self.assertIs(prepare_image(source, "school-1-logo", prepared), prepared)
+
+    def test_manifest_written(self):
+        manifest = prepare_assets(schools=[])
+        self.assertEqual(load_manifest()["asset_dir"], manifest["asset_dir"])
+        self.assertIn("BULLETIN", manifest["themes"])
+
+    def test_missing_manifest_not_prepared_inline(self):
+        with mock.patch.object(assets_pipeline, "_request_preparation") as request, mock.patch.object(
+            assets_pipeline, "prepare_assets"
+        ) as prepare:
+            manifest = get_manifest()
+        prepare.assert_not_called()
+        request.assert_called_once()
+        self.assertFalse(manifest_path().exists())
+        self.assertEqual(manifest["schools"], {})
+        self.assertIn("BULLETIN", manifest["themes"])
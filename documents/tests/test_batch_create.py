@@ -0,0 +1,112 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from documents.models import Batch, Document
+from documents.services.compile_slots import CompileSlotUnavailable
+from schools.models import Class, School, Student, TermResult
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=False, DOCUMENT_ENQUEUE_CHUNK=3)
+class CreateBatchTests(TestCase):
+    def setUp(self):
+        school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        klass = Class.objects.create(school=school, name="6eA", level="6e", total_students=8)
+        self.students = [
+            Student.objects.create(first_name=f"E{i}", last_name="N", matricule=f"M{i}", klass=klass) for i in range(8)
+        ]
+        for student in self.students:
+            TermResult.objects.create(student=student, term="T1", weighted_total=100, average=12, rank=1)
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username="u", password="p"))
+
+    def _post(self, items):
+        return self.client.post("/api/batches/", {"items": items}, format="json")
+
+    @patch("documents.services.enqueue.mark_pending_many")
+    @patch("documents.services.enqueue.group")
+    def test_bulk_insert_and_chunked_enqueue_after_commit(self, mock_group, mock_pending):
+        items = [{"student_id": s.id, "term": "T1", "type": "BULLETIN"} for s in self.students]
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            response = self._post(items)
+        self.assertEqual(response.status_code, 202)
+        # validation + insertion en nombre constant de requêtes, quel que soit le nombre d'éléments
+        self.assertLess(len(queries), 15)
+        # rien n'est envoyé avant le commit
+        mock_group.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        batch = Batch.objects.get(pk=response.data["batch_id"])
+        self.assertEqual(len(batch.documents), 8)
+        self.assertEqual(Document.objects.filter(id__in=batch.documents, status="PENDING").count(), 8)
+        # 8 documents par groupes de 3 : 3 envois au broker
+        self.assertEqual(mock_group.call_count, 3)
+        self.assertEqual([len(list(call.args[0])) for call in mock_group.call_args_list], [3, 3, 2])
+        mock_pending.assert_called_once_with(batch.documents)
+
+    @patch("documents.services.enqueue.group")
+    def test_missing_term_result_creates_nothing(self, mock_group):
+        TermResult.objects.filter(student=self.students[5]).delete()
+        items = [{"student_id": s.id, "term": "T1", "type": "BULLETIN"} for s in self.students]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._post(items)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(self.students[5].id), response.data["detail"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._post([{"student_id": 999999, "term": "T1", "type": "BULLETIN"}])
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(Batch.objects.exists())
+        mock_group.assert_not_called()
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class EagerBatchTests(TransactionTestCase):
+    def setUp(self):
+        school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        klass = Class.objects.create(school=school, name="6eA", level="6e", total_students=3)
+        self.students = [
+            Student.objects.create(first_name=f"E{i}", last_name="N", matricule=f"M{i}", klass=klass) for i in range(3)
+        ]
+        for student in self.students:
+            TermResult.objects.create(student=student, term="T1", weighted_total=100, average=12, rank=1)
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username="u", password="p"))
+        self.items = [{"student_id": s.id, "term": "T1", "type": "BULLETIN"} for s in self.students]
+
+    @patch("documents.api.mark_pending_many")
+    @patch("documents.api.generate_document")
+    def test_compiles_after_commit(self, mock_task, mock_pending):
+        def _apply(args):
+            # le lot et tous ses documents sont déjà visibles hors de la transaction
+            self.assertFalse(connection.in_atomic_block)
+            self.assertEqual(Document.objects.filter(id=args[0]).count(), 1)
+
+        mock_task.apply.side_effect = _apply
+        response = self.client.post("/api/batches/", {"items": self.items}, format="json")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(mock_task.apply.call_count, 3)
+
+    @patch("documents.api.mark_pending_many")
+    @patch("documents.api.compile_slot")
+    @patch("documents.api.generate_document")
+    def test_slot_refusal_keeps_the_batch(self, mock_task, mock_slot, mock_pending):
+        mock_slot.return_value.__enter__.side_effect = [None, CompileSlotUnavailable(503, 5, "Attente expirée")]
+        response = self.client.post("/api/batches/", {"items": self.items}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+        batch = Batch.objects.get(pk=response.data["batch_id"])
+        self.assertEqual(batch.total, 3)
+        # le document compilé avant le refus n'est pas annulé avec le lot
+        self.assertEqual(Document.objects.filter(batch=batch).count(), 3)
+        self.assertEqual(mock_task.apply.call_count, 1)
@@ -0,0 +1,113 @@
+import asyncio
+import importlib
+from unittest.mock import patch
+
+from channels.testing import WebsocketCommunicator
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from config.asgi import application
+from documents.models import Batch, Document
+from documents.services.batch_progress import record_outcome
+from schools.models import Class, School, Student
+
+
+def _batch_with_documents(count: int):
+    school = School.objects.create(
+        name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+    )
+    klass = Class.objects.create(school=school, name="6eA", level="6e", total_students=count)
+    batch = Batch.objects.create(status="IN_PROGRESS", documents=[], total=count)
+    docs = []
+    for i in range(count):
+        student = Student.objects.create(first_name=f"E{i}", last_name="N", matricule=f"M{i}", klass=klass)
+        docs.append(Document.objects.create(student=student, term="T1", doc_type="BULLETIN", batch=batch))
+    batch.documents = [doc.id for doc in docs]
+    batch.save(update_fields=["documents"])
+    return batch, docs
+
+
+@patch("documents.services.batch_progress._push")
+class BatchProgressTests(TestCase):
+    def setUp(self):
+        self.batch, self.docs = _batch_with_documents(3)
+
+    def test_backfill_links_documents_of_running_batches(self, mock_push):
+        # lot en cours au déploiement : documents sans lien vers le lot, un seul déjà prêt
+        Document.objects.filter(batch=self.batch).update(batch=None)
+        Document.objects.filter(id=self.docs[0].id).update(status="READY")
+        migration = importlib.import_module("documents.migrations.0009_batch_counters")
+        migration.backfill_counters(apps, None)
+
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.total, self.batch.ready_count), (3, 1))
+        docs = list(Document.objects.filter(id__in=self.batch.documents).order_by("id"))
+        self.assertTrue(all(doc.batch_id == self.batch.id for doc in docs))
+        self.assertEqual([doc.batch_counted for doc in docs], [True, False, False])
+        # le document déjà compté ne l'est pas deux fois, les suivants finalisent le lot
+        self.assertFalse(record_outcome(docs[0], ready=True))
+        self.assertFalse(record_outcome(docs[1], ready=True))
+        self.assertTrue(record_outcome(docs[2], ready=True))
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.ready_count, self.batch.status), (3, "READY"))
+
+    def test_counts_once_and_finalizes_once(self, mock_push):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(record_outcome(self.docs[0], ready=True))
+            # tâche relivrée (acks_late) : pas de double comptage
+            self.assertFalse(record_outcome(self.docs[0], ready=True))
+            self.assertFalse(record_outcome(self.docs[1], ready=False))
+            self.assertTrue(record_outcome(self.docs[2], ready=True))
+            self.assertFalse(record_outcome(self.docs[2], ready=True))
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.ready_count, self.batch.failed_count), (2, 1))
+        self.assertEqual(self.batch.status, "FAILED")
+        self.assertIsNotNone(self.batch.finalized_at)
+        self.assertEqual(mock_push.call_count, 3)
+
+    def test_status_endpoint_reads_counters_only(self, mock_push):
+        for doc in self.docs:
+            record_outcome(doc, ready=True)
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_user(username="u", password="p"))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f"/api/batches/{self.batch.id}/")
+        self.assertEqual(response.data["status"], "READY")
+        self.assertEqual(response.data["counts"], {"READY": 3, "PENDING": 0, "FAILED": 0})
+        # une seule lecture du lot (plus l'authentification), aucune écriture
+        self.assertFalse([q for q in queries.captured_queries if q["sql"].startswith("UPDATE")])
+        self.assertFalse([q for q in queries.captured_queries if "documents_document" in q["sql"]])
+
+
+class BatchProgressConsumerTests(TransactionTestCase):
+    def test_websocket_receives_worker_updates(self):
+        batch, docs = _batch_with_documents(2)
+
+        async def scenario():
+            communicator = WebsocketCommunicator(application, f"/ws/batches/{batch.id}/")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            first = await communicator.receive_json_from()
+            await asyncio.to_thread(record_outcome, docs[0], True)
+            second = await communicator.receive_json_from()
+            await asyncio.to_thread(record_outcome, docs[1], True)
+            third = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return first, second, third
+
+        first, second, third = asyncio.run(scenario())
+        self.assertEqual((first["ready"], first["pending"], first["finalized"]), (0, 2, False))
+        self.assertEqual(second["ready"], 1)
+        self.assertEqual((third["status"], third["finalized"]), ("READY", True))
+
+    def test_unknown_batch_is_refused(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(application, "/ws/batches/999/")
+            connected, code = await communicator.connect()
+            return connected, code
+
+        self.assertEqual(asyncio.run(scenario()), (False, 4404))
@@ -0,0 +1,125 @@
+import io
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from documents.models import Batch, Document
+from documents.services.batch_progress import record_outcome
+from documents.services.batch_zip import append_to_batch_archive, batch_members, iter_batch_zip, zip_length
+from schools.models import Class, School, Student
+
+
+class BatchZipTests(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.root = Path(self._tmp.name)
+        school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        klass = Class.objects.create(school=school, name="6eA", level="6e", total_students=2)
+        self.batch = Batch.objects.create(status="IN_PROGRESS", documents=[])
+        self.docs = []
+        for i in range(2):
+            student = Student.objects.create(first_name=f"E{i}", last_name="N", matricule=f"M{i}", klass=klass)
+            self.docs.append(
+                Document.objects.create(student=student, term="T1", doc_type="BULLETIN", status="PENDING", batch=self.batch)
+            )
+        self.batch.documents = [doc.id for doc in self.docs]
+        self.batch.total = len(self.docs)
+        self.batch.save(update_fields=["documents", "total"])
+
+    def _ready(self, doc, payload: bytes):
+        path = self.root / f"{doc.id}_BULLETIN_T1.pdf"
+        path.write_bytes(payload)
+        doc.pdf_path = str(path)
+        doc.status = "READY"
+        doc.save(update_fields=["pdf_path", "status"])
+
+    def test_stream_is_stored_zip_read_in_chunks(self):
+        self._ready(self.docs[0], b"%PDF-a" * 5000)
+        self._ready(self.docs[1], b"%PDF-b" * 10)
+        ghost = Document(id=999, pdf_path=str(self.root / "absent.pdf"))
+        chunks = list(iter_batch_zip([*self.docs, ghost], chunk_size=1024))
+        # plusieurs morceaux : l'archive n'est jamais assemblée en mémoire
+        self.assertGreater(len(chunks), 10)
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+            self.assertEqual(len(zf.namelist()), 2)
+            for doc in self.docs:
+                info = zf.getinfo(Path(doc.pdf_path).name)
+                self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(zf.read(info), Path(doc.pdf_path).read_bytes())
+
+    @patch("documents.api._schedule_local_purge")
+    @patch("documents.api.purge_document_file.apply_async")
+    def test_status_poll_no_longer_builds_zip_and_download_streams(self, _purge, _local_purge):
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_user(username="u", password="p"))
+        for doc in self.docs:
+            self._ready(doc, b"%PDF-" + str(doc.id).encode())
+            record_outcome(doc, ready=True)
+        with override_settings(MEDIA_ROOT=str(self.root)):
+            status = client.get(f"/api/batches/{self.batch.id}/")
+            self.assertEqual(status.data["status"], "READY")
+            self.assertEqual(status.data["zip_path"], "")
+            self.assertFalse(self.batch.zip_full_path().exists())
+
+            response = client.get(f"/api/batches/{self.batch.id}/download/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zf:
+            self.assertEqual(len(zf.namelist()), 2)
+
+    def test_length_computed_without_reading_pdfs(self):
+        self._ready(self.docs[0], b"%PDF-a" * 5000)
+        self._ready(self.docs[1], b"%PDF-b" * 10)
+        members = batch_members(self.docs)
+        self.assertEqual(zip_length(members), len(b"".join(iter_batch_zip(self.docs, chunk_size=1024))))
+
+    @patch("documents.api._schedule_local_purge")
+    @patch("documents.api.purge_document_file.apply_async")
+    def test_streamed_download_supports_etag_and_range(self, _purge, _local_purge):
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_user(username="u", password="p"))
+        for doc in self.docs:
+            self._ready(doc, b"%PDF-" + str(doc.id).encode() * 3000)
+            record_outcome(doc, ready=True)
+        url = f"/api/batches/{self.batch.id}/download/"
+        with override_settings(MEDIA_ROOT=str(self.root)):
+            full = client.get(url)
+            body = b"".join(full.streaming_content)
+            self.assertEqual(int(full["Content-Length"]), len(body))
+            etag = full["ETag"]
+
+            # reprise d'un téléchargement interrompu : la suite de la même archive
+            part = client.get(url, HTTP_RANGE="bytes=1000-", HTTP_IF_RANGE=etag)
+            self.assertEqual(part.status_code, 206)
+            self.assertEqual(part["Content-Range"], f"bytes 1000-{len(body) - 1}/{len(body)}")
+            self.assertEqual(b"".join(part.streaming_content), body[1000:])
+
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            # un PDF régénéré change l'ETag : la plage est ignorée, archive complète
+            self._ready(self.docs[0], b"%PDF-new")
+            stale = client.get(url, HTTP_RANGE="bytes=1000-", HTTP_IF_RANGE=etag)
+            self.assertEqual(stale.status_code, 200)
+
+    def test_persisted_archive_built_as_documents_finish(self):
+        with override_settings(MEDIA_ROOT=str(self.root), BATCH_ZIP_PERSIST=True):
+            self._ready(self.docs[0], b"%PDF-0")
+            self.assertFalse(append_to_batch_archive(self.docs[0], b"%PDF-0"))
+            # nouvelle tentative du même document : pas de doublon dans l'archive
+            self.assertFalse(append_to_batch_archive(self.docs[0], b"%PDF-0"))
+            self.assertFalse(self.batch.zip_full_path().exists())
+
+            self._ready(self.docs[1], b"%PDF-1")
+            self.assertTrue(append_to_batch_archive(self.docs[1], b"%PDF-1"))
+            final = self.batch.zip_full_path()
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.zip_path, str(final))
+        with zipfile.ZipFile(final) as zf:
+            self.assertEqual(sorted(zf.read(name) for name in zf.namelist()), [b"%PDF-0", b"%PDF-1"])
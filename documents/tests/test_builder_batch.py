@@ -0,0 +1,57 @@
+from django.test import TestCase, override_settings
+
+from documents.models import Document
+from documents.services.builder import build_context, build_contexts
+from schools.models import Class, FollowUp, Grade, School, Student, Subject, TermResult
+
+
+@override_settings(LATEX_THEME_FILES={})
+class BuildContextsTests(TestCase):
+    def setUp(self):
+        school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        subjects = [
+            Subject.objects.create(school=school, name=name, coefficient=2, teacher_name="Prof")
+            for name in ("Maths", "Français", "Anglais")
+        ]
+        self.docs = []
+        for class_idx in range(2):
+            klass = Class.objects.create(school=school, name=f"6e{class_idx}", level="6e", total_students=3)
+            for idx in range(3):
+                student = Student.objects.create(
+                    first_name="A", last_name=f"N{class_idx}{idx}", matricule=f"M{class_idx}{idx}", klass=klass
+                )
+                for term in ("T1", "T2"):
+                    TermResult.objects.create(
+                        student=student, term=term, weighted_total=100, average=10 + idx, rank=idx + 1
+                    )
+                for subject in subjects[: idx + 1]:
+                    Grade.objects.create(student=student, subject=subject, average=12, appreciation="BIEN")
+                if idx:
+                    FollowUp.objects.create(
+                        student=student, assiduite=15, ponctualite=14, comportement=16, participation=12
+                    )
+                for doc_type in ("BULLETIN", "HONOR"):
+                    self.docs.append(Document.objects.create(student=student, term="T2", doc_type=doc_type))
+
+    def test_same_contexts_as_single_document_path(self):
+        contexts = build_contexts(self.docs)
+        self.assertEqual(len(contexts), len(self.docs))
+        for doc, context in zip(self.docs, contexts):
+            self.assertEqual(context, build_context(doc))
+        self.assertEqual(contexts[0]["CLASS_BEST_AVG"], "12.00")
+        self.assertEqual(contexts[0]["CLASS_MIN"], "10.00")
+        self.assertEqual(contexts[0]["T1_AVG"], "10.00")
+
+    def test_constant_number_of_queries(self):
+        build_contexts(self.docs[:1])  # manifeste d'assets préparé hors mesure
+        with self.assertNumQueries(6):
+            build_contexts(self.docs[:2])
+        with self.assertNumQueries(6):
+            build_contexts(self.docs)
+
+    def test_missing_term_result(self):
+        doc = Document(student=self.docs[0].student, term="T3", doc_type="BULLETIN")
+        with self.assertRaises(TermResult.DoesNotExist):
+            build_context(doc)
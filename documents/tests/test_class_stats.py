@@ -0,0 +1,69 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from schools.models import Class, ClassTermStats, School, Student, TermResult
+from schools.stats import defer_class_stats
+
+
+class ClassTermStatsTests(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        self.klass = Class.objects.create(school=self.school, name="6eA", level="6e", total_students=3)
+        self.students = [
+            Student.objects.create(first_name="A", last_name=f"N{idx}", matricule=f"M{idx}", klass=self.klass)
+            for idx in range(3)
+        ]
+
+    def _result(self, student, average, term="T1"):
+        return TermResult.objects.create(student=student, term=term, weighted_total=100, average=average, rank=1)
+
+    def _stats(self, term="T1"):
+        return ClassTermStats.objects.get(klass=self.klass, term=term)
+
+    def test_signals_keep_stats_in_sync(self):
+        results = [self._result(student, avg) for student, avg in zip(self.students, (12, 15, 9))]
+        stats = self._stats()
+        self.assertEqual((stats.best_average, stats.min_average, stats.count), (15, 9, 3))
+        self.assertAlmostEqual(stats.average, 12.0)
+
+        results[2].average = 18
+        results[2].save()
+        self.assertEqual(self._stats().best_average, 18)
+
+        for result in results:
+            result.delete()
+        self.assertFalse(ClassTermStats.objects.filter(klass=self.klass).exists())
+
+    def test_student_class_change_moves_stats(self):
+        for student, avg in zip(self.students, (12, 15, 9)):
+            self._result(student, avg)
+        other = Class.objects.create(school=self.school, name="6eB", level="6e", total_students=1)
+        moved = self.students[1]
+        moved.klass = other
+        moved.save()
+        self.assertEqual((self._stats().best_average, self._stats().count), (12, 2))
+        self.assertEqual(ClassTermStats.objects.get(klass=other, term="T1").best_average, 15)
+
+    def test_deferred_refresh_runs_once(self):
+        with defer_class_stats():
+            for student, avg in zip(self.students, (12, 15, 9)):
+                self._result(student, avg)
+                self._result(student, avg + 1, term="T2")
+            self.assertFalse(ClassTermStats.objects.exists())
+        self.assertEqual(self._stats("T2").best_average, 16)
+        self.assertEqual(ClassTermStats.objects.count(), 2)
+
+    def test_rebuild_command(self):
+        self._result(self.students[0], 14)
+        # écriture en masse sans signaux : les stats deviennent fausses
+        TermResult.objects.filter(student=self.students[0]).update(average=11)
+        ClassTermStats.objects.create(klass=self.klass, term="T3", count=5)
+        out = StringIO()
+        call_command("rebuild_class_stats", school=self.school.name, stdout=out)
+        self.assertEqual(self._stats().best_average, 11)
+        self.assertFalse(ClassTermStats.objects.filter(term="T3").exists())
+        self.assertIn("1 ligne", out.getvalue())
@@ -0,0 +1,100 @@
+import asyncio
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from documents.services.compile_slots import CompileSlots, CompileSlotUnavailable, get_compile_slots
+from schools.models import Class, School, Student, TermResult
+
+
+class CompileSlotsTests(SimpleTestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+
+    def _slots(self, **kwargs):
+        options = {"slots": 1, "queue_max": 1, "timeout": 0.1, "retry_after": 7, **kwargs}
+        return CompileSlots(Path(self._tmp.name), **options)
+
+    def test_queue_full_is_rejected_at_once(self):
+        slots = self._slots(queue_max=0)
+        with slots.slot():
+            self.assertEqual(slots.usage()["in_use"], 1)
+            with self.assertRaises(CompileSlotUnavailable) as ctx:
+                with slots.slot():
+                    pass
+        self.assertEqual((ctx.exception.status, ctx.exception.retry_after), (429, 7))
+        self.assertEqual(slots.usage()["in_use"], 0)
+
+    def test_wait_times_out_then_slot_is_reusable(self):
+        slots = self._slots()
+        # autre instance, même répertoire : simule un second processus du nœud
+        other = self._slots()
+        with slots.slot():
+            with self.assertRaises(CompileSlotUnavailable) as ctx:
+                with other.slot():
+                    pass
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertEqual(other.usage()["waiting"], 0)
+        with other.slot():
+            pass
+
+    def test_usage_does_not_take_the_locks(self):
+        slots = self._slots(slots=2)
+        with slots.slot():
+            with mock.patch("documents.services.compile_slots.fcntl.flock") as flock:
+                self.assertEqual(slots.usage()["in_use"], 1)
+            flock.assert_not_called()
+        self.assertEqual(slots.usage()["in_use"], 0)
+
+    def test_async_waiter_gets_released_slot(self):
+        slots = self._slots(timeout=2)
+
+        async def scenario():
+            order = []
+
+            async def holder():
+                async with slots.aslot():
+                    order.append("holder")
+                    await asyncio.sleep(0.1)
+
+            async def waiter():
+                await asyncio.sleep(0.02)
+                async with slots.aslot():
+                    order.append("waiter")
+
+            await asyncio.gather(holder(), waiter())
+            return order
+
+        self.assertEqual(asyncio.run(scenario()), ["holder", "waiter"])
+
+
+class CompileSlotsApiTests(TestCase):
+    def setUp(self):
+        school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        klass = Class.objects.create(school=school, name="6eA", level="6e", total_students=1)
+        self.student = Student.objects.create(first_name="A", last_name="N", matricule="M1", klass=klass)
+        TermResult.objects.create(student=self.student, term="T1", weighted_total=100, average=12, rank=1)
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username="u", password="p"))
+
+    def test_stream_returns_429_with_retry_after_when_saturated(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+            LATEX_THEME_FILES={},
+            LATEX_COMPILE_SLOT_DIR=tmp,
+            LATEX_COMPILE_SLOTS=1,
+            LATEX_COMPILE_QUEUE_MAX=0,
+            LATEX_COMPILE_RETRY_AFTER=3,
+        ):
+            with get_compile_slots().slot():
+                response = self.client.post(
+                    "/api/documents/bulletin/stream/", {"student_id": self.student.id, "term": "T1"}, format="json"
+                )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "3")
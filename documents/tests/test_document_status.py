@@ -0,0 +1,88 @@
+import asyncio
+import base64
+import threading
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, TransactionTestCase, override_settings
+
+from documents.models import Document
+from documents.services import status_watch
+from schools.models import Class, School, Student
+
+
+@override_settings(DOCUMENT_STATUS_POLL_INTERVAL=0.05)
+class DocumentStatusTests(TransactionTestCase):
+    def setUp(self):
+        get_user_model().objects.create_user(username="u", password="p")
+        token = base64.b64encode(b"u:p").decode()
+        self.headers = {"Authorization": f"Basic {token}"}
+        school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        klass = Class.objects.create(school=school, name="6eA", level="6e", total_students=2)
+        student = Student.objects.create(first_name="A", last_name="N", matricule="M1", klass=klass)
+        self.pending = Document.objects.create(student=student, term="T1", doc_type="BULLETIN", status="PENDING")
+        self.ready = Document.objects.create(student=student, term="T1", doc_type="HONOR", status="READY")
+
+    def _get(self, query: str):
+        async def scenario():
+            return await AsyncClient().get(f"/api/documents/status/?{query}", headers=self.headers)
+
+        started = time.monotonic()
+        response = asyncio.run(scenario())
+        return response, time.monotonic() - started
+
+    def _finish_later(self, delay: float, notify: bool = False):
+        def _finish():
+            time.sleep(delay)
+            Document.objects.filter(pk=self.pending.pk).update(status="READY")
+            if notify:
+                status_watch._dispatch(self.pending.pk)
+
+        thread = threading.Thread(target=_finish)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_many_statuses_in_one_request(self):
+        response, _ = self._get(f"ids={self.ready.id},{self.pending.id},999")
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual([(d["id"], d["status"]) for d in payload["documents"]], [(self.ready.id, "READY"), (self.pending.id, "PENDING")])
+        self.assertTrue(payload["documents"][0]["download_url"].endswith(f"/api/documents/{self.ready.id}/download/"))
+        self.assertIsNone(payload["documents"][1]["download_url"])
+        self.assertEqual(payload["missing"], [999])
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self._get("ids=abc")[0].status_code, 400)
+        self.assertEqual(self._get("ids=")[0].status_code, 400)
+
+        async def anonymous():
+            return await AsyncClient().get(f"/api/documents/status/?ids={self.pending.id}")
+
+        self.assertEqual(asyncio.run(anonymous()).status_code, 401)
+
+    @patch("documents.services.status_watch._ensure_listener", return_value=True)
+    def test_long_poll_wakes_on_notification(self, _listener):
+        self._finish_later(0.2, notify=True)
+        response, elapsed = self._get(f"ids={self.pending.id}&wait=10")
+        self.assertEqual(response.json()["documents"][0]["status"], "READY")
+        self.assertLess(elapsed, 5)
+        self.assertEqual(status_watch._waiters, {})
+
+    @patch("documents.services.status_watch.watch", return_value=None)
+    def test_long_poll_falls_back_to_database_without_redis(self, _watch):
+        self._finish_later(0.2)
+        response, elapsed = self._get(f"ids={self.pending.id}&wait=10")
+        self.assertEqual(response.json()["documents"][0]["status"], "READY")
+        self.assertLess(elapsed, 5)
+
+    @patch("documents.services.status_watch._ensure_listener", return_value=True)
+    def test_long_poll_times_out_when_nothing_changes(self, _listener):
+        response, elapsed = self._get(f"ids={self.pending.id}&wait=0.3")
+        self.assertEqual(response.json()["documents"][0]["status"], "PENDING")
+        self.assertGreaterEqual(elapsed, 0.3)
+        # un document déjà terminé dans la liste : réponse immédiate
+        response, elapsed = self._get(f"ids={self.pending.id},{self.ready.id}&wait=10")
+        self.assertLess(elapsed, 1)
@@ -4,7 +4,8 @@ from django.core.management import call_command
 from django.test import TestCase, override_settings
 
 from documents.models import Document
-from schools.models import Class, School, Student, TermResult
+from documents.services.snapshots import contexts_for
+from schools.models import Class, Grade, School, Student, Subject, TermResult
 
 
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
@@ -55,3 +56,25 @@ class GenerateDocsCommandTests(TestCase):
         for call in mock_apply_async.call_args_list:
             kwargs = call.kwargs
             self.assertEqual(kwargs.get("queue"), "documents_bulk")
+
+    @override_settings(LATEX_THEME_FILES={})
+    @patch("documents.management.commands.generate_docs.mark_pending_many")
+    @patch("documents.management.commands.generate_docs.generate_document.apply_async")
+    def test_rerun_after_grade_edit_renders_new_value(self, mock_apply_async, _mark):
+        subject = Subject.objects.create(school=self.student1.klass.school, name="Maths", coefficient=2, teacher_name="X")
+        grade = Grade.objects.create(student=self.student1, subject=subject, average=11, appreciation="BIEN")
+        call_command("generate_docs", "--type", "bulletin", "--term", "T1", "--student-ids", str(self.student1.id))
+        doc = Document.objects.get(student=self.student1, term="T1", doc_type="BULLETIN")
+        # premier rendu : contexte figé avec l'ancienne note
+        contexts_for([doc])
+
+        grade.average = 17.25
+        grade.save()
+        mock_apply_async.reset_mock()
+        call_command("generate_docs", "--type", "bulletin", "--term", "T1", "--student-ids", str(self.student1.id))
+
+        call = mock_apply_async.call_args
+        self.assertEqual(call.kwargs["args"], [doc.id])
+        context = contexts_for(Document.objects.filter(id=doc.id), **call.kwargs["kwargs"])[0]
+        self.assertIn("17.25", context["SUBJECT_ROWS"])
+        self.assertNotIn("11.00", context["SUBJECT_ROWS"])
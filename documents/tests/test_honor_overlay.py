@@ -0,0 +1,70 @@
+import io
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from documents.services.honor_overlay import (
+    HonorOverlayLayer,
+    HonorOverlayRenderer,
+    honor_tier,
+    stamp_pdf,
+    supports_layers,
+)
+
+TEMPLATE = Path("templates_latex/tableau_honneur.tex")
+
+
+def _context(name, rank, avg, school="Lycée A"):
+    return {
+        "STUDENT_NAME": name,
+        "CLASS_LEVEL": "6e",
+        "RANK": rank,
+        "CLASS_SIZE": 30,
+        "AVG": avg,
+        "TERM": "T1",
+        "SCHOOL_NAME": school,
+        "MATRICULE": f"M-{rank}",
+        "_MACROS": {"STUDENTNAME": name, "RANKVAL": rank, "SCHOOLNAME": school, "MATRICULE": f"M-{rank}"},
+    }
+
+
+def _blank_pdf() -> bytes:
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    writer.add_blank_page(width=842, height=595)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+class HonorOverlayTests(SimpleTestCase):
+    def test_tiers_follow_template_thresholds(self):
+        self.assertEqual(honor_tier("12.5"), "10")
+        self.assertEqual(honor_tier(15.99), "15")
+        self.assertEqual(honor_tier(16), "17")
+        self.assertEqual(honor_tier(None), "15")
+
+    def test_background_shared_by_students_of_same_school(self):
+        self.assertTrue(supports_layers(TEMPLATE))
+        renderer = HonorOverlayRenderer(TEMPLATE, [_context("Awa", 1, 17)])
+        first = renderer.background_key(_context("Awa", 1, 17), "17")
+        self.assertEqual(first, renderer.background_key(_context("Issa", 4, 16.2), "17"))
+        self.assertNotEqual(first, renderer.background_key(_context("Awa", 1, 17), "15"))
+        self.assertNotEqual(first, renderer.background_key(_context("Awa", 1, 17, school="Lycée B"), "17"))
+
+    def test_overlay_defines_variable_text_per_page(self):
+        layer = HonorOverlayLayer(TEMPLATE, [_context("Awa", 1, 17), _context("Issa", 4, 16.2)])
+        with tempfile.TemporaryDirectory() as tmp:
+            tex = layer.render_tex(Path(tmp)).read_text(encoding="utf-8")
+        self.assertTrue(tex.startswith("\\def\\DOCGENLAYER{overlay}\n"))
+        self.assertIn("\\def\\STUDENTNAME{Issa}", tex)
+        self.assertIn("\\def\\moyenne{16.2}", tex)
+        self.assertEqual(tex.count("\\begin{document}"), 1)
+
+    def test_stamp_keeps_single_page(self):
+        from pypdf import PdfReader
+
+        merged = stamp_pdf(_blank_pdf(), _blank_pdf())
+        self.assertEqual(len(PdfReader(io.BytesIO(merged)).pages), 1)
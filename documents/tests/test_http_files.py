@@ -0,0 +1,73 @@
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from documents.api import serve_media
+from documents.models import Batch
+from documents.services.http_files import file_etag
+
+
+class ConditionalDownloadTests(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.root = Path(self._tmp.name)
+        (self.root / "documents").mkdir()
+        self.pdf = self.root / "documents" / "1_BULLETIN_T1.pdf"
+        self.pdf.write_bytes(b"%PDF-" + bytes(range(256)) * 4)
+        self.factory = RequestFactory()
+
+    def _get(self, path="documents/1_BULLETIN_T1.pdf", **headers):
+        request = self.factory.get(f"/media/{path}", **headers)
+        return serve_media(request, path, document_root=str(self.root))
+
+    def test_etag_and_not_modified(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.pdf.read_bytes())
+        etag = response["ETag"]
+        self.assertEqual(etag, file_etag(self.pdf))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("Last-Modified", response)
+
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self._get(HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_byte_ranges(self):
+        data = self.pdf.read_bytes()
+        response = self._get(HTTP_RANGE="bytes=5-14")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 5-14/{len(data)}")
+        self.assertEqual(b"".join(response.streaming_content), data[5:15])
+
+        suffix = self._get(HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(suffix.streaming_content), data[-10:])
+        self.assertEqual(self._get(HTTP_RANGE=f"bytes={len(data)}-").status_code, 416)
+        # If-Range périmé : fichier complet plutôt qu'une plage d'une autre version
+        self.assertEqual(self._get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_media_path_cannot_escape_root(self):
+        from django.http import Http404
+
+        with self.assertRaises(Http404):
+            self._get("../../etc/passwd")
+
+    def test_batch_zip_resume(self):
+        user = get_user_model().objects.create_user(username="u", password="p")
+        client = APIClient()
+        client.force_authenticate(user=user)
+        with override_settings(MEDIA_ROOT=str(self.root)):
+            batch = Batch.objects.create(status="READY", documents=[])
+            zip_path = batch.zip_full_path()
+            zip_path.write_bytes(b"PK" + b"\0" * 1000)
+            batch.first_download_at = batch.created_at  # purge déjà planifiée
+            batch.save(update_fields=["first_download_at"])
+            url = f"/api/batches/{batch.id}/download/"
+            partial = client.get(url, HTTP_RANGE="bytes=500-")
+            self.assertEqual(partial.status_code, 206)
+            self.assertEqual(len(b"".join(partial.streaming_content)), 502)
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=partial["ETag"]).status_code, 304)
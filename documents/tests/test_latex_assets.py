@@ -0,0 +1,69 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from documents.services import latex_assets
+from documents.services.latex_assets import SUPERSEDED_MARKER, asset_version, link_assets, shared_asset_dir
+
+
+class SharedAssetsTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+        self.source = self.base / "assets"
+        self.source.mkdir()
+        (self.source / "logo.png").write_bytes(b"logo-v1")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_symlinked_and_versioned(self):
+        with override_settings(LATEX_CACHE_DIR=str(self.base / "cache")):
+            workdir = self.base / "work"
+            workdir.mkdir()
+            link_assets(self.source, workdir / "assets")
+            self.assertTrue((workdir / "assets").is_symlink())
+            self.assertEqual((workdir / "assets" / "logo.png").read_bytes(), b"logo-v1")
+            first = shared_asset_dir(self.source)
+            self.assertEqual(first, shared_asset_dir(self.source))
+            self.assertEqual((first / "logo.png").stat().st_mode & 0o222, 0)
+
+            time.sleep(0.01)
+            (self.source / "logo.png").write_bytes(b"logo-v2")
+            second = shared_asset_dir(self.source)
+            self.assertNotEqual(first, second)
+            self.assertEqual((second / "logo.png").read_bytes(), b"logo-v2")
+
+    def test_version_memoised_on_mtimes(self):
+        asset_version(self.source)
+        with mock.patch("documents.services.latex_assets.file_digest") as digest:
+            first = asset_version(self.source)
+            digest.assert_not_called()
+            time.sleep(0.01)
+            (self.source / "extra.png").write_bytes(b"extra")
+            digest.return_value = "x"
+            self.assertNotEqual(asset_version(self.source), first)
+            self.assertTrue(digest.called)
+
+    def test_superseded_versions_removed_after_grace(self):
+        with override_settings(LATEX_CACHE_DIR=str(self.base / "cache")):
+            first = shared_asset_dir(self.source)
+            time.sleep(0.01)
+            (self.source / "logo.png").write_bytes(b"logo-v2")
+            second = shared_asset_dir(self.source)
+            # version remplacée : marquée, conservée pour les compilations en cours
+            self.assertTrue((first / SUPERSEDED_MARKER).exists())
+            self.assertFalse((second / SUPERSEDED_MARKER).exists())
+
+            old = time.time() - latex_assets.SUPERSEDED_GRACE_SECONDS - 1
+            os.utime(first / SUPERSEDED_MARKER, (old, old))
+            time.sleep(0.01)
+            (self.source / "logo.png").write_bytes(b"logo-v3")
+            third = shared_asset_dir(self.source)
+            self.assertFalse(first.exists())
+            self.assertTrue((second / SUPERSEDED_MARKER).exists())
+            self.assertEqual((third / "logo.png").read_bytes(), b"logo-v3")
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from documents.services.latex_renderer import LatexRenderer
+
+# Moteur factice : écrit un PDF minimal (ou dort si FAKE_XELATEX_SLEEP est défini)
+FAKE_XELATEX = textwrap.dedent(
+    """\
+    #!/bin/sh
+    for last; do :; done
+    base="${last%.tex}"
+    if [ -n "$FAKE_XELATEX_SLEEP" ]; then
+      echo $$ > "$FAKE_XELATEX_PIDFILE"
+      exec sleep "$FAKE_XELATEX_SLEEP"
+    fi
+    printf '%%PDF-fake' > "$base.pdf"
+    : > "$base.log"
+    """
+)
+
+
+class AsyncRendererTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        base = Path(self.tmp.name)
+        engine = base / "xelatex"
+        engine.write_text(FAKE_XELATEX, encoding="utf-8")
+        engine.chmod(0o755)
+        (base / "tpl").mkdir()
+        (base / "assets").mkdir()
+        self.template = base / "tpl" / "doc.tex"
+        self.template.write_text("\\documentclass{article}\\begin{document}<<NAME>>\\end{document}", encoding="utf-8")
+        self.pidfile = base / "pid"
+        self.settings = override_settings(
+            XELATEX_BIN=str(engine),
+            LATEX_FORMAT_CACHE=False,
+            LATEX_PDF_CACHE=False,
+            LATEX_CACHE_DIR=str(base / "cache"),
+            LATEX_LOG_DIR=str(base / "logs"),
+            LATEX_WORKDIR_DIR=str(base / "work"),
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmp.cleanup()
+
+    def _renderer(self):
+        return LatexRenderer(self.template, {"NAME": "Awa", "ASSET_DIR": str(Path(self.tmp.name) / "assets")})
+
+    def test_agenerate_matches_generate(self):
+        self.assertEqual(self._renderer().generate(), b"%PDF-fake")
+        self.assertEqual(asyncio.run(self._renderer().agenerate()), b"%PDF-fake")
+
+    def test_cancel_kills_compile(self):
+        async def scenario():
+            task = asyncio.ensure_future(self._renderer().agenerate())
+            for _ in range(100):
+                if self.pidfile.exists() and self.pidfile.read_text().strip():
+                    break
+                await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        env = {"FAKE_XELATEX_SLEEP": "30", "FAKE_XELATEX_PIDFILE": str(self.pidfile)}
+        with mock.patch.dict(os.environ, env):
+            started = time.monotonic()
+            asyncio.run(scenario())
+        self.assertLess(time.monotonic() - started, 10)
+        with self.assertRaises(ProcessLookupError):
+            os.kill(int(self.pidfile.read_text()), 0)
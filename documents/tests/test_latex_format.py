@@ -0,0 +1,112 @@
+import os
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from documents.services.latex_format import format_disabled, mark_format_failed, split_preamble, strip_documentclass
+from documents.services.latex_renderer import LatexRenderer, LatexRenderError
+
+# Moteur factice : construit un .fmt vide avec -ini, échoue sur un .tex contenant BROKEN,
+# ou sur toute compilation avec format si FAKE_FMT_BAD est défini
+FAKE_XELATEX = textwrap.dedent(
+    """\
+    #!/bin/sh
+    case "$1" in
+      --version) echo "FakeTeX 1"; exit 0;;
+      -ini) for a; do case "$a" in -jobname=*) : > "${a#-jobname=}.fmt";; esac; done; exit 0;;
+    esac
+    for last; do :; done
+    base="${last%.tex}"
+    grep -q BROKEN "$last" && exit 1
+    case "$*" in *-fmt=*) [ -n "$FAKE_FMT_BAD" ] && exit 1;; esac
+    printf '%%PDF-fake' > "$base.pdf"
+    : > "$base.log"
+    """
+)
+
+
+class LatexFormatTests(SimpleTestCase):
+    def test_bulletin_static_preamble(self):
+        tex = Path("templates_latex/bulletin.tex").read_text(encoding="utf-8")
+        documentclass, static_lines = split_preamble(tex)
+        self.assertEqual(documentclass.strip(), r"\documentclass[11pt,a4paper]{article}")
+        joined = "".join(static_lines)
+        # geometry sur plusieurs lignes conservé en un seul bloc
+        self.assertIn("right=1cm\n]{geometry}", joined)
+        self.assertIn(r"\usepackage{fontspec}", joined)
+        self.assertIn(r"\usetikzlibrary{calc}", joined)
+        # Les sélections de polices et couleurs restent dans le document
+        self.assertNotIn("setmainfont", joined)
+        self.assertNotIn("definecolor", joined)
+
+    def test_placeholders_never_dumped(self):
+        tex = (
+            "\\documentclass{article}\n"
+            "\\usepackage{xcolor}\n"
+            "\\usepackage[<<OPTS>>]{geometry}\n"
+            "\\begin{document}\n\\usepackage{late}\n\\end{document}\n"
+        )
+        documentclass, static_lines = split_preamble(tex)
+        self.assertEqual(static_lines, ["\\usepackage{xcolor}\n"])
+
+    def test_strip_documentclass(self):
+        tex = "% !TEX program = xelatex\n\\documentclass{article}\n\\begin{document}x\\end{document}"
+        stripped = strip_documentclass(tex, "\\documentclass{article}\n")
+        self.assertNotIn("\\documentclass", stripped)
+        self.assertIn("\\begin{document}", stripped)
+
+
+class FormatFailureTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        base = Path(self.tmp.name)
+        engine = base / "xelatex"
+        engine.write_text(FAKE_XELATEX, encoding="utf-8")
+        engine.chmod(0o755)
+        (base / "assets").mkdir()
+        self.template = base / "doc.tex"
+        self.template.write_text(
+            "\\documentclass{article}\n\\usepackage{xcolor}\n\\begin{document}<<NAME>>\\end{document}", encoding="utf-8"
+        )
+        settings = override_settings(
+            XELATEX_BIN=str(engine),
+            LATEX_FORMAT_CACHE=True,
+            LATEX_PDF_CACHE=False,
+            LATEX_CONVERGENCE=False,
+            LATEX_DEFAULT_PASSES=1,
+            LATEX_CACHE_DIR=str(base / "cache"),
+            LATEX_LOG_DIR=str(base / "logs"),
+            LATEX_WORKDIR_DIR=str(base / "work"),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.formats = base / "cache" / "formats"
+
+    def _render(self, name):
+        return LatexRenderer(self.template, {"NAME": name, "ASSET_DIR": str(Path(self.tmp.name) / "assets")}).generate()
+
+    def test_data_error_keeps_format(self):
+        with self.assertRaises(LatexRenderError):
+            self._render("BROKEN")
+        self.assertEqual(list(self.formats.glob("*.failed")), [])
+        self.assertEqual(self._render("Awa"), b"%PDF-fake")
+
+    def test_broken_format_disabled_once_full_preamble_compiles(self):
+        with mock.patch.dict(os.environ, {"FAKE_FMT_BAD": "1"}):
+            self.assertEqual(self._render("Awa"), b"%PDF-fake")
+        self.assertEqual(len(list(self.formats.glob("*.failed"))), 1)
+
+    def test_failed_marker_expires(self):
+        self.formats.mkdir(parents=True)
+        mark_format_failed({"dir": self.formats, "name": "doc-x"}, "boom")
+        self.assertTrue(format_disabled(self.formats, "doc-x"))
+        old = time.time() - 7200
+        os.utime(self.formats / "doc-x.failed", (old, old))
+        with override_settings(LATEX_FORMAT_FAILED_TTL=3600):
+            self.assertFalse(format_disabled(self.formats, "doc-x"))
+        self.assertFalse((self.formats / "doc-x.failed").exists())
@@ -0,0 +1,74 @@
+import tempfile
+import time
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from documents.services.latex_logs import LatexLogArchiver, SegmentIndex, purge_segments, read_segment
+
+
+class LatexLogArchiverTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name) / "logs"
+        self.workdir = Path(self.tmp.name) / "work"
+        self.workdir.mkdir()
+        (self.workdir / "document.log").write_text("! Undefined control sequence.", encoding="utf-8")
+        (self.workdir / "document.tex").write_text("\\begin{document}x\\end{document}", encoding="utf-8")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_failures_kept_successes_sampled(self):
+        archiver = LatexLogArchiver(self.root, sample_rate=0, max_bytes=1024 * 1024, max_age=3600)
+        archiver.archive("bulletin", "bulletin", self.workdir, "document", failed=False)
+        archiver.archive("bulletin", "bulletin", self.workdir, "document", failed=True)
+        archiver.flush()
+        entries = SegmentIndex(self.root).load()
+        self.assertEqual(len(entries), 1)
+        rel, entry = next(iter(entries.items()))
+        # compteurs reportés dans l'index à la clôture du segment seulement
+        self.assertEqual(entry["records"], 0)
+        archiver.writer.close_all()
+        entry = SegmentIndex(self.root).load()[rel]
+        self.assertEqual((entry["records"], entry["failures"]), (1, 1))
+        records = list(read_segment(self.root / rel))
+        self.assertTrue(records[0]["failed"])
+        self.assertIn("Undefined control sequence", records[0]["files"][".log"])
+
+    def test_rolling_and_purge(self):
+        # Segments minuscules : un segment par enregistrement
+        archiver = LatexLogArchiver(self.root, sample_rate=1, max_bytes=1, max_age=3600)
+        for _ in range(3):
+            archiver.archive("honor", "tableau_honneur", self.workdir, "document", failed=False)
+        archiver.flush()
+        self.assertEqual(len(SegmentIndex(self.root).load()), 3)
+        self.assertEqual(purge_segments(self.root, max_segments=1), 2)
+        remaining = SegmentIndex(self.root).load()
+        self.assertEqual(len(remaining), 1)
+        self.assertEqual(len(list((self.root / "honor").glob("segment-*.jsonl.gz"))), 1)
+
+    def test_purge_keeps_open_segment(self):
+        archiver = LatexLogArchiver(self.root, sample_rate=0, max_bytes=1024 * 1024, max_age=3600)
+        archiver.archive("bulletin", "bulletin", self.workdir, "document", failed=True)
+        self.assertEqual(purge_segments(self.root, max_segments=0), 0)
+        self.assertEqual(len(SegmentIndex(self.root).load()), 1)
+        archiver.writer.close_all()
+        self.assertEqual(purge_segments(self.root, max_segments=0), 1)
+        self.assertEqual(list((self.root / "bulletin").glob("segment-*.jsonl.gz")), [])
+
+    def test_abandoned_open_segment_is_purged(self):
+        # writer tué sans clôture : entrée restée ouverte, sans taille
+        archiver = LatexLogArchiver(self.root, sample_rate=0, max_bytes=1024 * 1024, max_age=60)
+        archiver.archive("bulletin", "bulletin", self.workdir, "document", failed=True)
+        index = SegmentIndex(self.root)
+        rel = next(iter(index.load()))
+
+        def _age(entries):
+            entries[rel]["created"] = time.time() - 86400
+
+        index.update(_age)
+        with self.settings(LATEX_LOG_SEGMENT_SECONDS=60):
+            self.assertEqual(purge_segments(self.root, max_bytes=1), 1)
+        self.assertEqual(index.load(), {})
+        self.assertFalse((self.root / rel).exists())
@@ -0,0 +1,55 @@
+import io
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase, override_settings
+from pypdf import PdfReader, PdfWriter
+
+from documents.models import Document
+from documents.services.builder import build_context
+from documents.services.latex_renderer import GROUP_MARK, LatexMultiRenderer, split_pdf
+from schools.models import Class, School, Student, TermResult
+
+
+@override_settings(LATEX_THEME_FILES={})
+class LatexMultiRendererTests(TestCase):
+    def setUp(self):
+        school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        klass = Class.objects.create(school=school, name="Terminale", level="T", total_students=2)
+        self.students = []
+        for idx, name in enumerate(("Dupont", "Durand"), start=1):
+            student = Student.objects.create(first_name="A", last_name=name, matricule=f"M{idx}", klass=klass)
+            TermResult.objects.create(
+                student=student, term="T1", weighted_total=100, average=12 + idx, rank=idx, honor_board=False
+            )
+            self.students.append(student)
+
+    def test_supported_templates(self):
+        self.assertTrue(LatexMultiRenderer.supports(Path("templates_latex/bulletin.tex")))
+        # le préambule du tableau d'honneur dépend de <<AVG>> : compilation groupée impossible
+        self.assertFalse(LatexMultiRenderer.supports(Path("templates_latex/tableau_honneur.tex")))
+
+    def test_render_one_page_group_per_context(self):
+        contexts = [build_context(Document(student=s, term="T1", doc_type="BULLETIN")) for s in self.students]
+        renderer = LatexMultiRenderer(Path("templates_latex/bulletin.tex"), contexts)
+        with tempfile.TemporaryDirectory() as tmp:
+            tex = renderer.render_tex(Path(tmp)).read_text(encoding="utf-8")
+        self.assertEqual(tex.count("\\begin{document}"), 1)
+        self.assertEqual(tex.count("\\end{document}"), 1)
+        self.assertEqual(tex.count(GROUP_MARK), 2)
+        self.assertEqual(tex.count("\\RemoveFromHook{shipout/foreground}[top-level]"), 2)
+        self.assertIn("\\def\\STUDENTNAME{A Dupont}", tex)
+        self.assertIn("\\def\\STUDENTNAME{A Durand}", tex)
+
+    def test_split_pdf_on_boundaries(self):
+        writer = PdfWriter()
+        for width in (100, 200, 300):
+            writer.add_blank_page(width=width, height=100)
+        buf = io.BytesIO()
+        writer.write(buf)
+        first, second = split_pdf(buf.getvalue(), [1, 3])
+        self.assertEqual(len(PdfReader(io.BytesIO(first)).pages), 1)
+        second_pages = PdfReader(io.BytesIO(second)).pages
+        self.assertEqual([int(p.mediabox.width) for p in second_pages], [200, 300])
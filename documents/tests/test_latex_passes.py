@@ -0,0 +1,35 @@
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from documents.services.latex_passes import aux_digest, needs_rerun
+
+
+class LatexPassesTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = Path(self.tmp.name)
+        self.aux = self.dir / "document.aux"
+        self.log = self.dir / "document.log"
+
+    def test_stable_aux_and_quiet_log_converges(self):
+        self.aux.write_text("\\relax\n", encoding="utf-8")
+        self.log.write_text("Output written on document.pdf (1 page).\n", encoding="utf-8")
+        digest = aux_digest(self.aux)
+        self.assertFalse(needs_rerun(self.log, digest, aux_digest(self.aux)))
+
+    def test_changed_aux_requires_rerun(self):
+        before = aux_digest(self.aux)  # pas encore d'.aux
+        self.aux.write_text("\\pgfsyspdfmark {pgfid1}{0}{0}\n", encoding="utf-8")
+        self.log.write_text("", encoding="utf-8")
+        self.assertTrue(needs_rerun(self.log, before, aux_digest(self.aux)))
+
+    def test_log_rerun_request(self):
+        self.aux.write_text("\\relax\n", encoding="utf-8")
+        self.log.write_text(
+            "LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right.\n", encoding="utf-8"
+        )
+        digest = aux_digest(self.aux)
+        self.assertTrue(needs_rerun(self.log, digest, digest))
@@ -0,0 +1,40 @@
+import tempfile
+import time
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from documents.services.pdf_cache import PdfCache
+
+
+class PdfCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.tex = self.root / "document.tex"
+        self.tex.write_text("\\documentclass{article}\\begin{document}x\\end{document}", encoding="utf-8")
+        self.logo = self.root / "logo.png"
+        self.logo.write_bytes(b"logo-v1")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_changes_with_assets(self):
+        cache = PdfCache(self.root / "pdf", 1024)
+        key = cache.key(self.tex, self.tex, asset_paths=[self.logo])
+        self.assertEqual(key, cache.key(self.tex, self.tex, asset_paths=[self.logo]))
+        time.sleep(0.01)
+        self.logo.write_bytes(b"logo-v2 plus long")
+        self.assertNotEqual(key, cache.key(self.tex, self.tex, asset_paths=[self.logo]))
+
+    def test_put_get_and_evict(self):
+        cache = PdfCache(self.root / "pdf", 10)
+        self.assertIsNone(cache.get("a" * 64))
+        cache.put("a" * 64, b"%PDF-aaaa")
+        self.assertEqual(cache.get("a" * 64), b"%PDF-aaaa")
+        time.sleep(0.01)
+        cache.put("b" * 64, b"%PDF-bbbb")
+        cache.evict()
+        # Le plus ancien est évincé pour repasser sous la borne
+        self.assertIsNone(cache.get("a" * 64))
+        self.assertEqual(cache.get("b" * 64), b"%PDF-bbbb")
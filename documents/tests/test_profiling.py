@@ -0,0 +1,50 @@
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from documents.services.latex_renderer import LatexRenderer
+from documents.services.profiling import DocumentProfile
+from documents.tests.test_latex_async import FAKE_XELATEX
+
+
+class DocumentProfileTests(TestCase):
+    def test_counts_queries_of_stage(self):
+        profile = DocumentProfile("BULLETIN", document_id=1)
+        with profile.stage("build_context", queries=True):
+            list(get_user_model().objects.all())
+            get_user_model().objects.filter(pk=1).exists()
+        with profile.stage("store_pdf"):
+            pass
+        self.assertEqual(profile.stages["build_context"]["queries"], 2)
+        self.assertNotIn("queries", profile.stages["store_pdf"])
+        with self.assertLogs("documents.services.profiling", level="WARNING"):
+            with override_settings(LATEX_QUERY_BUDGET=1):
+                profile.finish()
+
+    def test_renderer_pass_timings(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp)
+            engine = base / "xelatex"
+            engine.write_text(FAKE_XELATEX, encoding="utf-8")
+            engine.chmod(0o755)
+            (base / "tpl").mkdir()
+            template = base / "tpl" / "doc.tex"
+            template.write_text("\\documentclass{article}\\begin{document}<<NAME>>\\end{document}", encoding="utf-8")
+            with override_settings(
+                XELATEX_BIN=str(engine),
+                LATEX_FORMAT_CACHE=False,
+                LATEX_PDF_CACHE=False,
+                LATEX_CONVERGENCE=False,
+                LATEX_CACHE_DIR=str(base / "cache"),
+                LATEX_LOG_DIR=str(base / "logs"),
+                LATEX_WORKDIR_DIR=str(base / "work"),
+            ):
+                renderer = LatexRenderer(template, {"NAME": "Awa", "XELATEX_PASSES": 2})
+                renderer.generate()
+        profile = DocumentProfile("BULLETIN")
+        profile.add_renderer(renderer)
+        self.assertIn("render_tex", profile.stages)
+        self.assertEqual(len(profile.stages["xelatex"]["passes"]), 2)
+        self.assertGreaterEqual(profile.stages["xelatex"]["cpu"], 0)
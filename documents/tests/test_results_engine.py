@@ -0,0 +1,80 @@
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from schools import results as results_engine
+from schools.models import Class, ClassTermStats, Grade, School, Student, Subject, TermResult
+from schools.results import recompute_term_results
+
+
+class RecomputeTermResultsTests(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        self.klass = Class.objects.create(school=self.school, name="6eA", level="6e", total_students=4)
+        self.other = Class.objects.create(school=self.school, name="6eB", level="6e", total_students=1)
+        self.maths = Subject.objects.create(school=self.school, name="Maths", coefficient=3, teacher_name="M. X")
+        self.french = Subject.objects.create(school=self.school, name="Français", coefficient=1, teacher_name="Mme Y")
+        marks = {"A": (16, 12), "B": (12, 12), "C": (11, 15), "D": None}
+        self.students = {}
+        for name, pair in marks.items():
+            student = Student.objects.create(first_name=name, last_name="N", matricule=f"M{name}", klass=self.klass)
+            self.students[name] = student
+            if pair:
+                Grade.objects.create(student=student, subject=self.maths, average=pair[0], appreciation="BIEN")
+                Grade.objects.create(student=student, subject=self.french, average=pair[1], appreciation="BIEN")
+        self.solo = Student.objects.create(first_name="E", last_name="N", matricule="ME", klass=self.other)
+        Grade.objects.create(student=self.solo, subject=self.maths, average=9, appreciation="PASSABLE")
+        # résultat existant (valeurs aléatoires du seed) mis à jour, les autres créés
+        TermResult.objects.create(student=self.students["A"], term="T1", weighted_total=1, average=1, rank=9)
+
+    def _result(self, student):
+        return TermResult.objects.get(student=student, term="T1")
+
+    def test_averages_ranks_and_ties(self):
+        summary = recompute_term_results(self.school.id, "T1")
+        self.assertEqual((summary["updated"], summary["created"], summary["skipped"]), (1, 3, 1))
+
+        first = self._result(self.students["A"])
+        self.assertEqual((first.average, first.weighted_total, first.rank), (Decimal("15.00"), Decimal("60.00"), 1))
+        # B : (12*3 + 12) / 4 = 12 ; C : (11*3 + 15) / 4 = 12 -> ex aequo
+        self.assertEqual([self._result(self.students[n]).rank for n in ("B", "C")], [2, 2])
+        self.assertEqual(self._result(self.solo).rank, 1)
+        self.assertFalse(TermResult.objects.filter(student=self.students["D"]).exists())
+        self.assertFalse(first.honor_board)  # honor non demandé : inchangé
+
+        stats = ClassTermStats.objects.get(klass=self.klass, term="T1")
+        self.assertEqual((stats.best_average, stats.min_average, stats.count), (Decimal("15.00"), Decimal("12.00"), 3))
+
+    @override_settings(HONOR_BOARD_MIN_AVERAGE=12, HONOR_BOARD_MAX_RANK=None)
+    def test_command_sets_honor_board(self):
+        out = StringIO()
+        call_command("recompute_results", term="T1", school=self.school.name, honor=True, stdout=out)
+        self.assertIn("1 mis à jour, 3 créé(s)", out.getvalue())
+        flags = {name: self._result(student).honor_board for name, student in self.students.items() if name != "D"}
+        self.assertEqual(flags, {"A": True, "B": True, "C": True})
+        self.assertFalse(self._result(self.solo).honor_board)
+
+        recompute_term_results(self.school.id, "T1", honor=True, honor_min_average=12, honor_max_rank=1)
+        self.assertFalse(self._result(self.students["B"]).honor_board)
+        self.assertTrue(self._result(self.students["A"]).honor_board)
+
+    def test_half_cent_rounds_up(self):
+        # (10.01 + 10.00) / 2 = 10.005 : 10.00 avec un arrondi en flottants, 10.01 attendu
+        grades = [(1, Decimal("10.01"), Decimal("1.00")), (1, Decimal("10.00"), Decimal("1.00"))]
+        weighted, _, cents, _ = results_engine._aggregate_python([1], [1], grades)
+        self.assertEqual((weighted, cents), ([200100], [1001]))
+
+    @skipUnless(results_engine.np is not None, "numpy non installé")
+    def test_numpy_and_python_paths_agree(self):
+        student_ids = [5, 2, 9, 7]
+        class_ids = [1, 1, 2, 1]
+        grades = [(5, Decimal("12"), Decimal("2")), (2, Decimal("14"), Decimal("1")), (7, Decimal("12"), Decimal("1"))]
+        self.assertEqual(
+            results_engine._aggregate_numpy(student_ids, class_ids, grades),
+            results_engine._aggregate_python(student_ids, class_ids, grades),
+        )
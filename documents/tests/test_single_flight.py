@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from documents.services.single_flight import RedisFlight, SingleFlight
+
+
+class _FakeRedis:
+    """Just enough of redis-py for RedisFlight (SET NX, GET, DELETE, pipelines, the release script)."""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, px=None, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+    def register_script(self, script):
+        def _compare_and_delete(keys, args):
+            if self.data.get(keys[0]) == args[0]:
+                self.delete(keys[0])
+                return 1
+            return 0
+
+        return _compare_and_delete
+
+
+class _FakePipeline:
+    def __init__(self, cli):
+        self.cli = cli
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.cli, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_identical_calls_share_one_compile(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def compile_pdf():
+            calls.append(1)
+            release.wait(2)
+            return b"%PDF-shared"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("BULLETIN:1:T1", compile_pdf))) for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [b"%PDF-shared"] * 3)
+        # vol terminé : un nouvel appel recompile
+        flight.do("BULLETIN:1:T1", compile_pdf)
+        self.assertEqual(len(calls), 2)
+
+    def test_waiters_receive_the_leader_error(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def failing():
+            release.wait(2)
+            raise RuntimeError("xelatex failed")
+
+        errors = []
+
+        def call():
+            try:
+                flight.do("HONOR:1:T1", failing)
+            except RuntimeError as exc:
+                errors.append(str(exc))
+
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, ["xelatex failed"] * 2)
+
+    def test_async_waiters_survive_one_disconnect(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def compile_pdf():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return b"%PDF-async"
+
+        async def scenario():
+            first = asyncio.ensure_future(flight.ado("BULLETIN:2:T1", compile_pdf))
+            second = asyncio.ensure_future(flight.ado("BULLETIN:2:T1", compile_pdf))
+            await asyncio.sleep(0.02)
+            first.cancel()  # client parti : la compilation continue pour l'autre
+            return await second
+
+        self.assertEqual(asyncio.run(scenario()), b"%PDF-async")
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(LATEX_SINGLE_FLIGHT_REDIS=True, METRICS_REDIS_URL="redis://127.0.0.1:1/0")
+    def test_redis_unavailable_falls_back_to_local_compile(self):
+        with self.assertLogs("documents.services.single_flight", level="WARNING"):
+            self.assertEqual(SingleFlight().do("BULLETIN:3:T1", lambda: b"%PDF-local"), b"%PDF-local")
+
+    def test_waiter_gets_result_published_before_its_first_poll(self):
+        cli = _FakeRedis()
+        with mock.patch("documents.services.single_flight._client", return_value=cli):
+            leader, waiter = RedisFlight("BULLETIN:4:T1"), RedisFlight("BULLETIN:4:T1")
+            self.assertTrue(leader.acquire())
+            self.assertFalse(waiter.acquire())
+            # le leader publie (et libère le verrou) avant le premier poll du waiter
+            leader.publish(b"%PDF-remote")
+            self.assertEqual(waiter.poll(), ("result", b"%PDF-remote"))
+
+    def test_release_keeps_a_lock_taken_over_by_another_leader(self):
+        cli = _FakeRedis()
+        with mock.patch("documents.services.single_flight._client", return_value=cli):
+            stale = RedisFlight("BULLETIN:5:T1")
+            self.assertTrue(stale.acquire())
+            # verrou expiré puis repris par un autre processus
+            cli.delete(stale.lock_key)
+            other = RedisFlight("BULLETIN:5:T1")
+            self.assertTrue(other.acquire())
+            stale.release()
+            self.assertEqual(cli.get(other.lock_key), other.token)
+            other.release()
+            self.assertIsNone(cli.get(other.lock_key))
@@ -0,0 +1,92 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from documents.models import Document, DocumentSnapshot
+from documents.services import snapshots
+from documents.services.builder import build_context
+from documents.services.latex_renderer import LatexRenderer
+from documents.services.snapshots import contexts_for, diff_snapshot
+from schools.models import Class, Grade, School, Student, Subject, TermResult
+
+
+@override_settings(LATEX_THEME_FILES={})
+class DocumentSnapshotTests(TestCase):
+    def setUp(self):
+        school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        klass = Class.objects.create(school=school, name="6eA", level="6e", total_students=1)
+        student = Student.objects.create(first_name="Awa", last_name="Traoré", matricule="M1", klass=klass)
+        subject = Subject.objects.create(school=school, name="Maths", coefficient=2, teacher_name="Prof")
+        self.grade = Grade.objects.create(student=student, subject=subject, average=12.5, appreciation="BIEN")
+        self.result = TermResult.objects.create(student=student, term="T1", weighted_total=25, average=12.5, rank=1)
+        self.doc = Document.objects.create(student=student, term="T1", doc_type="BULLETIN")
+
+    def _tex(self, context):
+        with tempfile.TemporaryDirectory() as tmp:
+            renderer = LatexRenderer(Path(settings.LATEX_TEMPLATES["BULLETIN"]), context)
+            return renderer.render_tex(Path(tmp)).read_text(encoding="utf-8")
+
+    def test_rerender_reads_only_the_snapshot(self):
+        first = contexts_for([self.doc])[0]
+        # figer le contexte (Decimal -> str) ne change pas le .tex produit
+        self.assertEqual(self._tex(first), self._tex(build_context(self.doc)))
+        snapshot = DocumentSnapshot.objects.get(document=self.doc)
+        self.assertEqual(snapshot.version, snapshots.SNAPSHOT_VERSION)
+
+        # données inchangées : le re-rendu (retry, purge TTL) relit le snapshot seul et reste identique
+        with CaptureQueriesContext(connection) as queries:
+            again = contexts_for([self.doc])[0]
+        self.assertEqual(len(queries), 1)
+        self.assertFalse(any("schools_" in query["sql"] for query in queries.captured_queries))
+        self.assertEqual(self._tex(again), self._tex(first))
+
+        fresh = contexts_for([self.doc], fresh=True)[0]
+        self.assertEqual(fresh["AVG"], "12.50")
+
+    def test_stale_document_is_rebuilt(self):
+        contexts_for([self.doc])
+        # la modification marque le document périmé : le snapshot n'est plus utilisé
+        self.result.average = 18
+        self.result.save()
+        self.assertEqual(contexts_for([self.doc])[0]["AVG"], "18.00")
+        self.assertEqual(DocumentSnapshot.objects.get(document=self.doc).context["AVG"], "18.00")
+        self.doc.refresh_from_db()
+        self.assertFalse(self.doc.is_stale)
+
+    def test_missing_asset_path_is_rebuilt(self):
+        contexts_for([self.doc])
+        # logo préparé supprimé depuis (cache nettoyé, logo re-préparé)
+        snapshot = DocumentSnapshot.objects.get(document=self.doc)
+        snapshot.context["LOGO_PATH"] = "/nonexistent/prepared/school-logo.png"
+        snapshot.save(update_fields=["context"])
+        context = contexts_for([self.doc])[0]
+        self.assertNotEqual(context["LOGO_PATH"], "/nonexistent/prepared/school-logo.png")
+        refreshed = DocumentSnapshot.objects.get(document=self.doc)
+        self.assertEqual(refreshed.context["LOGO_PATH"], context["LOGO_PATH"])
+
+    def test_outdated_version_is_rebuilt(self):
+        contexts_for([self.doc])
+        DocumentSnapshot.objects.filter(document=self.doc).update(version=0)
+        contexts_for([self.doc])
+        self.assertEqual(DocumentSnapshot.objects.get(document=self.doc).version, snapshots.SNAPSHOT_VERSION)
+
+    def test_diff_against_live_data(self):
+        contexts_for([self.doc])
+        self.assertEqual(diff_snapshot(self.doc), {})
+        self.grade.average = 14
+        self.grade.save()
+        diff = diff_snapshot(self.doc)
+        self.assertTrue(diff)
+        self.assertTrue(all(values["snapshot"] != values["live"] for values in diff.values()))
+
+        out = StringIO()
+        call_command("diff_snapshot", str(self.doc.id), stdout=out)
+        self.assertIn("différence(s)", out.getvalue())
@@ -0,0 +1,91 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from documents.models import Document
+from documents.services.snapshots import contexts_for
+from documents.services.staleness import defer_staleness, regenerate_stale
+from schools.models import Class, Grade, School, Student, Subject, TermResult
+from schools.results import recompute_term_results
+
+
+@override_settings(LATEX_THEME_FILES={})
+class StalenessTests(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(
+            name="Ecole Test", address="Adresse", country="BF", logo="", motto="", academic_year="2024-2025"
+        )
+        self.subject = Subject.objects.create(school=self.school, name="Maths", coefficient=2, teacher_name="Prof")
+        klass = Class.objects.create(school=self.school, name="6eA", level="6e", total_students=2)
+        other = Class.objects.create(school=self.school, name="6eB", level="6e", total_students=1)
+        self.students = [
+            Student.objects.create(first_name="A", last_name=f"N{idx}", matricule=f"M{idx}", klass=k)
+            for idx, k in enumerate((klass, klass, other))
+        ]
+        self.results = {}
+        self.grades = {}
+        for idx, student in enumerate(self.students):
+            self.grades[student.id] = Grade.objects.create(
+                student=student, subject=self.subject, average=10 + idx, appreciation="BIEN"
+            )
+            self.results[student.id] = TermResult.objects.create(
+                student=student, term="T1", weighted_total=20 + 2 * idx, average=10 + idx, rank=idx + 1
+            )
+            Document.objects.create(student=student, term="T1", doc_type="BULLETIN", status="READY")
+        Document.objects.create(student=self.students[0], term="T1", doc_type="HONOR", status="READY")
+        Document.objects.update(is_stale=False)  # résultats créés après les premiers documents
+
+    def _stale(self):
+        return set(Document.objects.filter(is_stale=True).values_list("student_id", "doc_type"))
+
+    def test_grade_marks_only_the_student_bulletins(self):
+        first = self.students[0]
+        grade = self.grades[first.id]
+        grade.average = 17
+        grade.save()
+        self.assertEqual(self._stale(), {(first.id, "BULLETIN")})
+
+    def test_average_change_marks_classmates(self):
+        first, second, third = self.students
+        result = self.results[first.id]
+        result.save()  # aucune valeur modifiée
+        self.assertEqual(self._stale(), set())
+
+        result.average = 15
+        result.save()
+        self.assertEqual(self._stale(), {(first.id, "BULLETIN"), (first.id, "HONOR"), (second.id, "BULLETIN")})
+
+        Document.objects.update(is_stale=False)
+        other = self.results[third.id]
+        other.rank = 4
+        other.save()
+        self.assertEqual(self._stale(), {(third.id, "BULLETIN")})
+
+    def test_deferred_and_bulk_recompute(self):
+        with defer_staleness():
+            for grade in self.grades.values():
+                grade.average = 9
+                grade.save()
+            self.assertEqual(self._stale(), set())
+        self.assertEqual(len(self._stale()), 3)
+
+        Document.objects.update(is_stale=False)
+        # moyennes recalculées depuis les notes (9 partout) : changements remontés par signal malgré bulk_update
+        recompute_term_results(self.school.id, "T1")
+        self.assertEqual(len(self._stale()), 4)
+
+    @patch("documents.services.metrics.mark_pending_many")
+    @patch("documents.tasks.generate_document.apply_async")
+    def test_regenerate_only_stale_with_fresh_context(self, mock_apply_async, mock_mark_pending):
+        first = self.students[0]
+        grade = self.grades[first.id]
+        grade.average = 18
+        grade.save()
+        self.assertEqual(regenerate_stale(), 1)
+        doc = Document.objects.get(student=first, doc_type="BULLETIN")
+        mock_apply_async.assert_called_once_with(args=[doc.id], kwargs={"fresh": True})
+        self.assertEqual(doc.status, "PENDING")
+        mock_mark_pending.assert_called_once_with([doc.id])
+
+        contexts_for([doc], fresh=True)
+        self.assertFalse(Document.objects.filter(is_stale=True).exists())
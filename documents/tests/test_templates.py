@@ -0,0 +1,26 @@
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from documents.services.templates import CompiledTemplate, get_template
+
+
+class CompiledTemplateTests(SimpleTestCase):
+    def test_render_and_macro_insertion(self):
+        tpl = CompiledTemplate(
+            Path("inline.tex"),
+            "\\documentclass{article}\n\\begin{document}<<NAME>> / <<UNKNOWN>>\\end{document}\n",
+        )
+        self.assertEqual(tpl.placeholders, {"NAME", "UNKNOWN"})
+        tex = tpl.render({"NAME": "Awa"}, "\\def\\X{1}\n")
+        self.assertIn("\\def\\X{1}\n\\begin{document}Awa / <<UNKNOWN>>", tex)
+        self.assertEqual(tpl.check(["NAME", "EXTRA"]), (["UNKNOWN"], ["EXTRA"]))
+
+    def test_matches_sequential_replace(self):
+        path = Path("templates_latex/tableau_honneur.tex")
+        context = {"STUDENT_NAME": "Awa K.", "AVG": "16.5", "RANK": "1", "LOGO_PATH": "/tmp/logo.png"}
+        expected = path.read_text(encoding="utf-8")
+        for key, value in context.items():
+            expected = expected.replace(f"<<{key}>>", value)
+        self.assertEqual(get_template(path).render(context), expected)
+        self.assertIs(get_template(path), get_template(path))
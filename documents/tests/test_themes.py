@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase, override_settings
+
+from documents.services.themes import ThemeRegistry
+
+
+class ThemeRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = Path(self.tmp.name)
+        self.theme_file = self.root / "honor.json"
+        self.theme_file.write_text(json.dumps({"colors": {"gold": "111111"}}), encoding="utf-8")
+        (self.root / "schools").mkdir()
+        override = override_settings(
+            LATEX_THEME_FILES={"HONOR": self.theme_file}, LATEX_SCHOOL_THEME_DIR=self.root / "schools"
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _touch(self, path: Path, data: dict):
+        path.write_text(json.dumps(data), encoding="utf-8")
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def test_cached_until_file_changes(self):
+        registry = ThemeRegistry()
+        theme = registry.get("HONOR")
+        self.assertEqual(theme["colors"]["gold"], "111111")
+        self.assertEqual(theme["colors"]["primary"], "1E3A8A")
+        self.assertIs(registry.get("HONOR"), theme)
+
+        self._touch(self.theme_file, {"colors": {"gold": "222222"}})
+        self.assertEqual(registry.get("HONOR")["colors"]["gold"], "222222")
+
+        cached = registry.get("HONOR")
+        registry.invalidate()
+        self.assertIsNot(registry.get("HONOR"), cached)
+
+    def test_school_theme_overrides(self):
+        registry = ThemeRegistry()
+        self.assertEqual(registry.get("HONOR", 7)["colors"]["gold"], "111111")
+        self._touch(
+            self.root / "schools" / "7.json",
+            {"school": {"city": "Bobo-Dioulasso"}, "HONOR": {"colors": {"gold": "333333"}}},
+        )
+        theme = registry.get("HONOR", 7)
+        self.assertEqual(theme["colors"]["gold"], "333333")
+        self.assertEqual(theme["school"]["city"], "Bobo-Dioulasso")
+        self.assertEqual(registry.get("HONOR")["colors"]["gold"], "111111")
+        self.assertEqual(theme["resolved"]["school_logo"], "")
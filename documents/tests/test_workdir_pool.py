@@ -0,0 +1,52 @@
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from documents.services import workdir_pool
+from documents.services.workdir_pool import WorkdirPool
+
+
+class WorkdirPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_reused_and_scrubbed(self):
+        pool = WorkdirPool(Path(self.tmp.name), size=1, max_bytes=0)
+        with pool.lease() as first:
+            (first / "document.aux").write_text("stale", encoding="utf-8")
+            (first / "sub").mkdir()
+            self.assertEqual(pool.stats()["in_use"], 1)
+        with pool.lease() as second:
+            self.assertEqual(first, second)
+            self.assertEqual(list(second.iterdir()), [])
+        self.assertEqual(pool.stats()["in_use"], 0)
+
+    def test_fallback_when_exhausted(self):
+        pool = WorkdirPool(Path(self.tmp.name), size=1, max_bytes=0)
+        with pool.lease() as pooled:
+            with pool.lease() as extra:
+                self.assertNotEqual(pooled, extra)
+                self.assertTrue(extra.name.startswith("latexdoc_"))
+            self.assertFalse(extra.exists())
+        self.assertEqual(pool.stats()["fallbacks"], 1)
+
+    def test_publish_throttled(self):
+        pool = WorkdirPool(Path(self.tmp.name), size=1, max_bytes=0)
+        published = []
+        with mock.patch.object(workdir_pool, "PUBLISH_INTERVAL", 0.2), mock.patch.object(
+            workdir_pool, "record_workdir_pool", side_effect=lambda pid, stats: published.append(stats)
+        ), mock.patch.object(pool, "stats", wraps=pool.stats) as stats:
+            for _ in range(50):
+                with pool.lease():
+                    pass
+            time.sleep(0.5)
+        # rafale de 100 acquire/release : une publication immédiate puis une seule différée (état final)
+        self.assertLessEqual(stats.call_count, 2)
+        self.assertEqual(pool.stats()["in_use"], 0)
+        self.assertIn(pool.stats(), published)
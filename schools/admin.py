@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import School, Class, Student, Subject, Grade, TermResult, FollowUp
+from .models import School, Class, Student, Subject, Grade, TermResult, FollowUp, ClassTermStats
 
 
 @admin.register(School)
@@ -48,3 +48,10 @@ class TermResultAdmin(admin.ModelAdmin):
 class FollowUpAdmin(admin.ModelAdmin):
     list_display = ("student", "assiduite", "ponctualite", "comportement", "participation")
     search_fields = ("student__first_name", "student__last_name", "student__matricule")
+
+
+@admin.register(ClassTermStats)
+class ClassTermStatsAdmin(admin.ModelAdmin):
+    list_display = ("klass", "term", "best_average", "average", "min_average", "count", "updated_at")
+    list_filter = ("term", "klass__school")
+    search_fields = ("klass__name", "klass__school__name")
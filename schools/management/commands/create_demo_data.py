@@ -3,6 +3,7 @@ import random
 from django.core.management.base import BaseCommand
 
 from schools.models import Class, FollowUp, Grade, School, Student, Subject, TermResult
+from schools.stats import defer_class_stats
 
 
 class Command(BaseCommand):
@@ -59,38 +60,40 @@ class Command(BaseCommand):
         last_names = ["Traore", "Ouédraogo", "Kaboré", "Zerbo", "Sanogo", "Diallo", "Zongo", "Sawadogo", "Compaoré", "Bationo"]
 
         created = 0
-        for i in range(target_students):
-            fn = first_names[i % len(first_names)]
-            ln = last_names[(i // len(first_names)) % len(last_names)]
-            matricule = f"M{klass.id:02d}{i+1:04d}"
-            student, was_created = Student.objects.get_or_create(
-                matricule=matricule,
-                defaults={"first_name": fn, "last_name": ln, "klass": klass},
-            )
-            created += 1 if was_created else 0
+        # Statistiques de classe rafraîchies une seule fois à la fin du remplissage
+        with defer_class_stats():
+            for i in range(target_students):
+                fn = first_names[i % len(first_names)]
+                ln = last_names[(i // len(first_names)) % len(last_names)]
+                matricule = f"M{klass.id:02d}{i+1:04d}"
+                student, was_created = Student.objects.get_or_create(
+                    matricule=matricule,
+                    defaults={"first_name": fn, "last_name": ln, "klass": klass},
+                )
+                created += 1 if was_created else 0
 
-            # Notes et résultat
-            total = 0
-            coef_sum = 0
-            for subj in subjects:
-                avg = random.randint(10, 18)
-                Grade.objects.update_or_create(
+                # Notes et résultat
+                total = 0
+                coef_sum = 0
+                for subj in subjects:
+                    avg = random.randint(10, 18)
+                    Grade.objects.update_or_create(
+                        student=student,
+                        subject=subj,
+                        defaults={"average": avg, "appreciation": "BIEN"},
+                    )
+                    total += avg * float(subj.coefficient)
+                    coef_sum += float(subj.coefficient)
+                overall_avg = round(total / coef_sum, 2) if coef_sum else 0
+                weighted_total = round(total, 2)
+                TermResult.objects.update_or_create(
                     student=student,
-                    subject=subj,
-                    defaults={"average": avg, "appreciation": "BIEN"},
+                    term=term,
+                    defaults={"weighted_total": weighted_total, "average": overall_avg, "rank": i + 1, "honor_board": i < 3},
+                )
+                FollowUp.objects.update_or_create(
+                    student=student,
+                    defaults={"assiduite": 15, "ponctualite": 16, "comportement": 17, "participation": 14},
                 )
-                total += avg * float(subj.coefficient)
-                coef_sum += float(subj.coefficient)
-            overall_avg = round(total / coef_sum, 2) if coef_sum else 0
-            weighted_total = round(total, 2)
-            TermResult.objects.update_or_create(
-                student=student,
-                term=term,
-                defaults={"weighted_total": weighted_total, "average": overall_avg, "rank": i + 1, "honor_board": i < 3},
-            )
-            FollowUp.objects.update_or_create(
-                student=student,
-                defaults={"assiduite": 15, "ponctualite": 16, "comportement": 17, "participation": 14},
-            )
 
         self.stdout.write(self.style.SUCCESS(f"École: {school.name}, Classe: {klass.name}, Étudiants créés/nouveaux: {created}/{target_students}"))
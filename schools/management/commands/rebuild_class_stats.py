@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from schools.models import Class, School, TermResult
+from schools.stats import rebuild_class_stats
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les statistiques de classe (meilleure moyenne, moyenne, plus faible) par trimestre."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--school", type=str, help="Nom ou id de l'école (par défaut toutes).")
+        parser.add_argument(
+            "--term",
+            type=str,
+            choices=[code for code, _ in TermResult.TERM_CHOICES],
+            help="Trimestre à reconstruire (par défaut tous).",
+        )
+
+    def handle(self, *args, **options):
+        classes = None
+        school = options.get("school")
+        if school:
+            schools = School.objects.filter(pk=int(school)) if school.isdigit() else School.objects.filter(name=school)
+            if not schools.exists():
+                raise CommandError(f"École introuvable: {school}")
+            classes = Class.objects.filter(school__in=schools)
+        terms = [options["term"]] if options.get("term") else None
+        written = rebuild_class_stats(classes, terms)
+        self.stdout.write(self.style.SUCCESS(f"Statistiques de classe reconstruites: {written} ligne(s)."))
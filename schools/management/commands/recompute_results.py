@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from schools.models import School, TermResult
+from schools.results import recompute_term_results
+
+
+class Command(BaseCommand):
+    help = "Recalcule moyennes, totaux pondérés et rangs d'un trimestre à partir des notes et coefficients."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--school", type=str, help="Nom ou id de l'école (par défaut toutes).")
+        parser.add_argument(
+            "--term",
+            type=str,
+            required=True,
+            choices=[code for code, _ in TermResult.TERM_CHOICES],
+            help="Trimestre à recalculer.",
+        )
+        parser.add_argument("--honor", action="store_true", help="Met aussi à jour l'inscription au tableau d'honneur.")
+        parser.add_argument(
+            "--honor-min-average",
+            type=float,
+            help="Moyenne minimale pour le tableau d'honneur (défaut HONOR_BOARD_MIN_AVERAGE).",
+        )
+        parser.add_argument(
+            "--honor-max-rank",
+            type=int,
+            help="Rang maximal dans la classe pour le tableau d'honneur (défaut HONOR_BOARD_MAX_RANK).",
+        )
+
+    def handle(self, *args, **options):
+        schools = School.objects.all()
+        school = options.get("school")
+        if school:
+            schools = schools.filter(pk=int(school)) if school.isdigit() else schools.filter(name=school)
+            if not schools.exists():
+                raise CommandError(f"École introuvable: {school}")
+        for item in schools.order_by("id"):
+            summary = recompute_term_results(
+                item.id,
+                options["term"],
+                honor=options["honor"],
+                honor_min_average=options.get("honor_min_average"),
+                honor_max_rank=options.get("honor_max_rank"),
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{item.name}: {summary['updated']} mis à jour, {summary['created']} créé(s), "
+                    f"{summary['skipped']} sans note ({summary['seconds']}s)."
+                )
+            )
@@ -0,0 +1,59 @@
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, Min
+import django.db.models.deletion
+
+
+def populate_stats(apps, schema_editor):
+    TermResult = apps.get_model("schools", "TermResult")
+    ClassTermStats = apps.get_model("schools", "ClassTermStats")
+    rows = (
+        TermResult.objects.order_by()
+        .values("student__klass_id", "term")
+        .annotate(best=Max("average"), avg=Avg("average"), low=Min("average"), total=Count("id"))
+    )
+    ClassTermStats.objects.bulk_create(
+        [
+            ClassTermStats(
+                klass_id=row["student__klass_id"],
+                term=row["term"],
+                best_average=row["best"],
+                average=float(row["avg"]) if row["avg"] is not None else None,
+                min_average=row["low"],
+                count=row["total"],
+            )
+            for row in rows
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schools", "0002_termresult_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClassTermStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("term", models.CharField(choices=[("T1", "T1"), ("T2", "T2"), ("T3", "T3")], max_length=2)),
+                ("best_average", models.DecimalField(decimal_places=2, max_digits=4, null=True)),
+                ("average", models.FloatField(null=True)),
+                ("min_average", models.DecimalField(decimal_places=2, max_digits=4, null=True)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "klass",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="term_stats", to="schools.class"
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("klass", "term"), name="classtermstats_klass_term_uniq")
+                ],
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -87,3 +87,23 @@ class FollowUp(models.Model):
 
     def __str__(self):
         return f"Suivi {self.student}"
+
+
+class ClassTermStats(models.Model):
+    """Per class/term aggregate of TermResult averages, kept up to date by schools.stats."""
+
+    klass = models.ForeignKey(Class, on_delete=models.CASCADE, related_name="term_stats")
+    term = models.CharField(max_length=2, choices=TermResult.TERM_CHOICES)
+    best_average = models.DecimalField(max_digits=4, decimal_places=2, null=True)
+    average = models.FloatField(null=True)
+    min_average = models.DecimalField(max_digits=4, decimal_places=2, null=True)
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.klass} - {self.term}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["klass", "term"], name="classtermstats_klass_term_uniq"),
+        ]
@@ -0,0 +1,192 @@
+import logging
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from schools.models import Grade, Student, TermResult
+from schools.signals import term_results_recomputed
+from schools.stats import refresh_class_stats
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+
+try:  # numpy accélère les agrégats sur de gros établissements ; repli en Python pur sinon
+    import numpy as np
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    np = None
+
+
+def _hundredths(value) -> int:
+    """Exact value in hundredths of a two-decimal figure (Grade.average, Subject.coefficient)."""
+    return int((Decimal(str(value)) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def _round_cents(weighted: int, coef_sum: int) -> int:
+    """weighted / coef_sum rounded half up, in integers (no float drift on x.xx5 averages)."""
+    return (2 * weighted + coef_sum) // (2 * coef_sum)
+
+
+def _aggregate_numpy(student_ids: list, class_ids: list, grades: list) -> tuple:
+    """
+    Returns (weighted totals in ten-thousandths, coefficient sums in hundredths, average cents, ranks) aligned
+    on student_ids. Everything is computed in integers from the two-decimal values, so rounding is exact.
+    """
+    ids = np.asarray(student_ids, dtype=np.int64)
+    order = np.argsort(ids)
+    n = len(ids)
+    if grades:
+        count = len(grades)
+        grade_students = np.fromiter((grade[0] for grade in grades), dtype=np.int64, count=count)
+        averages = np.fromiter((_hundredths(grade[1]) for grade in grades), dtype=np.int64, count=count)
+        coefficients = np.fromiter((_hundredths(grade[2]) for grade in grades), dtype=np.int64, count=count)
+        rows = order[np.searchsorted(ids, grade_students, sorter=order)]
+        # bincount somme en float64 : exact pour ces entiers (bien en deçà de 2**53)
+        weighted = np.rint(np.bincount(rows, weights=averages * coefficients, minlength=n)).astype(np.int64)
+        coef_sum = np.rint(np.bincount(rows, weights=coefficients, minlength=n)).astype(np.int64)
+    else:
+        weighted = np.zeros(n, dtype=np.int64)
+        coef_sum = np.zeros(n, dtype=np.int64)
+    graded = coef_sum > 0
+    # arrondi au centime (demi supérieur, comme Decimal.quantize ROUND_HALF_UP), en entiers
+    cents = np.full(n, -1, dtype=np.int64)
+    cents[graded] = (2 * weighted[graded] + coef_sum[graded]) // (2 * coef_sum[graded])
+
+    # Rang par classe, ex aequo au même rang (classement « 1, 2, 2, 4 ») ; élèves sans note exclus
+    classes = np.asarray(class_ids, dtype=np.int64)
+    ranks = np.zeros(n, dtype=np.int64)
+    candidates = np.flatnonzero(graded)
+    if len(candidates):
+        sorted_idx = candidates[np.lexsort((-cents[candidates], classes[candidates]))]
+        sorted_classes = classes[sorted_idx]
+        sorted_cents = cents[sorted_idx]
+        positions = np.arange(len(sorted_idx))
+        new_class = np.ones(len(sorted_idx), dtype=bool)
+        new_class[1:] = sorted_classes[1:] != sorted_classes[:-1]
+        new_value = new_class.copy()
+        new_value[1:] |= sorted_cents[1:] != sorted_cents[:-1]
+        class_start = np.maximum.accumulate(np.where(new_class, positions, 0))
+        value_start = np.maximum.accumulate(np.where(new_value, positions, 0))
+        ranks[sorted_idx] = value_start - class_start + 1
+    return weighted.tolist(), coef_sum.tolist(), cents.tolist(), ranks.tolist()
+
+
+def _aggregate_python(student_ids: list, class_ids: list, grades: list) -> tuple:
+    """Same contract as _aggregate_numpy, in plain Python (one pass over grades, one sort per school)."""
+    index = {student_id: row for row, student_id in enumerate(student_ids)}
+    n = len(student_ids)
+    weighted = [0] * n
+    coef_sum = [0] * n
+    for student_id, average, coefficient in grades:
+        row = index.get(student_id)
+        if row is None:
+            continue
+        coefficient = _hundredths(coefficient)
+        weighted[row] += _hundredths(average) * coefficient
+        coef_sum[row] += coefficient
+    cents = [_round_cents(weighted[row], coef_sum[row]) if coef_sum[row] > 0 else -1 for row in range(n)]
+
+    ranks = [0] * n
+    ordered = sorted((row for row in range(n) if cents[row] >= 0), key=lambda row: (class_ids[row], -cents[row]))
+    class_start = value_start = 0
+    for position, row in enumerate(ordered):
+        if position == 0 or class_ids[row] != class_ids[ordered[position - 1]]:
+            class_start = value_start = position
+        elif cents[row] != cents[ordered[position - 1]]:
+            value_start = position
+        ranks[row] = value_start - class_start + 1
+    return weighted, coef_sum, cents, ranks
+
+
+def recompute_term_results(
+    school_id: int,
+    term: str,
+    honor: bool = False,
+    honor_min_average: Optional[float] = None,
+    honor_max_rank: Optional[int] = None,
+    batch_size: int = 2000,
+) -> dict:
+    """
+    Recomputes TermResult.average, weighted_total and rank (per class, ties share the rank) of every graded
+    student of a school for `term`, from Grade.average and Subject.coefficient, in two reads and bulk writes.
+    With `honor`, honor_board is set from HONOR_BOARD_MIN_AVERAGE / HONOR_BOARD_MAX_RANK (or the arguments).
+    Grades carry no term: as fill_students_data, every grade of the student is used.
+    """
+    started = time.monotonic()
+    students = list(Student.objects.filter(klass__school_id=school_id).order_by("id").values_list("id", "klass_id"))
+    if not students:
+        return {"students": 0, "updated": 0, "created": 0, "skipped": 0, "changed": 0, "seconds": 0.0}
+    student_ids = [student_id for student_id, _ in students]
+    class_ids = [klass_id for _, klass_id in students]
+    grades = list(
+        Grade.objects.filter(student__klass__school_id=school_id).values_list(
+            "student_id", "average", "subject__coefficient"
+        )
+    )
+    aggregate = _aggregate_numpy if np is not None else _aggregate_python
+    weighted, coef_sum, cents, ranks = aggregate(student_ids, class_ids, grades)
+
+    if honor_min_average is None:
+        honor_min_average = float(getattr(settings, "HONOR_BOARD_MIN_AVERAGE", 14.0))
+    if honor_max_rank is None:
+        honor_max_rank = getattr(settings, "HONOR_BOARD_MAX_RANK", None)
+    min_cents = int(round(honor_min_average * 100))
+
+    existing = {
+        result.student_id: result
+        for result in TermResult.objects.filter(student_id__in=student_ids, term=term).only(
+            "id", "student_id", "term", "average", "weighted_total", "rank", "honor_board"
+        )
+    }
+    to_update, to_create = [], []
+    changed_students, moved_classes = set(), set()
+    skipped = 0
+    for row, student_id in enumerate(student_ids):
+        if cents[row] < 0:
+            skipped += 1  # aucune note : résultat laissé tel quel
+            continue
+        values = {
+            "average": Decimal(cents[row]) / 100,
+            "weighted_total": (Decimal(weighted[row]) / 10000).quantize(CENT, ROUND_HALF_UP),
+            "rank": ranks[row],
+        }
+        if honor:
+            values["honor_board"] = cents[row] >= min_cents and (not honor_max_rank or ranks[row] <= honor_max_rank)
+        result = existing.get(student_id)
+        if result is None:
+            to_create.append(TermResult(student_id=student_id, term=term, **values))
+            changed_students.add(student_id)
+            moved_classes.add(class_ids[row])
+            continue
+        if any(getattr(result, field) != value for field, value in values.items()):
+            changed_students.add(student_id)
+            if result.average != values["average"]:
+                moved_classes.add(class_ids[row])
+        for field, value in values.items():
+            setattr(result, field, value)
+        to_update.append(result)
+
+    fields = ["average", "weighted_total", "rank"] + (["honor_board"] if honor else [])
+    with transaction.atomic():
+        TermResult.objects.bulk_update(to_update, fields, batch_size=batch_size)
+        TermResult.objects.bulk_create(to_create, batch_size=batch_size)
+        # écritures en masse sans signaux : statistiques de classe rafraîchies d'un coup
+        refresh_class_stats({(klass_id, term) for klass_id in set(class_ids)})
+        # bulk_update n'émet pas post_save : les documents concernés sont signalés en une fois
+        term_results_recomputed.send(
+            sender=TermResult, term=term, student_ids=changed_students, class_ids=moved_classes
+        )
+
+    summary = {
+        "students": len(student_ids),
+        "updated": len(to_update),
+        "created": len(to_create),
+        "skipped": skipped,
+        "changed": len(changed_students),
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    logger.info("Term results recomputed", extra={"school_id": school_id, "term": term, **summary})
+    return summary
@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from schools.models import Student, TermResult
+from schools.stats import mark_dirty
+
+# Envoyé par results.recompute_term_results (écritures en masse, sans post_save) avec les élèves dont le
+# résultat a changé et les classes dont une moyenne a bougé : term, student_ids, class_ids
+term_results_recomputed = Signal()
+
+
+@receiver(post_save, sender=TermResult)
+@receiver(post_delete, sender=TermResult)
+def refresh_term_stats(sender, instance, **kwargs):
+    """Keeps ClassTermStats in sync with TermResult writes (deferred inside defer_class_stats())."""
+    # klass_id seul (pas de chargement de l'élève à chaque sauvegarde)
+    klass_id = Student.objects.filter(pk=instance.student_id).values_list("klass_id", flat=True).first()
+    if klass_id is None:
+        # élève supprimé en cascade : la classe (et ses stats) suivent ou seront reconstruites
+        return
+    mark_dirty(klass_id, instance.term)
+
+
+@receiver(pre_save, sender=Student)
+def remember_student_class(sender, instance, raw=False, **kwargs):
+    instance._previous_klass_id = None
+    if instance.pk and not raw:
+        instance._previous_klass_id = (
+            Student.objects.filter(pk=instance.pk).values_list("klass_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Student)
+def student_class_changed(sender, instance, raw=False, **kwargs):
+    """Refreshes the stats of the old and new class when a student changes class."""
+    previous = getattr(instance, "_previous_klass_id", None)
+    if raw or previous is None or previous == instance.klass_id:
+        return
+    terms = set(TermResult.objects.filter(student_id=instance.pk).values_list("term", flat=True))
+    for term in terms:
+        mark_dirty(previous, term)
+        mark_dirty(instance.klass_id, term)
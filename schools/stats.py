@@ -0,0 +1,101 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db.models import Avg, Count, Max, Min, Q
+
+from schools.models import ClassTermStats, TermResult
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+def refresh_class_stats(pairs) -> int:
+    """
+    Recomputes ClassTermStats for the given (class id, term) pairs with one aggregate query and one upsert.
+    Pairs without any TermResult left lose their row. Returns the number of rows written.
+    """
+    pairs = {(klass_id, term) for klass_id, term in pairs if klass_id and term}
+    if not pairs:
+        return 0
+    condition = Q()
+    for klass_id, term in pairs:
+        condition |= Q(student__klass_id=klass_id, term=term)
+    rows = (
+        TermResult.objects.filter(condition)
+        .order_by()
+        .values("student__klass_id", "term")
+        .annotate(best=Max("average"), avg=Avg("average"), low=Min("average"), total=Count("id"))
+    )
+    stats = [
+        ClassTermStats(
+            klass_id=row["student__klass_id"],
+            term=row["term"],
+            best_average=row["best"],
+            average=float(row["avg"]) if row["avg"] is not None else None,
+            min_average=row["low"],
+            count=row["total"],
+        )
+        for row in rows
+    ]
+    ClassTermStats.objects.bulk_create(
+        stats,
+        update_conflicts=True,
+        unique_fields=["klass", "term"],
+        update_fields=["best_average", "average", "min_average", "count", "updated_at"],
+    )
+    empty = pairs - {(item.klass_id, item.term) for item in stats}
+    if empty:
+        emptied = Q()
+        for klass_id, term in empty:
+            emptied |= Q(klass_id=klass_id, term=term)
+        ClassTermStats.objects.filter(emptied).delete()
+    return len(stats)
+
+
+def rebuild_class_stats(classes=None, terms=None) -> int:
+    """Rebuilds the stats of every class (or of `classes`, a Class queryset) for all terms or `terms`."""
+    results = TermResult.objects.all()
+    if classes is not None:
+        results = results.filter(student__klass__in=classes)
+    if terms:
+        results = results.filter(term__in=terms)
+    pairs = set(results.order_by().values_list("student__klass_id", "term").distinct())
+    stale = ClassTermStats.objects.all()
+    if classes is not None:
+        stale = stale.filter(klass__in=classes)
+    if terms:
+        stale = stale.filter(term__in=terms)
+    # lignes orphelines (résultats supprimés hors signaux, ex. QuerySet.delete en masse)
+    pairs |= set(stale.values_list("klass_id", "term"))
+    return refresh_class_stats(pairs)
+
+
+def mark_dirty(klass_id, term):
+    """Refreshes one class/term now, or at the end of the enclosing defer_class_stats() block."""
+    pending = getattr(_state, "pending", None)
+    if pending is not None:
+        pending.add((klass_id, term))
+        return
+    refresh_class_stats([(klass_id, term)])
+
+
+@contextmanager
+def defer_class_stats():
+    """
+    Collects the class/term pairs touched by TermResult writes inside the block and refreshes them
+    once on exit (seeding commands, imports) instead of after every row.
+    """
+    outer = getattr(_state, "pending", None)
+    if outer is not None:
+        # bloc imbriqué : le bloc extérieur rafraîchira
+        yield
+        return
+    _state.pending = set()
+    try:
+        yield
+    finally:
+        pending, _state.pending = _state.pending, None
+    refresh_class_stats(pending)
+    logger.info("Class stats refreshed", extra={"pairs": len(pending)})
@@ -8,8 +8,14 @@ Deux passes XeLaTeX (renderer configured via XELATEX_PASSES=2 en contexte).
 import json
 import re
 import subprocess
+import sys
+import tempfile
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from documents.services.templates import get_template  # noqa: E402
+
 
 def escape_tex(value: str) -> str:
     repl = {
@@ -32,7 +38,7 @@ def load_config(path: Path) -> dict:
         return json.load(f)
 
 
-def build_macros(entry: dict, defaults: dict) -> str:
+def macro_values(entry: dict, defaults: dict) -> dict:
     def to_float(val):
         try:
             return float(str(val).replace(",", "."))
@@ -91,7 +97,7 @@ def build_macros(entry: dict, defaults: dict) -> str:
         elif "3" in term_label:
             trim_code = "3"
 
-    macros = {
+    return {
         # noms des macros alignés sur le template
         "STUDENTNAME": entry["name"],
         "MATRICULE": entry.get("matricule", defaults.get("matricule", "")),
@@ -124,6 +130,9 @@ def build_macros(entry: dict, defaults: dict) -> str:
         "TRIMONEAVG": entry.get("t1_avg", defaults.get("t1_avg", "")),
         "TRIMTWOAVG": entry.get("t2_avg", defaults.get("t2_avg", "")),
     }
+
+
+def build_macros(macros: dict) -> str:
     parts = []
     raw_macros = {"SUBJECTROWS", "MAINROWS", "COMPROWS"}
     for k, v in macros.items():
@@ -136,24 +145,45 @@ def build_macros(entry: dict, defaults: dict) -> str:
     return "".join(parts)
 
 
+# Placeholders du template (<<CLÉ>>) -> macro correspondante : même valeur des deux côtés
+PLACEHOLDERS = {
+    "STUDENT_NAME": "STUDENTNAME",
+    "MATRICULE": "MATRICULE",
+    "CLASS_NAME": "CLASSNAME",
+    "CLASS_SIZE": "CLASSSIZE",
+    "ACADEMIC_YEAR": "ACADEMICYEAR",
+    "SCHOOL_NAME": "SCHOOLNAME",
+    "SCHOOL_CITY": "SCHOOLCITY",
+}
+
+
+def placeholder_context(macros: dict) -> dict:
+    """Values of the template placeholders, escaped like the macros."""
+    return {key: escape_tex(macros[macro]) for key, macro in PLACEHOLDERS.items() if macro in macros}
+
+
 def safe_jobname(base: str) -> str:
     return re.sub(r"[^A-Za-z0-9_]+", "_", base)
 
 
-def render_one(template: Path, out_dir: Path, jobname: str, macro_block: str):
+def render_one(template: Path, out_dir: Path, jobname: str, macro_block: str, context: dict):
     out_dir.mkdir(parents=True, exist_ok=True)
-    tex_input = macro_block + f"\\input{{{template.as_posix()}}}"
-    cmd = [
-        "xelatex",
-        "-interaction=nonstopmode",
-        "-halt-on-error",
-        f"-jobname={jobname}",
-        f"-output-directory={out_dir.as_posix()}",
-        tex_input,
-    ]
-    # deux passes pour stabiliser (et en plus XELATEX_PASSES=2 côté renderer)
-    subprocess.run(cmd, check=True)
-    subprocess.run(cmd, check=True)
+    with tempfile.TemporaryDirectory(prefix="render_batch_") as tmp:
+        # Template du registre (lu une fois pour tout le lot) rendu avec les valeurs de l'élève ;
+        # macros en tête (avant le préambule, comme un \input). Le .tex temporaire ne reste pas dans out_dir.
+        tex_path = Path(tmp) / f"{jobname}.tex"
+        tex_path.write_text(macro_block + "\n" + get_template(template).render(context), encoding="utf-8")
+        cmd = [
+            "xelatex",
+            "-interaction=nonstopmode",
+            "-halt-on-error",
+            f"-jobname={jobname}",
+            f"-output-directory={out_dir.as_posix()}",
+            tex_path.as_posix(),
+        ]
+        # deux passes pour stabiliser (et en plus XELATEX_PASSES=2 côté renderer)
+        subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True)
 
 
 def main():
@@ -165,10 +195,10 @@ def main():
     prefix = cfg.get("job_prefix", "bulletin_")
 
     for idx, student in enumerate(students, start=1):
-        macro_block = build_macros(student, defaults)
+        macros = macro_values(student, defaults)
         base = f"{prefix}{student.get('matricule', student.get('avg', idx))}_{idx}"
         jobname = safe_jobname(base)
-        render_one(template, out_dir, jobname, macro_block)
+        render_one(template, out_dir, jobname, build_macros(macros), placeholder_context(macros))
 
 
 if __name__ == "__main__":
@@ -7,8 +7,14 @@ sans modifier le template LaTeX.
 import json
 import re
 import subprocess
+import sys
+import tempfile
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from documents.services.templates import get_template  # noqa: E402
+
 
 def escape_tex(value: str) -> str:
     """Échappe les caractères LaTeX courants."""
@@ -35,8 +41,8 @@ def load_config(path: Path) -> dict:
         return json.load(f)
 
 
-def build_macros(entry: dict, defaults: dict) -> str:
-    macros = {
+def macro_values(entry: dict, defaults: dict) -> dict:
+    return {
         "AVGOVERRIDE": entry["avg"],
         "STUDENTNAME": entry["name"],
         "CLASSLEVEL": entry.get("class_level", defaults.get("class_level", "Classe")),
@@ -47,28 +53,54 @@ def build_macros(entry: dict, defaults: dict) -> str:
         "SCHOOLNAME": defaults.get("school_name", "Établissement"),
         "SCHOOLCITY": defaults.get("school_city", "Ville"),
     }
+
+
+def build_macros(macros: dict) -> str:
     parts = [f"\\def\\{k}{{{escape_tex(v)}}}" for k, v in macros.items()]
     return "".join(parts)
 
 
+# Placeholders du template (<<CLÉ>>) -> macro correspondante : même valeur des deux côtés
+PLACEHOLDERS = {
+    "STUDENT_NAME": "STUDENTNAME",
+    "AVG": "AVGOVERRIDE",
+    "RANK": "RANKVAL",
+    "CLASS_LEVEL": "CLASSLEVEL",
+    "CLASS_SIZE": "CLASSSIZEVAL",
+    "TERM": "TERMVAL",
+    "ACADEMIC_YEAR": "ACADEMICYEARVAL",
+    "SCHOOL_NAME": "SCHOOLNAME",
+    "SCHOOL_CITY": "SCHOOLCITY",
+}
+
+
+def placeholder_context(macros: dict) -> dict:
+    """Values of the template placeholders, escaped like the macros."""
+    return {key: escape_tex(macros[macro]) for key, macro in PLACEHOLDERS.items() if macro in macros}
+
+
 def safe_jobname(base: str) -> str:
     return re.sub(r"[^A-Za-z0-9_]+", "_", base)
 
 
-def render_one(template: Path, out_dir: Path, jobname: str, macro_block: str):
+def render_one(template: Path, out_dir: Path, jobname: str, macro_block: str, context: dict):
     out_dir.mkdir(parents=True, exist_ok=True)
-    tex_input = macro_block + f"\\input{{{template.as_posix()}}}"
-    cmd = [
-        "xelatex",
-        "-interaction=nonstopmode",
-        "-halt-on-error",
-        f"-jobname={jobname}",
-        f"-output-directory={out_dir.as_posix()}",
-        tex_input,
-    ]
-    # Deux passes pour stabiliser les références (supprime le warning "Label(s) may have changed")
-    subprocess.run(cmd, check=True)
-    subprocess.run(cmd, check=True)
+    with tempfile.TemporaryDirectory(prefix="render_batch_") as tmp:
+        # Template du registre (lu une fois pour tout le lot) rendu avec les valeurs de l'élève ;
+        # macros en tête (avant le préambule, comme un \input). Le .tex temporaire ne reste pas dans out_dir.
+        tex_path = Path(tmp) / f"{jobname}.tex"
+        tex_path.write_text(macro_block + "\n" + get_template(template).render(context), encoding="utf-8")
+        cmd = [
+            "xelatex",
+            "-interaction=nonstopmode",
+            "-halt-on-error",
+            f"-jobname={jobname}",
+            f"-output-directory={out_dir.as_posix()}",
+            tex_path.as_posix(),
+        ]
+        # Deux passes pour stabiliser les références (supprime le warning "Label(s) may have changed")
+        subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True)
 
 
 def main():
@@ -80,10 +112,10 @@ def main():
     prefix = cfg.get("job_prefix", "honor_")
 
     for idx, student in enumerate(students, start=1):
-        macro_block = build_macros(student, defaults)
+        macros = macro_values(student, defaults)
         base = f"{prefix}{student.get('avg', idx)}_{idx}"
         jobname = safe_jobname(base)
-        render_one(template, out_dir, jobname, macro_block)
+        render_one(template, out_dir, jobname, build_macros(macros), placeholder_context(macros))
 
 
 if __name__ == "__main__":